@@ -0,0 +1,433 @@
+"""
+Rebalancing backtest with transaction costs and carry.
+
+calculate_risk_metrics holds every book at its target weights each day for
+free. Here holdings drift with prices between rebalances. Each rebalance
+trades back to target and pays `cost_bps` per unit traded, and financing
+accrues daily on the drifted book:
+
+  margin   on the net debit (longs above equity), at the risk-free curve plus
+           the MARGIN_RATE spread, the same time-varying rate as risk.py
+  borrow   on the short market value, at BORROW_FEE or a position's own
+           'borrow_fee'
+
+Carry accrues daily and is settled into cash at the next rebalance. A
+position can set its own 'cost_bps' in the portfolio config. Books start
+fully invested at target at the first close; the final close never trades.
+
+Schedules:
+  daily, weekly, monthly, quarterly   trade at the last close of each period
+  never                               buy and hold
+  threshold:<band>                    trade when any weight drifts more than
+                                      <band> (e.g. 0.05) from its target
+
+Each holding period is computed in one pass over its returns matrix; only
+the rebalances are iterated (threshold rebalances depend on the path), and
+the daily schedule has a closed form. Sweeps over portfolios x schedules run
+in parallel worker processes, with the panel sent to each worker once.
+
+A daily schedule at zero cost reproduces calculate_risk_metrics' Net_Stream.
+
+Usage: python backtest.py [PORTFOLIO_DIR] [--schedules daily,monthly,threshold:0.05]
+                          [--cost-bps 5] [--out DIR] [--base USD] [--workers N]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import batch
+import diagnostics
+import rates
+import risk
+import telemetry
+
+log = diagnostics.get_logger('backtest')
+
+COST_BPS = 5.0
+DEFAULT_SCHEDULES = ('daily', 'weekly', 'monthly', 'quarterly', 'threshold:0.05', 'never')
+CALENDAR_PERIODS = {'weekly': 'W', 'monthly': 'M', 'quarterly': 'Q'}
+ANNUAL_FACTOR = 252
+DAY_COUNT = 360  # Money-market day count of the margin and borrow rates, as in risk.py
+# Threshold schedules look ahead this many days at a time for the next breach
+THRESHOLD_WINDOW = 63
+
+# Market shared by the tasks of one worker process (set once by _init_worker)
+_market = {}
+
+
+# ==========================================
+# Inputs
+# ==========================================
+def parse_schedule(schedule):
+    """('calendar', 'daily' | pandas period | None) or ('threshold', band). Raises ValueError."""
+    name, _, arg = schedule.partition(':')
+    if name == 'daily' and not arg:
+        return 'calendar', 'daily'
+    if name in CALENDAR_PERIODS and not arg:
+        return 'calendar', CALENDAR_PERIODS[name]
+    if name == 'never' and not arg:
+        return 'calendar', None
+    if name == 'threshold':
+        try:
+            band = float(arg)
+        except ValueError:
+            band = 0
+        if band > 0:
+            return 'threshold', band
+        raise ValueError(f"Threshold schedule needs a positive band: threshold:<band>, got '{schedule}'")
+    raise ValueError(f"Unknown schedule '{schedule}'. Use daily, weekly, monthly, quarterly, never or threshold:<band>")
+
+
+def prepare_market(prices, base=risk.BASE_CURRENCY):
+    """
+    Returns, price availability and financing rates on the panel's return
+    dates, built like calculate_risk_metrics builds them. Shared by every
+    book and schedule run on `prices` (already in `base`).
+    """
+    returns_df = prices.pct_change().dropna(how='all')
+    rf_daily = rates.align_rates(returns_df.index, base)
+    return {
+        'dates': returns_df.index,
+        'tickers': list(returns_df.columns),
+        # Missing returns (not yet listed, gaps) are flat: the weight is held as cash
+        'returns': returns_df.fillna(0.0).to_numpy(dtype=float),
+        # Only positions with a price on the day can be traded (and cost anything)
+        'tradable': prices.reindex(returns_df.index).notna().to_numpy(),
+        'margin_rate': (rf_daily + (risk.MARGIN_RATE - rates.get_rate(base))).to_numpy(dtype=float),
+        'rf_hist': float(rf_daily.mean()),
+    }
+
+
+def _book(market, portfolio, cost_bps):
+    """Column positions, signed target weights, cost and borrow rates of the book's tickers in the panel."""
+    held = [t for t in portfolio if t in market['tickers']]
+    columns = [market['tickers'].index(t) for t in held]
+    weights = np.array([portfolio[t]['weight'] * (1 if portfolio[t]['type'] == 'Long' else -1) for t in held])
+    cost = np.array([portfolio[t].get('cost_bps', cost_bps) for t in held], dtype=float) / 10_000
+    borrow = np.array([portfolio[t].get('borrow_fee', risk.BORROW_FEE) for t in held], dtype=float)
+    return held, np.array(columns, dtype=int), weights, cost, borrow
+
+
+def rebalance_mask(dates, period):
+    """True at the last date of each period (every date for 'daily', none for None); never the final date."""
+    if period is None:
+        mask = np.zeros(len(dates), dtype=bool)
+    elif period == 'daily':
+        mask = np.ones(len(dates), dtype=bool)
+    else:
+        periods = dates.to_period(period)
+        mask = np.append(periods[1:] != periods[:-1], True)
+    if len(mask):
+        mask[-1] = False
+    return mask
+
+
+# ==========================================
+# Engine
+# ==========================================
+def _daily(returns, tradable, weights, cost, borrow, margin_rate):
+    """Closed form of a daily rebalance: every day starts at target, so nothing drifts past one day."""
+    net_debit = max(0.0, weights[weights > 0].sum() - 1.0)
+    carry = (net_debit * margin_rate + np.abs(weights[weights < 0]) @ borrow[weights < 0]) / DAY_COUNT
+    pre_trade = returns @ weights - carry
+    # Each close trades back from the drifted weights w(1+r)/(1+R) to w
+    drifted = weights * (1 + returns) / (1 + pre_trade)[:, None]
+    traded = np.abs(weights - drifted) * tradable
+    traded[-1] = 0.0
+    cost_share = traded @ cost
+    equity = np.cumprod((1 + pre_trade) * (1 - cost_share))
+    previous = np.concatenate([[1.0], equity[:-1]])
+    rebalanced = np.ones(len(returns), dtype=bool)
+    rebalanced[-1] = False
+    return {
+        'equity': equity,
+        'cost': previous * (1 + pre_trade) * cost_share,
+        'carry': previous * carry,
+        'turnover': traded.sum(axis=1),
+        'rebalanced': rebalanced,
+        'long': np.clip(drifted, 0, None).sum(axis=1),
+        'short': np.clip(-drifted, 0, None).sum(axis=1),
+    }
+
+
+def _hold(returns, holdings, marked, accrued, borrow, margin_rate):
+    """
+    Drift `holdings` through `returns` (one row per day) without trading.
+    Carry accrues on the previous close's marks. Per day: the marked
+    holdings, marked equity, equity net of accrued carry, carry and accrual.
+    """
+    marks = holdings * np.cumprod(1 + returns, axis=0)
+    marked_equity = marked + (marks - holdings).sum(axis=1)
+    previous = np.vstack([holdings[None, :], marks[:-1]])
+    previous_equity = np.concatenate([[marked], marked_equity[:-1]])
+    net_debit = np.maximum(0.0, np.clip(previous, 0, None).sum(axis=1) - previous_equity)
+    carry = (net_debit * margin_rate + np.clip(-previous, 0, None) @ borrow) / DAY_COUNT
+    accrual = accrued + np.cumsum(carry)
+    return marks, marked_equity, marked_equity - accrual, carry, accrual
+
+
+def _drifting(returns, tradable, weights, cost, borrow, margin_rate, mask=None, band=None):
+    """
+    Holding periods between rebalances, each computed in one step. `mask`
+    marks calendar rebalance days; with `band`, a rebalance happens at the
+    first close where a weight is more than `band` away from its target.
+    """
+    n_days = len(returns)
+    out = {key: np.zeros(n_days) for key in ('equity', 'cost', 'carry', 'turnover', 'long', 'short')}
+    out['rebalanced'] = np.zeros(n_days, dtype=bool)
+    rebalance_days = np.flatnonzero(mask) if mask is not None else None
+
+    equity = 1.0
+    holdings = weights * equity
+    marked, accrued = equity, 0.0
+    start = 0
+    while start < n_days:
+        if band is None:
+            upcoming = rebalance_days[rebalance_days >= start]
+            end = upcoming[0] + 1 if len(upcoming) else n_days
+        else:
+            end = min(start + THRESHOLD_WINDOW, n_days)
+        marks, marked_equity, equity_net, carry, accrual = _hold(
+            returns[start:end], holdings, marked, accrued, borrow, margin_rate[start:end]
+        )
+        trade = band is None and len(upcoming) > 0
+        if band is not None:
+            drift = np.abs(marks / equity_net[:, None] - weights).max(axis=1, initial=0.0)
+            breaches = np.flatnonzero(drift[:n_days - 1 - start] > band)
+            if len(breaches):
+                end = start + breaches[0] + 1
+                marks, marked_equity, equity_net = marks[:end - start], marked_equity[:end - start], equity_net[:end - start]
+                carry, accrual = carry[:end - start], accrual[:end - start]
+            trade = len(breaches) > 0
+
+        days = slice(start, end)
+        out['equity'][days] = equity_net
+        out['carry'][days] = carry
+        out['long'][days] = np.clip(marks, 0, None).sum(axis=1) / equity_net
+        out['short'][days] = np.clip(-marks, 0, None).sum(axis=1) / equity_net
+
+        if trade:
+            # Accrued carry is settled, then the book is traded back to target at this close
+            day = end - 1
+            equity = equity_net[-1]
+            trades = np.abs(weights * equity - marks[-1]) * tradable[day]
+            paid = trades @ cost
+            equity -= paid
+            holdings = weights * equity
+            marked, accrued = equity, 0.0
+            out['equity'][day] = equity
+            out['cost'][day] = paid
+            out['turnover'][day] = trades.sum() / equity_net[-1]
+            out['rebalanced'][day] = True
+        else:
+            holdings, marked, accrued = marks[-1], marked_equity[-1], accrual[-1]
+        start = end
+    return out
+
+
+def run_backtest(market, portfolio=None, schedule='daily', cost_bps=COST_BPS):
+    """
+    Backtest one book under one schedule on a prepare_market() panel.
+    Returns {'Series': DataFrame per day, 'Stats': summary} (Stats None without data).
+    """
+    portfolio = portfolio or risk.PORTFOLIO_CONFIG
+    kind, arg = parse_schedule(schedule)
+    held, columns, weights, cost, borrow = _book(market, portfolio, cost_bps)
+    returns = market['returns'][:, columns]
+    tradable = market['tradable'][:, columns]
+    if len(returns) < 2:
+        return {'Series': pd.DataFrame(), 'Stats': None}
+
+    with telemetry.stage('backtest'):
+        if kind == 'calendar' and arg == 'daily':
+            out = _daily(returns, tradable, weights, cost, borrow, market['margin_rate'])
+        elif kind == 'calendar':
+            out = _drifting(returns, tradable, weights, cost, borrow, market['margin_rate'],
+                            mask=rebalance_mask(market['dates'], arg))
+        else:
+            out = _drifting(returns, tradable, weights, cost, borrow, market['margin_rate'], band=arg)
+
+    ruined = np.flatnonzero(out['equity'] <= 0)
+    if len(ruined):
+        # Equity is gone: the book is closed out at that close and stays flat
+        for key in out:
+            out[key][ruined[0]:] = 0
+    equity = out['equity']
+    previous = np.concatenate([[1.0], equity[:-1]])
+    alive = previous > 0
+    series = pd.DataFrame({
+        'date': market['dates'],
+        'equity': equity,
+        'return': np.divide(equity, previous, out=np.ones_like(equity), where=alive) - 1,
+        'cost': np.divide(out['cost'], previous, out=np.zeros_like(equity), where=alive),
+        'carry': np.divide(out['carry'], previous, out=np.zeros_like(equity), where=alive),
+        'turnover': out['turnover'],
+        'longExp': out['long'],
+        'shortExp': out['short'],
+        'rebalanced': out['rebalanced'],
+    })
+    stats = backtest_stats(series, market['rf_hist'])
+    stats['Wiped_Out'] = market['dates'][ruined[0]].strftime('%Y-%m-%d') if len(ruined) else None
+    return {'Series': series, 'Stats': stats}
+
+
+def backtest_stats(series, rf_hist):
+    """Headline figures of a backtest, annualized like calculate_risk_metrics."""
+    daily = series['return'].to_numpy()
+    annual_ret = daily.mean() * ANNUAL_FACTOR
+    annual_vol = daily.std() * np.sqrt(ANNUAL_FACTOR)
+    growth = np.cumprod(1 + daily)
+    years = len(daily) / ANNUAL_FACTOR
+    return {
+        'Total_Return': float(series['equity'].iloc[-1] - 1),
+        'Annual_Return': annual_ret,
+        'Annual_Vol': annual_vol,
+        'Sharpe': (annual_ret - rf_hist) / annual_vol if annual_vol > 0 else 0,
+        'Max_Drawdown': float((growth / np.maximum.accumulate(growth) - 1).min()),
+        'Annual_Cost': series['cost'].mean() * ANNUAL_FACTOR,
+        'Annual_Carry': series['carry'].mean() * ANNUAL_FACTOR,
+        'Annual_Turnover': series['turnover'].sum() / years,
+        'Rebalances': int(series['rebalanced'].sum()),
+    }
+
+
+# ==========================================
+# Sweeps
+# ==========================================
+def summary_row(name, schedule, stats):
+    """Backtest figures of one run as a flat row (camelCase keys, as in the API)."""
+    row = {'portfolio': name, 'schedule': schedule}
+    if stats is None:
+        return row
+    row.update({
+        'totalReturn': stats['Total_Return'],
+        'annualReturn': stats['Annual_Return'],
+        'annualVol': stats['Annual_Vol'],
+        'sharpe': stats['Sharpe'],
+        'maxDrawdown': stats['Max_Drawdown'],
+        'annualCost': stats['Annual_Cost'],
+        'annualCarry': stats['Annual_Carry'],
+        'annualTurnover': stats['Annual_Turnover'],
+        'rebalances': stats['Rebalances'],
+        'wipedOut': stats['Wiped_Out'],
+    })
+    return row
+
+
+def evaluate(name, config, schedule, market, cost_bps=COST_BPS):
+    """(summary row, series frame or None) of one portfolio and schedule."""
+    start = time.perf_counter()
+    try:
+        result = run_backtest(market, config, schedule, cost_bps)
+    except Exception as e:
+        log.exception("Backtest of %s (%s) failed", name, schedule)
+        return {**summary_row(name, schedule, None), 'error': str(e)}, None
+
+    row = summary_row(name, schedule, result['Stats'])
+    row['seconds'] = time.perf_counter() - start
+    if result['Stats'] is None:
+        row['error'] = "Insufficient data to backtest this portfolio"
+        return row, None
+    series = result['Series']
+    series.insert(0, 'schedule', schedule)
+    series.insert(0, 'portfolio', name)
+    return row, series
+
+
+def _init_worker(market, cost_bps):
+    diagnostics.setup_logging()
+    _market.update(market=market, cost_bps=cost_bps)
+
+
+def _evaluate_in_worker(name, config, schedule):
+    return evaluate(name, config, schedule, _market['market'], _market['cost_bps'])
+
+
+def run_sweep(portfolios, schedules, market, cost_bps=COST_BPS, workers=None):
+    """
+    Backtest every portfolio under every schedule, spread over `workers`
+    processes (default: one per core). Returns (summary, series).
+    """
+    for schedule in schedules:
+        parse_schedule(schedule)
+    tasks = [(name, config, schedule) for name, config in portfolios.items() for schedule in schedules]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+    if workers == 1:
+        results = [evaluate(name, config, schedule, market, cost_bps) for name, config, schedule in tasks]
+    else:
+        # Same pool setup as batch.run_batch: the market goes to each worker once
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=(market, cost_bps)) as pool:
+            results = list(pool.map(_evaluate_in_worker, *zip(*tasks)))
+
+    summary = pd.DataFrame([row for row, _ in results])
+    frames = [series for _, series in results if series is not None]
+    series = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    return summary, series
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("portfolio_dir", nargs="?", help="directory of portfolio .json / .yaml files (default: the house book)")
+    parser.add_argument("--schedules", default=",".join(DEFAULT_SCHEDULES),
+                        help=f"comma-separated schedules (default: {','.join(DEFAULT_SCHEDULES)})")
+    parser.add_argument("--cost-bps", type=float, default=COST_BPS,
+                        help=f"cost per unit traded in basis points (default: {COST_BPS:g})")
+    parser.add_argument("--out", help="write summary and series tables to this directory")
+    parser.add_argument("--base", default=risk.BASE_CURRENCY, type=str.upper, choices=risk.REPORTING_CURRENCIES)
+    parser.add_argument("--format", default=batch.DEFAULT_FORMAT, choices=batch.OUTPUT_FORMATS,
+                        help=f"output table format (default: {batch.DEFAULT_FORMAT})")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--skip-rates-refresh", action="store_true",
+                        help="use the cached risk-free curve instead of downloading it first")
+    args = parser.parse_args()
+    diagnostics.setup_logging()
+
+    schedules = [s.strip() for s in args.schedules.split(",") if s.strip()]
+    try:
+        for schedule in schedules:
+            parse_schedule(schedule)
+    except ValueError as e:
+        sys.exit(str(e))
+    if args.portfolio_dir:
+        portfolios, errors = batch.load_portfolios(args.portfolio_dir)
+        for name, error in errors.items():
+            log.error("Skipping portfolio %s", error, extra={'portfolio': name})
+        if not portfolios:
+            sys.exit(f"No valid portfolio files in {args.portfolio_dir}")
+    else:
+        portfolios = {'house': risk.PORTFOLIO_CONFIG}
+    try:
+        union = batch.union_portfolio(portfolios)
+    except ValueError as e:
+        sys.exit(str(e))
+
+    start = time.perf_counter()
+    if not args.skip_rates_refresh:
+        rates.refresh_rates()
+    raw_prices, fx_rates, _ = risk.fetch_data(union)
+    usd_prices = risk.normalize_to_base_currency(raw_prices, fx_rates, union)
+    if usd_prices.empty:
+        sys.exit("Market data download returned no prices")
+    market = prepare_market(risk.rebase_to_currency(usd_prices, fx_rates, args.base), args.base)
+    fetched = time.perf_counter()
+
+    summary, series = run_sweep(portfolios, schedules, market, args.cost_bps, args.workers)
+    print(f"{len(summary)} backtests: fetch {fetched - start:.1f}s, run {time.perf_counter() - fetched:.2f}s\n")
+    columns = [c for c in ('portfolio', 'schedule', 'annualReturn', 'annualVol', 'sharpe', 'maxDrawdown',
+                           'annualCost', 'annualCarry', 'annualTurnover', 'rebalances', 'wipedOut', 'error')
+               if c in summary]
+    print(summary[columns].to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    if args.out:
+        for path in batch.write_tables({'summary': summary, 'series': series}, args.out, args.format):
+            print(f"  {path}")
+
+
+if __name__ == "__main__":
+    main()
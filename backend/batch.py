@@ -0,0 +1,252 @@
+"""
+Batch risk run over a directory of portfolio files.
+
+Every *.json / *.yaml / *.yml file in the directory holds one portfolio in the
+PORTFOLIO_CONFIG schema ({ticker: {'weight', 'type', 'currency'}}); the file
+name is the portfolio name. The union of all tickers is fetched once, every
+portfolio is evaluated on that panel in parallel worker processes, and three
+tables are written to the output directory:
+
+  vitals       one row per portfolio (headline metrics, leverage, errors)
+  attribution  one row per portfolio and ticker (weight, % of risk, MCTR)
+  series       one row per portfolio and day (gross/net/benchmark return, drawdown)
+
+Usage: python batch.py PORTFOLIO_DIR [--out DIR] [--base USD] [--format parquet|csv] [--workers N]
+"""
+import argparse
+import importlib.util
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+try:
+    import yaml
+except ImportError:  # YAML portfolios need PyYAML; JSON ones don't
+    yaml = None
+
+import diagnostics
+import rates
+import risk
+import telemetry
+
+log = diagnostics.get_logger('batch')
+
+PORTFOLIO_EXTENSIONS = ('.json', '.yaml', '.yml')
+OUTPUT_FORMATS = ('parquet', 'csv')
+DEFAULT_FORMAT = 'parquet' if importlib.util.find_spec('pyarrow') else 'csv'
+
+# Panel shared by the tasks of one worker process (set once by _init_worker)
+_panel = {}
+
+
+# ==========================================
+# Portfolio files
+# ==========================================
+def load_portfolio(path):
+    with open(path) as f:
+        if path.lower().endswith('.json'):
+            config = json.load(f)
+        elif yaml is None:
+            raise ValueError("PyYAML is not installed; use JSON or `pip install pyyaml`")
+        else:
+            config = yaml.safe_load(f)
+    return risk.validate_portfolio_config(config)
+
+
+def load_portfolios(directory):
+    """
+    ({name: config}, {name: error}) for the portfolio files in `directory`.
+    Invalid files are reported in the second mapping instead of stopping the run.
+    """
+    portfolios, errors = {}, {}
+    for filename in sorted(os.listdir(directory)):
+        name, ext = os.path.splitext(filename)
+        if ext.lower() not in PORTFOLIO_EXTENSIONS:
+            continue
+        try:
+            portfolios[name] = load_portfolio(os.path.join(directory, filename))
+        except Exception as e:
+            errors[name] = f"{filename}: {e}"
+    return portfolios, errors
+
+
+def union_portfolio(portfolios):
+    """
+    One config holding every ticker of `portfolios`, for fetching and currency
+    normalization. Raises ValueError if books disagree on a ticker's currency.
+    """
+    union = {}
+    for name, config in portfolios.items():
+        for ticker, info in config.items():
+            known = union.setdefault(ticker, info)
+            if known['currency'] != info['currency']:
+                raise ValueError(
+                    f"{ticker} is quoted in {known['currency']} in one portfolio and {info['currency']} in '{name}'"
+                )
+    return union
+
+
+# ==========================================
+# Evaluation
+# ==========================================
+def vitals_row(name, metrics):
+    """Headline metrics of one portfolio as a flat row (camelCase keys, as in the API)."""
+    row = {'portfolio': name}
+    if metrics is None:
+        return row
+    lev = metrics['Leverage_Stats']
+    row.update({
+        'annualReturn': metrics['Annual_Return'],
+        'annualVol': metrics['Annual_Vol'],
+        'sharpe': metrics['Sharpe'],
+        'sortino': metrics['Sortino'],
+        'beta': metrics['Beta'],
+        'maxDrawdown': metrics['Max_Drawdown'],
+        'cvar95': metrics['CVaR_95'],
+        'ytdReturn': metrics['YTD_Return'],
+        'grossExp': lev['Gross_Exp'],
+        'netExp': lev['Net_Exp'],
+    })
+    return row
+
+
+def _attribution_rows(name, metrics):
+    return [
+        {'portfolio': name, 'ticker': ticker, 'weight': stats['Weight'],
+         'pctRisk': stats['Pct_Risk'], 'mctr': stats['MCTR']}
+        for ticker, stats in metrics['Risk_Attribution'].items()
+    ]
+
+
+def _series_frame(name, metrics):
+    frame = pd.DataFrame({
+        'return': metrics['Returns_Stream'],
+        'netReturn': metrics['Net_Stream'],
+        'benchmarkReturn': metrics['Benchmark_Stream'],
+        'drawdown': metrics['Drawdown_Stream'],
+    })
+    frame.index.name = 'date'
+    frame = frame.reset_index()
+    frame.insert(0, 'portfolio', name)
+    return frame
+
+
+def evaluate(name, config, prices, fx_rates, base=risk.BASE_CURRENCY):
+    """(vitals row, attribution rows, series frame or None) of one portfolio on a shared panel."""
+    start = time.perf_counter()
+    try:
+        metrics = risk.calculate_risk_metrics(prices, None, fx_rates, base_currency=base, portfolio=config)
+    except Exception as e:
+        log.exception("Portfolio %s failed", name)
+        return {**vitals_row(name, None), 'error': str(e)}, [], None
+
+    row = vitals_row(name, metrics)
+    row['seconds'] = time.perf_counter() - start
+    if metrics is None:
+        row['error'] = "Insufficient data to calculate metrics for this portfolio"
+        return row, [], None
+    return row, _attribution_rows(name, metrics), _series_frame(name, metrics)
+
+
+def _init_worker(prices, fx_rates, base):
+    diagnostics.setup_logging()
+    _panel.update(prices=prices, fx_rates=fx_rates, base=base)
+
+
+def _evaluate_in_worker(name, config):
+    return evaluate(name, config, _panel['prices'], _panel['fx_rates'], _panel['base'])
+
+
+def run_batch(portfolios, prices, fx_rates, base=risk.BASE_CURRENCY, workers=None):
+    """
+    Evaluate every portfolio on one price panel (already in `base`), spread over
+    `workers` processes (default: one per core). Returns (vitals, attribution, series).
+    """
+    workers = max(1, min(workers or os.cpu_count() or 1, len(portfolios)))
+    if workers == 1:
+        results = [evaluate(name, config, prices, fx_rates, base) for name, config in portfolios.items()]
+    else:
+        # The panel goes to each worker once (initializer), not once per portfolio. spawn
+        # rather than fork, so each worker starts its own logging listener thread
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=(prices, fx_rates, base)) as pool:
+            results = list(pool.map(_evaluate_in_worker, portfolios.keys(), portfolios.values()))
+
+    vitals = pd.DataFrame([row for row, _, _ in results])
+    attribution = pd.DataFrame([r for _, rows, _ in results for r in rows],
+                               columns=['portfolio', 'ticker', 'weight', 'pctRisk', 'mctr'])
+    frames = [series for _, _, series in results if series is not None]
+    series = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    return vitals, attribution, series
+
+
+def write_tables(tables, out_dir, fmt=DEFAULT_FORMAT):
+    """Write {name: DataFrame} as <out_dir>/<name>.parquet|csv. Returns the paths written."""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for name, frame in tables.items():
+        path = os.path.join(out_dir, f"{name}.{fmt}")
+        if fmt == 'parquet':
+            frame.to_parquet(path, index=False)
+        else:
+            frame.to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("portfolio_dir", help="directory of portfolio .json / .yaml files")
+    parser.add_argument("--out", default="batch_results", help="output directory (default: batch_results)")
+    parser.add_argument("--base", default=risk.BASE_CURRENCY, type=str.upper, choices=risk.REPORTING_CURRENCIES)
+    parser.add_argument("--format", default=DEFAULT_FORMAT, choices=OUTPUT_FORMATS,
+                        help=f"output table format (default: {DEFAULT_FORMAT})")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--skip-rates-refresh", action="store_true",
+                        help="use the cached risk-free curve instead of downloading it first")
+    args = parser.parse_args()
+    diagnostics.setup_logging()
+
+    portfolios, errors = load_portfolios(args.portfolio_dir)
+    for name, error in errors.items():
+        log.error("Skipping portfolio %s", error, extra={'portfolio': name})
+    if not portfolios:
+        sys.exit(f"No valid portfolio files in {args.portfolio_dir}")
+    try:
+        union = union_portfolio(portfolios)
+    except ValueError as e:
+        sys.exit(str(e))
+
+    start = time.perf_counter()
+    if not args.skip_rates_refresh:
+        # Workers read the curve from the on-disk cache this writes
+        rates.refresh_rates()
+    log.info("Fetching %d tickers for %d portfolios", len(union), len(portfolios))
+    raw_prices, fx_rates, _ = risk.fetch_data(union)
+    usd_prices = risk.normalize_to_base_currency(raw_prices, fx_rates, union)
+    if usd_prices.empty:
+        sys.exit("Market data download returned no prices")
+    prices = risk.rebase_to_currency(usd_prices, fx_rates, args.base)
+    fetched = time.perf_counter()
+
+    with telemetry.stage('batch_evaluate'):
+        vitals, attribution, series = run_batch(portfolios, prices, fx_rates, args.base, args.workers)
+    if errors:
+        vitals = pd.concat([vitals, pd.DataFrame([{'portfolio': n, 'error': e} for n, e in errors.items()])],
+                           ignore_index=True)
+
+    paths = write_tables({'vitals': vitals, 'attribution': attribution, 'series': series}, args.out, args.format)
+    failed = vitals['error'].notna().sum() if 'error' in vitals else 0
+    print(f"{len(vitals)} portfolios ({failed} failed): fetch {fetched - start:.1f}s, "
+          f"evaluate {time.perf_counter() - fetched:.1f}s")
+    for path in paths:
+        print(f"  {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Cold-start guard for the API server.
+
+Imports `server` in fresh interpreters (python -X importtime) and reports the
+median import time, peak RSS and the slowest direct imports. Exits non-zero
+when the median exceeds the budget or when a module the server must not load
+at start-up (plotting libraries, yfinance) shows up in sys.modules.
+
+Usage: python bench_import.py [--runs 5] [--budget-ms 600] [--top 10]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# Only needed by report.py / the data refresh, never by importing the server
+FORBIDDEN_MODULES = ['matplotlib', 'matplotlib.pyplot', 'seaborn', 'yfinance']
+DEFAULT_BUDGET_MS = 600
+
+CHILD = """
+import json, sys
+import server
+rss_kb = None
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_kb = rss // 1024 if sys.platform == 'darwin' else rss
+except ImportError:
+    pass
+print(json.dumps({'rss_kb': rss_kb, 'loaded': [m for m in %r if m in sys.modules]}))
+""" % (FORBIDDEN_MODULES,)
+
+
+def parse_importtime(stderr):
+    """-X importtime lines -> list of (name, depth, self_us, cumulative_us)."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        head, cumulative_us, name = line.split('|')
+        # One separator space, then two spaces per nesting level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), depth, int(head.split(':')[1]), int(cumulative_us)))
+    return rows
+
+
+def run_once():
+    env = dict(os.environ, ALPHA_LOG_LEVEL='WARNING')
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    rows = parse_importtime(proc.stderr)
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    total = next(cum for name, depth, _, cum in rows if name == 'server' and depth == 0)
+    return total, rows, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help=f"fail when the median import time exceeds this (default {DEFAULT_BUDGET_MS})")
+    parser.add_argument("--top", type=int, default=10, help="slowest direct imports of server to list")
+    args = parser.parse_args()
+
+    totals = []
+    for _ in range(args.runs):
+        total, rows, result = run_once()
+        totals.append(total / 1000)
+
+    median_ms = statistics.median(totals)
+    print(f"import server: median {median_ms:.0f} ms, min {min(totals):.0f} ms, max {max(totals):.0f} ms ({args.runs} runs)")
+    if result['rss_kb']:
+        print(f"peak RSS after import: {result['rss_kb'] / 1024:.1f} MiB")
+
+    print(f"\n{'direct import':<30}{'cumulative ms':>14}")
+    direct = sorted((r for r in rows if r[1] == 1), key=lambda r: r[3], reverse=True)
+    for name, _, _, cumulative in direct[:args.top]:
+        print(f"{name:<30}{cumulative / 1000:>14.1f}")
+
+    failures = []
+    if result['loaded']:
+        failures.append(f"server start-up imported {', '.join(result['loaded'])}")
+    if median_ms > args.budget_ms:
+        failures.append(f"median import time {median_ms:.0f} ms exceeds the {args.budget_ms:.0f} ms budget")
+    for failure in failures:
+        print(f"\nFAIL: {failure}")
+    if not failures:
+        print("\nOK")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
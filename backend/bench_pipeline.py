@@ -0,0 +1,302 @@
+"""
+Benchmark suite for the risk pipeline on synthetic universes.
+
+Runs every stage on deterministic SyntheticProvider panels (a synthetic book
+of N tickers, see providers.synthetic_portfolio) for each universe size and
+history length, and records the best / median wall time of `--repeat` runs
+plus the peak traced memory of one extra run under tracemalloc:
+
+  normalize            risk.normalize_to_base_currency
+  risk_metrics         risk.calculate_risk_metrics, with its sections as
+                       risk_metrics.<section> (returns, portfolio, core, ...)
+  vw_correlation       risk.calculate_volume_weighted_correlation
+  monte_carlo          risk.run_monte_carlo (1000 paths, 60 days)
+  periodic_returns     risk.calculate_periodic_returns
+  server_payload       the /api/metrics sections (server.build_payload) on
+                       already computed metrics
+  server_encode        JSON encoding of that payload
+
+Results are saved to backend/cache/benchmarks/<commit>.json. `--compare REF`
+(a results file or a commit that has one) prints the ratio to that run and
+exits non-zero when a stage got slower or bigger than `--tolerance` allows.
+
+Usage: python bench_pipeline.py [--tickers 30,300,3000] [--years 6,20] [--repeat 3]
+                                [--stages risk_metrics,...] [--budget 30] [--out FILE]
+                                [--compare REF] [--tolerance 1.25]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import data_store
+import providers
+import rates
+import risk
+import serialize
+import server
+import telemetry
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BACKEND_DIR, 'cache', 'benchmarks')
+DEFAULT_TICKERS = (30, 300, 3000)
+DEFAULT_YEARS = (6, 20)
+STAGES = ('normalize', 'risk_metrics', 'vw_correlation', 'monte_carlo', 'periodic_returns',
+          'server_payload', 'server_encode')
+# A stage is only reported as a regression when it also got slower by this much
+# (timer noise on millisecond stages)
+MIN_REGRESSION_SECONDS = 0.005
+DEFAULT_TOLERANCE = 1.25
+# Seconds: stages slower than this on their first run are not repeated
+DEFAULT_BUDGET = 30.0
+
+
+def git_commit():
+    """Short hash of HEAD, with '-dirty' for uncommitted changes ('unknown' outside git)."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BACKEND_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f"{commit}-dirty" if dirty else commit
+
+
+# ==========================================
+# Synthetic case
+# ==========================================
+def build_case(n_tickers, years, seed=0):
+    """Inputs of every stage for one synthetic universe (book, panels, metrics)."""
+    book = providers.synthetic_portfolio(n_tickers, seed=seed)
+    raw_prices, fx_rates, volume = risk.fetch_data(book)
+    usd_prices = risk.normalize_to_base_currency(raw_prices, fx_rates, book)
+    metrics = risk.calculate_risk_metrics(usd_prices, None, fx_rates, portfolio=book)
+    panel = {
+        'version': 0,
+        'version_tag': f"bench-{n_tickers}x{years}",
+        'fetched_at': None,
+        'raw_prices': raw_prices,
+        'fx_rates': fx_rates,
+        'volume': volume,
+        'usd_prices': usd_prices,
+        'data_quality': providers.pop_data_quality(raw_prices, fx_rates),
+    }
+    return {'book': book, 'raw_prices': raw_prices, 'fx_rates': fx_rates, 'volume': volume,
+            'usd_prices': usd_prices, 'metrics': metrics, 'panel': panel}
+
+
+def metrics_panel(case):
+    """Detached panel whose prices and risk metrics are already computed, so only the sections run."""
+    panel = data_store.detached(case['panel'])
+    panel['memo'][('prices', risk.BASE_CURRENCY)] = case['usd_prices']
+    panel['memo'][('risk_metrics', risk.BASE_CURRENCY)] = case['metrics']
+    return panel
+
+
+def stage_calls(case):
+    """stage -> zero-argument callable running it on `case`."""
+    book = case['book']
+    payload = server.build_payload(metrics_panel(case), server.METRICS_SECTIONS, risk.BASE_CURRENCY)
+    return {
+        'normalize': lambda: risk.normalize_to_base_currency(case['raw_prices'], case['fx_rates'], book),
+        'risk_metrics': lambda: risk.calculate_risk_metrics(case['usd_prices'], None, case['fx_rates'],
+                                                            portfolio=book),
+        'vw_correlation': lambda: risk.calculate_volume_weighted_correlation(case['usd_prices'], case['volume'],
+                                                                             list(book)),
+        'monte_carlo': lambda: risk.run_monte_carlo(case['metrics']),
+        'periodic_returns': lambda: risk.calculate_periodic_returns(case['usd_prices']),
+        'server_payload': lambda: server.build_payload(metrics_panel(case), server.METRICS_SECTIONS,
+                                                       risk.BASE_CURRENCY),
+        'server_encode': lambda: serialize.encode(payload, 'json', 'rows'),
+    }
+
+
+# ==========================================
+# Measurement
+# ==========================================
+def measure(func, repeat, budget=None):
+    """
+    (wall times of `repeat` runs, {sub-stage: best seconds}, peak bytes).
+    Sub-stages are the telemetry stages run inside `func`; memory is measured
+    in a separate run, so tracemalloc doesn't slow down the timed ones. A stage
+    whose first run takes longer than `budget` seconds is run only once, and
+    its memory is not measured (peak None).
+    """
+    sub_stages = {}
+
+    def on_stage(name, wall, cpu):
+        sub_stages.setdefault(name, []).append(wall)
+
+    timings = []
+    telemetry.add_stage_hook(on_stage)
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+            if budget is not None and timings[0] > budget:
+                break
+    finally:
+        telemetry.remove_stage_hook(on_stage)
+    # A stage that runs once per call appears once per run; keep its best run
+    best_sub = {name: min(walls) for name, walls in sub_stages.items() if len(walls) >= len(timings)}
+    if len(timings) < repeat:
+        return timings, best_sub, None
+
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        func()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    return timings, best_sub, peak
+
+
+def run_case(n_tickers, years, stages, repeat, budget=None, seed=0):
+    """Result rows of one universe size and history length."""
+    saved_config, saved_lookback = risk.PORTFOLIO_CONFIG, risk.LOOKBACK_YEARS
+    providers.set_provider(providers.SyntheticProvider(seed=seed, years=years))
+    risk.LOOKBACK_YEARS = years
+    try:
+        case = build_case(n_tickers, years, seed)
+        # The server sections read the house book from risk.PORTFOLIO_CONFIG
+        risk.PORTFOLIO_CONFIG = case['book']
+        calls = stage_calls(case)
+        days = len(case['usd_prices'])
+        rows = []
+        for stage in stages:
+            timings, sub_stages, peak = measure(calls[stage], repeat, budget)
+            rows.append(_row(n_tickers, years, days, stage, timings, peak))
+            if stage == 'risk_metrics':
+                rows += [_row(n_tickers, years, days, name, [seconds], None)
+                         for name, seconds in sub_stages.items() if name.startswith('risk_metrics.')]
+    finally:
+        risk.PORTFOLIO_CONFIG, risk.LOOKBACK_YEARS = saved_config, saved_lookback
+        providers.set_provider(None)
+    return rows
+
+
+def _row(n_tickers, years, days, stage, timings, peak):
+    return {
+        'tickers': n_tickers, 'years': years, 'days': days, 'stage': stage,
+        'bestSeconds': min(timings), 'medianSeconds': statistics.median(timings), 'peakBytes': peak,
+    }
+
+
+# ==========================================
+# Results
+# ==========================================
+def results_path(ref):
+    """A results file path, or the saved results of commit `ref`."""
+    if os.path.exists(ref):
+        return ref
+    path = os.path.join(RESULTS_DIR, f"{ref}.json")
+    if not os.path.exists(path):
+        sys.exit(f"No benchmark results for '{ref}' (looked for {path})")
+    return path
+
+
+def compare(rows, baseline, tolerance):
+    """Print each stage against `baseline`. Returns the regressions found."""
+    previous = {(r['tickers'], r['years'], r['stage']): r for r in baseline['results']}
+    print(f"\nvs {baseline['commit']} (tolerance {tolerance:.2f}x)")
+    print(f"{'tickers':>8}{'years':>6}  {'stage':<26}{'best ms':>10}{'was ms':>10}{'time':>8}{'memory':>8}")
+    regressions = []
+    for row in rows:
+        old = previous.get((row['tickers'], row['years'], row['stage']))
+        if old is None:
+            continue
+        time_ratio = row['bestSeconds'] / old['bestSeconds'] if old['bestSeconds'] else 1.0
+        mem_ratio = row['peakBytes'] / old['peakBytes'] if row['peakBytes'] and old['peakBytes'] else None
+        flags = []
+        if time_ratio > tolerance and row['bestSeconds'] - old['bestSeconds'] > MIN_REGRESSION_SECONDS:
+            flags.append('time')
+        if mem_ratio is not None and mem_ratio > tolerance:
+            flags.append('memory')
+        mem_text = f"{mem_ratio:.2f}x" if mem_ratio is not None else '-'
+        print(f"{row['tickers']:>8}{row['years']:>6}  {row['stage']:<26}{row['bestSeconds'] * 1000:>10.1f}"
+              f"{old['bestSeconds'] * 1000:>10.1f}{time_ratio:>7.2f}x{mem_text:>8}"
+              f"{'  SLOWER: ' + ', '.join(flags) if flags else ''}")
+        if flags:
+            regressions.append((row, flags))
+    return regressions
+
+
+def _int_list(text):
+    return [int(v) for v in text.split(',') if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tickers", type=_int_list, default=list(DEFAULT_TICKERS),
+                        help="comma-separated universe sizes (default 30,300,3000)")
+    parser.add_argument("--years", type=_int_list, default=list(DEFAULT_YEARS),
+                        help="comma-separated history lengths in years (default 6,20)")
+    parser.add_argument("--stages", type=lambda s: s.split(','), default=list(STAGES),
+                        help=f"comma-separated stages (default all: {','.join(STAGES)})")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage (default 3)")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET,
+                        help=f"run a stage once, without the memory run, when it takes longer (default {DEFAULT_BUDGET:.0f}s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="results file (default cache/benchmarks/<commit>.json)")
+    parser.add_argument("--compare", metavar="REF", help="results file or commit to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help=f"slowdown / memory growth ratio counted as a regression (default {DEFAULT_TOLERANCE})")
+    args = parser.parse_args()
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    # Risk-free curves from the synthetic yields, so no stage touches the network
+    providers.set_provider(providers.SyntheticProvider(seed=args.seed))
+    rates.refresh_rates()
+
+    rows = []
+    print(f"{'tickers':>8}{'years':>6}  {'stage':<26}{'best ms':>10}{'median ms':>11}{'peak MiB':>10}")
+    for n_tickers in args.tickers:
+        for years in args.years:
+            for row in run_case(n_tickers, years, args.stages, args.repeat, args.budget, args.seed):
+                peak = f"{row['peakBytes'] / 2 ** 20:.1f}" if row['peakBytes'] is not None else '-'
+                print(f"{row['tickers']:>8}{row['years']:>6}  {row['stage']:<26}{row['bestSeconds'] * 1000:>10.1f}"
+                      f"{row['medianSeconds'] * 1000:>11.1f}{peak:>10}", flush=True)
+                rows.append(row)
+
+    commit = git_commit()
+    results = {
+        'commit': commit,
+        'createdAt': time.time(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'cpuCount': os.cpu_count(),
+        'repeat': args.repeat,
+        'seed': args.seed,
+        'results': rows,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(results, f, indent=1)
+    print(f"\nSaved {out}")
+
+    if args.compare:
+        with open(results_path(args.compare)) as f:
+            regressions = compare(rows, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\nFAIL: {len(regressions)} stage(s) regressed")
+            sys.exit(1)
+        print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
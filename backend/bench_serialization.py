@@ -0,0 +1,146 @@
+"""
+Encode-time / byte-size benchmark of the API response formats.
+
+Compares the current JSON encoding (rows and columnar, plain / gzip / brotli)
+with MessagePack and Arrow IPC at float64 and float32, for
+  1. the /api/metrics payload of our own universe (synthetic prices), and
+  2. a synthetic 1000-ticker universe (1000x1000 correlation matrix,
+     per-ticker attribution / periodic tables, 6y history, Monte Carlo cone).
+
+Usage: python bench_serialization.py [--repeat 5] [--tickers 1000]
+Formats whose library is not installed are skipped.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import data_store
+import providers
+import risk
+import serialize
+import server
+
+
+def synthetic_prices(tickers, years=6, seed=0):
+    """Correlated GBM closes on business days ending today, without missing values."""
+    close, _ = providers.SyntheticProvider(seed=seed, years=years, late_listing=0, gaps=0).download(tickers)
+    return close
+
+
+def house_payload(seed=0):
+    """The /api/metrics payload for PORTFOLIO_CONFIG, computed on synthetic prices."""
+    providers.set_provider(providers.SyntheticProvider(seed=seed))
+    prices, fx, volume = risk.fetch_data()
+
+    panel = data_store.detached({
+        'version': 0,
+        'version_tag': 'bench',
+        'raw_prices': prices,
+        'fx_rates': fx,
+        'volume': volume,
+        'usd_prices': risk.normalize_to_base_currency(prices, fx),
+        'data_quality': providers.pop_data_quality(prices, fx),
+    })
+    return server.build_payload(panel, server.METRICS_SECTIONS, risk.BASE_CURRENCY)
+
+
+def large_payload(n_tickers=1000, seed=0):
+    """Payload with the same table shapes as /api/metrics for an n-ticker universe."""
+    tickers = [f"T{i:04d}" for i in range(n_tickers)]
+    prices = synthetic_prices(tickers, seed=seed)
+    rets = prices.pct_change().dropna()
+    rng = np.random.default_rng(seed + 1)
+
+    weights = rng.dirichlet(np.ones(n_tickers))
+    port = rets.to_numpy() @ weights
+    cum = (1 + pd.Series(port, index=rets.index)).cumprod() * 1000
+    bench = (1 + rets.iloc[:, 0]).cumprod() * 1000
+    pct_risk = rng.dirichlet(np.ones(n_tickers))
+
+    corr = pd.DataFrame(np.corrcoef(rets.to_numpy(), rowvar=False), index=tickers, columns=tickers)
+    paths = 1000 * np.exp(np.cumsum(rng.normal(0.0003, 0.01, (500, 61)), axis=1))
+
+    return {
+        "riskAttribution": pd.DataFrame({
+            "ticker": tickers, "weight": weights, "pctRisk": pct_risk, "mctr": pct_risk * 0.2,
+        }),
+        "volumeWeightedCorrelation": server.format_correlation(corr),
+        "periodicReturns": pd.DataFrame({
+            "ticker": tickers,
+            "ytd": rng.normal(0.05, 0.2, n_tickers),
+            "r1m": rng.normal(0.01, 0.05, n_tickers),
+            "r1y": rng.normal(0.1, 0.3, n_tickers),
+            "r5y": np.where(rng.random(n_tickers) < 0.1, np.nan, rng.normal(0.5, 0.6, n_tickers)),
+            "ytdContribution": rng.normal(0, 0.001, n_tickers),
+            "weight": weights,
+            "direction": ["Long"] * n_tickers,
+        }),
+        "monteCarlo": server.format_monte_carlo(paths),
+        "history": pd.DataFrame({
+            "date": cum.index.strftime('%Y-%m-%d'),
+            "portfolio": cum.to_numpy(),
+            "benchmark": bench.to_numpy(),
+            "drawdown": (cum / cum.cummax() - 1).to_numpy(),
+        }),
+    }
+
+
+def encoders():
+    """(label, payload -> bytes) for every format available here."""
+    def json_encoder(layout, encoding=None):
+        return lambda payload: serialize.compress(serialize.encode(payload, 'json', layout), encoding)[0]
+
+    def binary_encoder(fmt, precision, encoding=None):
+        return lambda payload: serialize.compress(serialize.encode(payload, fmt, precision=precision), encoding)[0]
+
+    out = [
+        ("json rows (current)", json_encoder('rows')),
+        ("json columnar", json_encoder('columnar')),
+        ("json rows + gzip", json_encoder('rows', 'gzip')),
+        ("json columnar + gzip", json_encoder('columnar', 'gzip')),
+    ]
+    if serialize.brotli is not None:
+        out += [
+            ("json rows + br", json_encoder('rows', 'br')),
+            ("json columnar + br", json_encoder('columnar', 'br')),
+        ]
+    for fmt in ('msgpack', 'arrow'):
+        if fmt not in serialize.available_formats():
+            print(f"Skipping {fmt}: library not installed")
+            continue
+        for precision in serialize.PRECISIONS[::-1]:
+            out.append((f"{fmt} float{precision}", binary_encoder(fmt, precision)))
+        out.append((f"{fmt} float32 + gzip", binary_encoder(fmt, 32, 'gzip')))
+    return out
+
+
+def bench(name, payload, repeat):
+    print(f"\n=== {name} ===")
+    print(f"{'format':<24}{'bytes':>12}{'vs json':>9}{'best ms':>10}{'mean ms':>10}")
+    baseline = None
+    for label, encode in encoders():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = encode(payload)
+            timings.append(time.perf_counter() - start)
+        baseline = baseline or len(body)
+        print(f"{label:<24}{len(body):>12,}{len(body) / baseline:>9.2f}"
+              f"{min(timings) * 1000:>10.1f}{np.mean(timings) * 1000:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="encodes per format (default 5)")
+    parser.add_argument("--tickers", type=int, default=1000, help="size of the synthetic universe (default 1000)")
+    args = parser.parse_args()
+
+    print(f"orjson: {'yes' if serialize.orjson else 'no'}, formats: {', '.join(serialize.available_formats())}")
+    bench(f"/api/metrics, house universe ({len(risk.PORTFOLIO_CONFIG)} tickers)", house_payload(), args.repeat)
+    bench(f"synthetic universe ({args.tickers} tickers)", large_payload(args.tickers), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
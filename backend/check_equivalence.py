@@ -0,0 +1,257 @@
+"""
+Golden-reference equivalence check for the risk engine.
+
+Runs the frozen reference (risk_reference.calculate_risk_metrics) and the
+candidate (risk.calculate_risk_metrics by default) side by side on randomized
+synthetic panels and reports, per metric, the largest absolute and relative
+deviation over all cases. Every case draws its own universe size, history
+length, reporting currency, YTD date and missing-data pattern:
+
+  late listings / delistings   symbols whose history starts late or stops early
+  gaps                         isolated missing closes
+  market holidays              all symbols of one currency missing on the same days
+  closed days                  dates dropped from the whole panel (incl. around New Year)
+
+Exits non-zero when a metric deviates by more than --atol and --rtol, or when
+the two engines disagree on the shape of a result (keys, tickers, None).
+
+Usage: python check_equivalence.py [--cases 50] [--seed 0] [--candidate module:function]
+                                   [--atol 1e-10] [--rtol 1e-8] [--verbose]
+"""
+import argparse
+import importlib
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import diagnostics
+import providers
+import rates
+import risk
+import risk_reference
+
+DEFAULT_ATOL = 1e-10
+DEFAULT_RTOL = 1e-8
+SCALAR_METRICS = [
+    'Beta', 'Annual_Return', 'Annual_Vol', 'Sharpe', 'Sortino', 'Rolling_1M_Vol', 'Benchmark_Rolling_1M_Vol',
+    'CVaR_95', 'VaR_95', 'Max_Drawdown', 'Jensens_Alpha', 'Risk_Free_Rate',
+    'YTD_Return', 'Benchmark_YTD', 'YTD_Beta', 'YTD_Sharpe', 'Benchmark_YTD_Sharpe', 'Benchmark_Hist_Sharpe',
+    'YTD_Return_PLN', 'WIG_YTD', 'MSCI_YTD', 'YTD_Longs_Contrib', 'YTD_Shorts_Contrib', 'YTD_Alpha',
+    'YTD_Max_Drawdown', 'Benchmark_YTD_Max_Drawdown',
+]
+SERIES_METRICS = [
+    'Returns_Stream', 'Net_Stream', 'Benchmark_Stream', 'Drawdown_Stream', 'YTD_Stream', 'YTD_Benchmark_Stream',
+]
+MATRIX_METRICS = ['Correlation_Matrix', 'Volume_Weighted_Correlation']
+
+
+# ==========================================
+# Randomized panels
+# ==========================================
+def random_case(seed):
+    """(description, provider, calculate_risk_metrics kwargs) of one randomized synthetic case."""
+    rng = np.random.default_rng(seed)
+    n_tickers = int(rng.integers(3, 60))
+    years = int(rng.integers(1, 8))
+    # Any day of the year, so YTD windows range from empty to full
+    end = pd.Timestamp('2025-01-01') + pd.Timedelta(days=int(rng.integers(0, 366)))
+    currencies = tuple(rng.choice(['USD', 'EUR', 'PLN', 'JPY', 'DKK', 'KRW'], size=int(rng.integers(1, 5)),
+                                  replace=False))
+    base = str(rng.choice(risk.REPORTING_CURRENCIES))
+    provider = providers.SyntheticProvider(
+        seed=seed, years=years, end=end,
+        correlation=float(rng.uniform(0, 0.8)),
+        late_listing=float(rng.choice([0.0, 0.2, 0.5])),
+        delisted=float(rng.choice([0.0, 0.1])),
+        gaps=float(rng.choice([0.0, 0.002, 0.02])),
+    )
+    book = providers.synthetic_portfolio(n_tickers, currencies, short_share=float(rng.uniform(0, 0.5)),
+                                         long_exposure=float(rng.uniform(0.5, 2.0)),
+                                         short_exposure=float(rng.uniform(0, 1.0)), seed=seed)
+
+    saved_lookback = risk.LOOKBACK_YEARS
+    providers.set_provider(provider)
+    risk.LOOKBACK_YEARS = years
+    try:
+        raw_prices, fx_rates, volume = risk.fetch_data(book)
+    finally:
+        risk.LOOKBACK_YEARS = saved_lookback
+    providers.pop_data_quality(raw_prices, fx_rates)
+
+    # Market holidays: every symbol quoted in one currency misses the same days
+    for currency in currencies:
+        tickers = [t for t, info in book.items() if info['currency'] == currency]
+        holidays = rng.random(len(raw_prices)) < 0.02
+        raw_prices.loc[holidays, tickers] = np.nan
+        volume.loc[holidays, tickers] = np.nan
+    # Closed days: dropped from the whole panel, including the turn of the year
+    closed = rng.random(len(raw_prices)) < 0.01
+    closed |= (raw_prices.index.month == 12) & (raw_prices.index.day == 31) & (rng.random() < 0.5)
+    closed |= (raw_prices.index.month == 1) & (raw_prices.index.day <= 2) & (rng.random() < 0.5)
+    raw_prices, volume, fx_rates = raw_prices[~closed], volume[~closed], fx_rates[~closed]
+
+    usd_prices = risk.normalize_to_base_currency(raw_prices, fx_rates, book)
+    prices = risk.rebase_to_currency(usd_prices, fx_rates, base)
+    description = (f"seed {seed}: {n_tickers} tickers in {','.join(currencies)}, {years}y to {end.date()}, "
+                   f"base {base}, {len(prices)} days")
+    kwargs = {'price_df': prices, 'volume_df': volume, 'fx_df': fx_rates, 'base_currency': base, 'portfolio': book}
+    return description, provider, kwargs
+
+
+def _copy_kwargs(kwargs):
+    # The engines may mutate their inputs (index reassignment); give each its own
+    return {k: v.copy() if isinstance(v, pd.DataFrame) else v for k, v in kwargs.items()}
+
+
+# ==========================================
+# Comparison
+# ==========================================
+def _deviation(ref, cand):
+    """(max abs, max rel) deviation of two aligned float arrays; inf when only one side is NaN."""
+    ref = np.asarray(ref, dtype=float).ravel()
+    cand = np.asarray(cand, dtype=float).ravel()
+    ref_nan, cand_nan = np.isnan(ref), np.isnan(cand)
+    if (ref_nan != cand_nan).any():
+        return np.inf, np.inf
+    ref, cand = ref[~ref_nan], cand[~ref_nan]
+    if ref.size == 0:
+        return 0.0, 0.0
+    with np.errstate(invalid='ignore'):
+        diff = np.abs(ref - cand)
+        diff[ref == cand] = 0.0  # Matching infinities
+    scale = np.maximum(np.abs(ref), np.finfo(float).tiny)
+    return float(diff.max()), float((diff / scale).max())
+
+
+def _aligned(ref, cand):
+    """Structural mismatch message, or None when both values have the same labels."""
+    if (ref is None) != (cand is None):
+        return f"{'reference' if ref is None else 'candidate'} is None"
+    if isinstance(ref, pd.DataFrame):
+        if not (ref.index.equals(cand.index) and ref.columns.equals(cand.columns)):
+            return f"labels differ: {ref.shape} vs {cand.shape}"
+    elif isinstance(ref, pd.Series):
+        if not ref.index.equals(cand.index):
+            return f"index differs: {len(ref)} vs {len(cand)} rows"
+    return None
+
+
+def compare_metrics(ref, cand):
+    """{metric: (max abs, max rel, mismatch message or None)} for one pair of calculate_risk_metrics results."""
+    if ref is None or cand is None:
+        if ref is None and cand is None:
+            return {}
+        return {'(result)': (np.inf, np.inf, f"{'reference' if ref is None else 'candidate'} returned None")}
+
+    out = {}
+    for name in SCALAR_METRICS:
+        out[name] = (*_deviation(ref[name], cand[name]), None)
+    for name in SERIES_METRICS + MATRIX_METRICS:
+        mismatch = _aligned(ref[name], cand[name])
+        if mismatch or ref[name] is None:
+            out[name] = (np.inf if mismatch else 0.0, np.inf if mismatch else 0.0, mismatch)
+        else:
+            out[name] = (*_deviation(ref[name].to_numpy(), cand[name].to_numpy()), None)
+
+    ref_attr, cand_attr = ref['Risk_Attribution'], cand['Risk_Attribution']
+    if list(ref_attr) != list(cand_attr):
+        for field in ('MCTR', 'Pct_Risk', 'Weight'):
+            out[field] = (np.inf, np.inf, f"tickers differ: {len(ref_attr)} vs {len(cand_attr)}")
+    else:
+        for field in ('MCTR', 'Pct_Risk', 'Weight'):
+            out[field] = (*_deviation([v[field] for v in ref_attr.values()],
+                                      [v[field] for v in cand_attr.values()]), None)
+
+    for field, value in ref['Leverage_Stats'].items():
+        out[f"Leverage_Stats.{field}"] = (*_deviation(value, cand['Leverage_Stats'][field]), None)
+    if list(ref['Fx_Watchlist']) != list(cand['Fx_Watchlist']):
+        out['Fx_Watchlist'] = (np.inf, np.inf, "pairs differ")
+    else:
+        out['Fx_Watchlist'] = (*_deviation(list(ref['Fx_Watchlist'].values()),
+                                           list(cand['Fx_Watchlist'].values())), None)
+    return out
+
+
+def _within(abs_dev, rel_dev, atol, rtol):
+    return abs_dev <= atol or rel_dev <= rtol
+
+
+def load_candidate(spec):
+    """'module:function' -> the function."""
+    module, _, name = spec.partition(':')
+    return getattr(importlib.import_module(module), name or 'calculate_risk_metrics')
+
+
+def run(cases, seed, candidate, atol=DEFAULT_ATOL, rtol=DEFAULT_RTOL, verbose=False):
+    """
+    Compare the engines on `cases` randomized panels. Returns {metric: row} with
+    the worst absolute / relative deviation, the case it occurred in and the
+    number of failing cases.
+    """
+    worst = {}
+    timings = {'reference': 0.0, 'candidate': 0.0}
+    for case_seed in range(seed, seed + cases):
+        description, provider, kwargs = random_case(case_seed)
+        # Both engines read "now" (the YTD year) from the active provider
+        providers.set_provider(provider)
+        start = time.perf_counter()
+        ref = risk_reference.calculate_risk_metrics(**_copy_kwargs(kwargs))
+        timings['reference'] += time.perf_counter() - start
+        start = time.perf_counter()
+        cand = candidate(**_copy_kwargs(kwargs))
+        timings['candidate'] += time.perf_counter() - start
+
+        failed = []
+        for metric, (abs_dev, rel_dev, mismatch) in compare_metrics(ref, cand).items():
+            row = worst.setdefault(metric, {'metric': metric, 'maxAbs': 0.0, 'maxRel': 0.0,
+                                            'worstCase': None, 'failedCases': 0, 'mismatch': None})
+            if abs_dev > row['maxAbs'] or rel_dev > row['maxRel']:
+                row['maxAbs'], row['maxRel'] = max(abs_dev, row['maxAbs']), max(rel_dev, row['maxRel'])
+                row['worstCase'] = case_seed
+            if mismatch or not _within(abs_dev, rel_dev, atol, rtol):
+                row['failedCases'] += 1
+                row['mismatch'] = row['mismatch'] or mismatch
+                failed.append(metric)
+        if verbose or failed:
+            print(f"{'FAIL' if failed else 'ok  '} {description}" + (f": {', '.join(failed)}" if failed else ''))
+    providers.set_provider(None)
+    return worst, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=50, help="randomized panels (default 50)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first case")
+    parser.add_argument("--candidate", default="risk:calculate_risk_metrics",
+                        help="engine under test as module:function (default risk:calculate_risk_metrics)")
+    parser.add_argument("--atol", type=float, default=DEFAULT_ATOL, help=f"absolute tolerance (default {DEFAULT_ATOL})")
+    parser.add_argument("--rtol", type=float, default=DEFAULT_RTOL, help=f"relative tolerance (default {DEFAULT_RTOL})")
+    parser.add_argument("--verbose", action="store_true", help="print every case, not only failing ones")
+    args = parser.parse_args()
+    diagnostics.setup_logging()
+
+    # Risk-free curves from the synthetic yields: no network, same curve for both engines
+    providers.set_provider(providers.SyntheticProvider())
+    rates.refresh_rates()
+
+    worst, timings = run(args.cases, args.seed, load_candidate(args.candidate), args.atol, args.rtol, args.verbose)
+
+    print(f"\n{'metric':<34}{'max abs':>12}{'max rel':>12}{'worst case':>12}{'failed':>8}")
+    for row in worst.values():
+        print(f"{row['metric']:<34}{row['maxAbs']:>12.3g}{row['maxRel']:>12.3g}"
+              f"{row['worstCase'] if row['worstCase'] is not None else '-':>12}{row['failedCases']:>8}"
+              + (f"  {row['mismatch']}" if row['mismatch'] else ''))
+    print(f"\n{args.cases} cases: reference {timings['reference']:.2f}s, candidate {timings['candidate']:.2f}s "
+          f"({timings['reference'] / max(timings['candidate'], 1e-9):.2f}x)")
+
+    failures = [row['metric'] for row in worst.values() if row['failedCases']]
+    if failures:
+        print(f"\nFAIL: {', '.join(failures)} outside atol={args.atol:g} / rtol={args.rtol:g}")
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
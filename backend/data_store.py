@@ -0,0 +1,322 @@
+"""
+In-process market data store.
+
+Holds the most recently fetched price / FX / volume panel together with a
+data version that is bumped on every refresh. Anything derived from the panel
+(rebased currency panels, per-currency metrics payloads) is memoized against
+that version, so it is computed once per refresh instead of once per request.
+
+With the shared cache enabled (several uvicorn workers, see shared_cache.py)
+only one worker fetches at a time and publishes the panel; the others adopt
+it memory-mapped, and encoded payloads are computed once for all workers.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import diagnostics
+import providers
+import risk
+import shared_cache
+import telemetry
+
+log = diagnostics.get_logger('data_store')
+
+# Re-fetch from Yahoo at most this often
+CACHE_TTL_SECONDS = 15 * 60
+# How many past data versions of archived results to keep for delta sync
+ARCHIVE_VERSIONS = 8
+# Shared cache: how often a worker checks for a panel published by another
+# worker, and how long a dead worker's fetch / compute lease blocks the others
+SHARED_SYNC_SECONDS = 1.0
+REFRESH_LEASE_SECONDS = 5 * 60
+COMPUTE_LEASE_SECONDS = 2 * 60
+
+_lock = threading.RLock()
+_updated = threading.Condition(_lock)
+# Held for the whole download, so only one fetch runs while readers keep using the old panel
+_refresh_lock = threading.Lock()
+_refresher = None
+_state = {
+    'version': 0,
+    'version_tag': None,   # Unique across restarts, used for HTTP ETags
+    'fetched_at': None,
+    'raw_prices': None,
+    'fx_rates': None,
+    'volume': None,
+    'usd_prices': None,
+    'data_quality': {'stale': {}, 'failed': []},   # Symbols served from stored data / missing
+}
+_derived = {}
+_key_locks = {}
+_archive = {}
+_last_shared_sync = 0.0
+
+
+def _install(frames, version_tag, fetched_at):
+    """
+    Make `frames` the current panel: bump the data version and drop all derived
+    results. Callers hold `_lock`.
+    """
+    _state.update(frames)
+    _state['version'] += 1
+    _state['version_tag'] = version_tag or f"{int(time.time() * 1000):x}.{_state['version']}"
+    _state['fetched_at'] = fetched_at
+    telemetry.set_gauge('alpha_data_version', _state['version'])
+    if fetched_at is not None:
+        telemetry.set_gauge('alpha_data_refreshed_timestamp_seconds', fetched_at)
+    _derived.clear()
+    _updated.notify_all()
+    return dict(_state)
+
+
+def _fetch(publish=False):
+    raw_prices, fx_rates, volume_data = risk.fetch_data()
+    quality = providers.pop_data_quality(raw_prices, fx_rates)
+    usd_prices = risk.normalize_to_base_currency(raw_prices, fx_rates)
+    frames = {'raw_prices': raw_prices, 'fx_rates': fx_rates, 'volume': volume_data, 'usd_prices': usd_prices,
+              'data_quality': quality}
+
+    # An empty download (rate limit) is not cached, so the next request retries
+    fetched_at = time.time() if not usd_prices.empty else None
+    with _lock:
+        panel = _install(frames, None, fetched_at)
+    if publish and fetched_at is not None:
+        shared_cache.publish_panel(panel['version_tag'], fetched_at, frames)
+    log.info("Data store refreshed (version %d, %d rows)", panel['version'], usd_prices.shape[0])
+    return panel
+
+
+def _adopt(published):
+    """Switch to a panel another worker published. None if its files are already gone."""
+    if published['version_tag'] == _state['version_tag']:
+        return dict(_state)
+    frames = shared_cache.load_panel(published['version_tag'])
+    if frames is None:
+        return None
+    log.info("Adopted shared panel %s", published['version_tag'])
+    with _lock:
+        return _install(frames, published['version_tag'], published['fetched_at'])
+
+
+def _sync_shared():
+    """Adopt a newer panel published by another worker (checked at most every SHARED_SYNC_SECONDS)."""
+    global _last_shared_sync
+    now = time.time()
+    if now - _last_shared_sync < SHARED_SYNC_SECONDS:
+        return
+    _last_shared_sync = now
+    published = shared_cache.current_panel()
+    if published and published['version_tag'] != _state['version_tag'] \
+            and published['fetched_at'] >= (_state['fetched_at'] or 0):
+        _adopt(published)
+
+
+def refresh(max_age=None):
+    """
+    Fetch a fresh panel, bump the data version and drop all derived results.
+    One fetch runs at a time and readers keep the old panel until it is
+    installed. A panel fetched less than `max_age` seconds ago is kept; with
+    the shared cache, workers fetch one at a time, and a panel another worker
+    published that recently is adopted instead.
+    """
+    with _refresh_lock, telemetry.stage('refresh'):
+        fetched_at = _state['fetched_at']
+        if max_age is not None and fetched_at is not None and time.time() - fetched_at <= max_age:
+            # Refreshed by a concurrent caller (or a request) while we waited
+            with _lock:
+                return dict(_state)
+        if not shared_cache.enabled():
+            return _fetch()
+        with shared_cache.lease('refresh', REFRESH_LEASE_SECONDS):
+            published = shared_cache.current_panel()
+            if published and max_age is not None and time.time() - published['fetched_at'] <= max_age:
+                panel = _adopt(published)
+                if panel is not None:
+                    return panel
+            return _fetch(publish=True)
+
+
+def wait_for_update(version, timeout=None):
+    """
+    Block until the data version differs from `version` (or `timeout` seconds pass).
+    Returns the new panel, or None on timeout.
+    """
+    with _updated:
+        if _updated.wait_for(lambda: _state['version'] != version, timeout):
+            return dict(_state)
+        return None
+
+
+def start_refresher(interval=CACHE_TTL_SECONDS):
+    """Fetch now and then every `interval` seconds on a daemon thread, so requests hit a warm cache."""
+    global _refresher
+    if _refresher is not None:
+        return _refresher
+
+    stop_event = threading.Event()
+
+    def _loop():
+        while True:
+            try:
+                # Another worker's refresh from the last half interval is reused, not refetched
+                refresh(max_age=interval / 2)
+            except Exception:
+                telemetry.inc('alpha_fetch_failures_total', kind='refresh')
+                log.exception("Background refresh failed")
+            if stop_event.wait(interval):
+                break
+
+    _refresher = threading.Thread(target=_loop, name="data-refresh", daemon=True)
+    _refresher.stop_event = stop_event
+    _refresher.start()
+    return _refresher
+
+
+def get_panel(max_age=CACHE_TTL_SECONDS):
+    """
+    Return the current panel, refreshing it first if it is missing or stale.
+    While another thread refreshes, a stale panel is served as it is; only
+    callers without any panel wait for the download.
+    """
+    with _lock:
+        if shared_cache.enabled():
+            _sync_shared()
+        panel = dict(_state)
+    fetched_at = panel['fetched_at']
+    if fetched_at is not None and time.time() - fetched_at <= max_age:
+        return panel
+    if fetched_at is not None and _refresh_lock.locked():
+        return panel
+    return refresh(max_age)
+
+
+def get_cached(key, compute, panel=None):
+    """
+    Memoize `compute(panel)` under `key` for the panel's data version.
+    Concurrent callers for the same key wait for a single computation. Results
+    computed against a panel that was replaced mid-flight are returned but not
+    stored.
+    """
+    if panel is None:
+        panel = get_panel()
+    memo = panel.get('memo')
+    if memo is not None:
+        # Detached panel: private memo, the shared cache is neither read nor written
+        if key not in memo:
+            memo[key] = compute(panel)
+        return memo[key]
+    version = panel['version']
+
+    cache = key[0] if isinstance(key, tuple) else key
+    with _lock:
+        entry = _derived.get(key)
+        if entry is not None and entry[0] == version:
+            telemetry.inc('alpha_cache_requests_total', cache=cache, result='hit')
+            return entry[1]
+        # [lock, callers using it]: dropped with its last caller, so client-chosen keys don't pile up
+        key_lock = _key_locks.setdefault(key, [threading.Lock(), 0])
+        key_lock[1] += 1
+
+    try:
+        with key_lock[0]:
+            with _lock:
+                entry = _derived.get(key)
+                if entry is not None and entry[0] == version:
+                    # Computed by a concurrent caller while we waited
+                    telemetry.inc('alpha_cache_requests_total', cache=cache, result='hit')
+                    return entry[1]
+
+            telemetry.inc('alpha_cache_requests_total', cache=cache, result='miss')
+            value = compute(panel)
+
+            with _lock:
+                if _state['version'] == version:
+                    _derived[key] = (version, value)
+        return value
+    finally:
+        with _lock:
+            key_lock[1] -= 1
+            if key_lock[1] == 0:
+                del _key_locks[key]
+
+
+def get_shared(key, compute, panel=None):
+    """
+    get_cached for picklable results (encoded payloads) that other worker
+    processes can reuse: with the shared cache, one worker computes the value
+    under a lease and the rest read it. Without it, same as get_cached.
+    """
+    if panel is None:
+        panel = get_panel()
+    if not shared_cache.enabled() or panel.get('memo') is not None or panel['fetched_at'] is None:
+        return get_cached(key, compute, panel)
+
+    def compute_shared(p):
+        shared_key = repr(key)
+        value = shared_cache.get(p['version_tag'], shared_key)
+        if value is not None:
+            telemetry.inc('alpha_cache_requests_total', cache='shared', result='hit')
+            return value
+        with shared_cache.lease(f"compute:{p['version_tag']}:{shared_key}", COMPUTE_LEASE_SECONDS):
+            # Computed by another worker while we waited for the lease
+            value = shared_cache.get(p['version_tag'], shared_key)
+            if value is None:
+                telemetry.inc('alpha_cache_requests_total', cache='shared', result='miss')
+                value = compute(p)
+                shared_cache.put(p['version_tag'], shared_key, value)
+            else:
+                telemetry.inc('alpha_cache_requests_total', cache='shared', result='hit')
+        return value
+
+    return get_cached(key, compute_shared, panel)
+
+
+def detached(panel):
+    """
+    Copy of `panel` with its own empty memo: every derived result is computed
+    once, as on a cold cache, without reading or filling the shared cache.
+    """
+    return dict(panel, memo={})
+
+
+def get_prices(base=risk.BASE_CURRENCY, panel=None):
+    """Price panel expressed in `base`, rebased once per data version."""
+    return get_cached(
+        ('prices', base),
+        lambda p: risk.rebase_to_currency(p['usd_prices'], p['fx_rates'], base),
+        panel
+    )
+
+
+def get_risk_metrics(base=risk.BASE_CURRENCY, panel=None):
+    """
+    calculate_risk_metrics for the house portfolio in `base`, once per data version.
+    Volume is not passed: the volume-weighted correlation is computed separately.
+    """
+    return get_cached(
+        ('risk_metrics', base),
+        lambda p: risk.calculate_risk_metrics(get_prices(base, p), None, p['fx_rates'], base_currency=base),
+        panel
+    )
+
+
+def archive(key, version_tag, value):
+    """Keep `value` for `version_tag` so later versions can be diffed against it."""
+    with _lock:
+        versions = _archive.setdefault(key, OrderedDict())
+        versions[version_tag] = value
+        while len(versions) > ARCHIVE_VERSIONS:
+            versions.popitem(last=False)
+    if shared_cache.enabled():
+        shared_cache.put(version_tag, f"archive:{key!r}", value)
+
+
+def get_archived(key, version_tag):
+    """Archived value of `key` at `version_tag`, or None if unknown / evicted."""
+    with _lock:
+        value = _archive.get(key, {}).get(version_tag)
+    if value is None and shared_cache.enabled():
+        # Archived by another worker (kept for shared_cache.KEEP_VERSIONS versions)
+        value = shared_cache.get(version_tag, f"archive:{key!r}")
+    return value
@@ -3,11 +3,9 @@ import os
 import pandas as pd
 from datetime import datetime
 
-# Add the directory containing risk.py to path
-RISK_DIR = r"c:\Users\Tomek\.antigravity\alpha"
-sys.path.append(RISK_DIR)
-
 try:
+    import providers
+    import rates
     import risk
 except ImportError as e:
     print(f"Error importing risk.py: {e}")
@@ -16,7 +14,8 @@ except ImportError as e:
 def verify_fix():
     output_lines = []
     output_lines.append("Fetching data...")
-    stock_raw, fx_rates = risk.fetch_data()
+    rates.refresh_rates()
+    stock_raw, fx_rates, volume = risk.fetch_data()
     usd_prices = risk.normalize_to_base_currency(stock_raw, fx_rates)
     
     output_lines.append("\n--- Running risk.calculate_risk_metrics ---")
@@ -47,4 +46,5 @@ def verify_fix():
         f.write("\n".join(output_lines))
 
 if __name__ == "__main__":
+    providers.use_cassette_args("Check the MSFT / portfolio YTD calculation.")
     verify_fix()
@@ -1,23 +1,22 @@
-import yfinance as yf
 import pandas as pd
-from datetime import datetime
+
+import providers
+
+providers.use_cassette_args("Check the USDPLN lookup around the YTD start.")
 
 # Mimic risk.py logic
-current_year = datetime.now().year
+current_year = providers.now().year
 ytd_calc_start = f"{current_year}-01-01"
 print(f"Current Year: {current_year}")
 print(f"YTD Start: {ytd_calc_start}")
 
 try:
     print("Fetching USDPLN=X...")
-    usdpln = yf.Ticker("USDPLN=X")
     start_date = pd.Timestamp(ytd_calc_start) - pd.Timedelta(days=10)
     print(f"Fetch Start Date: {start_date}")
     
-    pln_hist = usdpln.history(start=start_date)
-    
-    if hasattr(pln_hist.index, 'tz'):
-        pln_hist.index = pln_hist.index.tz_localize(None)
+    close, _ = providers.get_provider().download(["USDPLN=X"], start=start_date.strftime('%Y-%m-%d'))
+    pln_hist = close.rename(columns={"USDPLN=X": "Close"}).dropna()
     
     print("\n--- History Data ---")
     print(pln_hist)
@@ -1,11 +1,16 @@
-import risk 
+import providers
+import rates
+import risk
 import pandas as pd
 import numpy as np
 
+providers.use_cassette_args("Check the volume-weighted correlation.")
+
 print("--- Testing Volume Logic ---")
 try:
     # 1. Fetch
     print("Fetching data...")
+    rates.refresh_rates()
     prices, fx, volume = risk.fetch_data()
     print(f"Prices Shape: {prices.shape}")
     print(f"Volume Shape: {volume.shape}")
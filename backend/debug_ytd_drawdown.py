@@ -1,11 +1,16 @@
-import risk 
+import providers
+import rates
+import risk
 import pandas as pd
 import numpy as np
 
+providers.use_cassette_args("Check the YTD max drawdown.")
+
 print("--- Testing YTD Drawdown Logic ---")
 try:
     # 1. Fetch & Normalize
     print("Fetching data...")
+    rates.refresh_rates()
     prices, fx, volume = risk.fetch_data()
     usd_prices = risk.normalize_to_base_currency(prices, fx)
     
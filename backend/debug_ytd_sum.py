@@ -3,10 +3,9 @@ import os
 import pandas as pd
 import numpy as np
 
-RISK_DIR = r"c:\Users\Tomek\.antigravity\alpha"
-sys.path.append(RISK_DIR)
-
 try:
+    import providers
+    import rates
     import risk
 except ImportError as e:
     print(f"Error importing risk.py: {e}")
@@ -19,7 +18,8 @@ def debug_ytd_sum():
     
     out = []
     out.append("Fetching data...")
-    stock_raw, fx_rates = risk.fetch_data()
+    rates.refresh_rates()
+    stock_raw, fx_rates, volume = risk.fetch_data()
     usd_prices = risk.normalize_to_base_currency(stock_raw, fx_rates)
     
     out.append("Calculating metrics...")
@@ -69,4 +69,5 @@ def debug_ytd_sum():
         f.write("\n".join(out))
 
 if __name__ == "__main__":
+    providers.use_cassette_args("Reconcile portfolio YTD with the sum of ticker contributions.")
     debug_ytd_sum()
@@ -0,0 +1,148 @@
+"""
+Logging setup and the in-memory diagnostics buffer.
+
+Every backend module logs to a child of the `alpha` logger. `setup_logging()`
+routes that logger through a QueueHandler, so the calling (request) thread only
+enqueues the record; a QueueListener thread writes it to stdout and into a
+bounded ring buffer. `recent()` reads the buffer for /api/diagnostics.
+
+Levels come from the environment:
+  ALPHA_LOG_LEVEL          console level (default INFO)
+  ALPHA_DIAGNOSTICS_LEVEL  ring buffer level (default DEBUG, so YTD values etc. are kept)
+"""
+import atexit
+import copy
+import logging
+import logging.handlers
+import math
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+ROOT_LOGGER = 'alpha'
+BUFFER_CAPACITY = 1000
+CONSOLE_FORMAT = '%(asctime)s %(levelname)-7s %(name)s: %(message)s'
+
+# Attributes every LogRecord has; anything else came in through `extra=` and is kept as context
+_STANDARD_ATTRS = set(logging.LogRecord('', 0, '', 0, '', None, None).__dict__) | {'message', 'asctime'}
+
+_setup_lock = threading.Lock()
+_listener = None
+_buffer = None
+
+
+def _json_safe(value):
+    """Context value as something the JSON encoder accepts (NaN/Inf -> None, other objects -> str)."""
+    if isinstance(value, float):
+        return float(value) if math.isfinite(value) else None
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    return str(value)
+
+
+def get_logger(name):
+    """Logger for a backend module: get_logger('risk') -> 'alpha.risk'."""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Formats the message on the calling thread but keeps the traceback apart (exc_text) for the buffer."""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+
+class RingBufferHandler(logging.Handler):
+    """Keeps the last `capacity` records as JSON-ready dicts, plus per-level totals."""
+
+    def __init__(self, capacity=BUFFER_CAPACITY, level=logging.NOTSET):
+        super().__init__(level)
+        self.records = deque(maxlen=capacity)
+        self.totals = Counter()
+
+    def emit(self, record):
+        try:
+            entry = {
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f".{int(record.msecs):03d}",
+                'level': record.levelname,
+                'logger': record.name.removeprefix(ROOT_LOGGER + '.'),
+                'message': record.getMessage(),
+            }
+            context = {k: _json_safe(v) for k, v in record.__dict__.items() if k not in _STANDARD_ATTRS}
+            if context:
+                entry['context'] = context
+            if record.exc_text:
+                entry['exception'] = record.exc_text
+            with self.lock:
+                self.records.append(entry)
+                self.totals[record.levelname] += 1
+        except Exception:
+            self.handleError(record)
+
+
+def _level(env_var, default):
+    value = os.environ.get(env_var, default).upper()
+    level = logging.getLevelName(value)
+    return level if isinstance(level, int) else logging.getLevelName(default)
+
+
+def setup_logging(console_level=None, buffer_level=None):
+    """Install the queue handler on the `alpha` logger (idempotent). Returns the ring buffer."""
+    global _listener, _buffer
+    with _setup_lock:
+        if _listener is not None:
+            return _buffer
+
+        console_level = console_level or _level('ALPHA_LOG_LEVEL', 'INFO')
+        buffer_level = buffer_level or _level('ALPHA_DIAGNOSTICS_LEVEL', 'DEBUG')
+
+        console = logging.StreamHandler(sys.stdout)
+        console.setLevel(console_level)
+        console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+        _buffer = RingBufferHandler(level=buffer_level)
+
+        log_queue = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(log_queue, console, _buffer, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(min(console_level, buffer_level))
+        root.addHandler(_QueueHandler(log_queue))
+        root.propagate = False
+        return _buffer
+
+
+def recent(level=None, logger=None, limit=None):
+    """
+    Buffered records, oldest first, optionally filtered by minimum `level`
+    (name or number) and `logger` prefix ('risk', 'data_store', ...).
+    """
+    if _buffer is None:
+        return []
+    min_level = logging.getLevelName(level.upper()) if isinstance(level, str) else (level or 0)
+    if not isinstance(min_level, int):
+        raise ValueError(f"Unknown log level '{level}'")
+    with _buffer.lock:
+        records = list(_buffer.records)
+    records = [
+        r for r in records
+        if logging.getLevelName(r['level']) >= min_level and (logger is None or r['logger'].startswith(logger))
+    ]
+    return records[-limit:] if limit else records
+
+
+def summary():
+    """Buffer capacity/size and per-level totals since startup."""
+    if _buffer is None:
+        return {'capacity': 0, 'buffered': 0, 'totals': {}}
+    with _buffer.lock:
+        return {'capacity': _buffer.records.maxlen, 'buffered': len(_buffer.records), 'totals': dict(_buffer.totals)}
@@ -0,0 +1,97 @@
+"""
+Time-series downsampling for chart payloads.
+
+Largest-Triangle-Three-Buckets (LTTB) keeps the points that carry the most
+visual information, so peaks and drawdown troughs survive even when six years
+of daily bars are reduced to a few hundred points for a phone screen.
+"""
+import numpy as np
+import pandas as pd
+
+# Named resolutions accepted by the API (target points; None = every bar)
+RESOLUTIONS = {
+    'full': None,
+    'high': 1500,
+    'medium': 600,
+    'low': 250,
+}
+MIN_POINTS = 3
+# Larger point requests are clamped, so client-chosen values map to a bounded set of cached variants
+MAX_POINTS = 5000
+
+
+def lttb_indices(y, n_out, x=None):
+    """
+    Indices of the `n_out` points LTTB selects from `y`. The first and last points
+    are always kept. NaNs are forward-filled for the selection only.
+    """
+    y = pd.Series(np.asarray(y, dtype=float)).ffill().fillna(0.0).to_numpy()
+    n = len(y)
+    if n_out >= n or n_out < MIN_POINTS:
+        return np.arange(n)
+    x = np.arange(n, dtype=float) if x is None else np.asarray(x, dtype=float)
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    # Interior points are split into n_out - 2 buckets
+    every = (n - 2) / (n_out - 2)
+    a = 0
+    for i in range(n_out - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+
+        # Average of the next bucket (or the last point) is the third triangle vertex
+        next_start = end
+        next_end = min(int((i + 2) * every) + 1, n)
+        if next_start >= next_end:
+            avg_x, avg_y = x[n - 1], y[n - 1]
+        else:
+            avg_x = x[next_start:next_end].mean()
+            avg_y = y[next_start:next_end].mean()
+
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+
+    return selected
+
+
+def downsample_frame(df, n_out, value_columns):
+    """
+    Downsample a row-per-date DataFrame to about `n_out` rows. The point budget
+    is split across `value_columns` and the LTTB picks of each column are merged,
+    so extremes of every series are kept.
+    """
+    if n_out is None or len(df) <= n_out:
+        return df
+    value_columns = [c for c in value_columns if c in df.columns]
+    if not value_columns:
+        return df
+
+    per_column = max(MIN_POINTS, n_out // len(value_columns))
+    picks = [lttb_indices(df[col].to_numpy(dtype=float), per_column) for col in value_columns]
+    keep = np.unique(np.concatenate(picks))
+    return df.iloc[keep].reset_index(drop=True)
+
+
+def resolve_points(points=None, resolution=None, rows=None):
+    """
+    Target point count from the `points=` / `resolution=` query parameters,
+    clamped to MAX_POINTS. Returns None for full resolution, which includes any
+    count of at least `rows` (the longest series); raises ValueError for bad input.
+    """
+    if points is not None:
+        if points < MIN_POINTS:
+            raise ValueError(f"points must be at least {MIN_POINTS}")
+        points = min(points, MAX_POINTS)
+        return None if rows is not None and points >= rows else points
+    if resolution is not None:
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unsupported resolution '{resolution}'. Use one of: {', '.join(RESOLUTIONS)}")
+        return RESOLUTIONS[resolution]
+    return None
@@ -0,0 +1,486 @@
+"""
+Intraday mode: portfolio value, drawdown, realized volatility and exposure
+updated bar by bar from a minute-bar feed.
+
+The daily panel (data_store) is the base: each session starts from the last
+daily close before the session date, the portfolio value and drawdown peak of
+the daily history, and the house book's weights. Every bar then only touches
+the symbols it carries; nothing of the daily history is recomputed.
+
+Feeds implement one call,
+
+    bars(symbols, closes, stop) -> iterator of (timestamp, {symbol: price})
+
+where `closes` are the previous session's closes (a starting point for
+synthetic feeds) and `stop` is a threading.Event that ends the feed. The feed
+is chosen with ALPHA_INTRADAY_FEED:
+
+  yfinance              polls Yahoo Finance 1-minute bars (default)
+  replay:<file>         a recorded session (.csv / .parquet), see ReplayFeed
+  synthetic[:<seed>]    deterministic minute-bar GBM from the last closes, no network
+
+Replayed and synthetic sessions are paced at ALPHA_INTRADAY_SPEED bar
+minutes per wall second (0 = as fast as possible).
+
+The server starts the session on the first /api/intraday request and pushes
+every bar on /api/intraday/stream. Each worker process runs its own feed.
+
+Usage:
+    python backend/intraday.py --feed replay:session.csv --base PLN
+    python backend/intraday.py --feed synthetic:1 --speed 0 --write session.csv
+"""
+import argparse
+import os
+import threading
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+import data_store
+import diagnostics
+import providers
+import risk
+import telemetry
+
+log = diagnostics.get_logger('intraday')
+
+# Minute bars in a regular US session, and trading days per year, to annualize realized vol
+BARS_PER_DAY = 390
+ANNUAL_FACTOR = 252
+# Seconds between Yahoo polls; Yahoo publishes 1-minute bars
+POLL_SECONDS = 60
+# Replayed / synthetic bar minutes per wall second (60 = one bar per second)
+REPLAY_SPEED = 60.0
+# Same base as the daily history curve (server.format_history)
+HISTORY_BASE = 1000
+
+
+def _wait(stop, seconds):
+    """Sleep `seconds` unless `stop` is set first. True if the feed should end."""
+    if seconds > 0:
+        return stop.wait(seconds)
+    return stop.is_set()
+
+
+def _paced(frame, speed, stop):
+    """Yield the rows of a bar frame, sleeping between timestamps at `speed` bar minutes per second."""
+    previous = None
+    for timestamp, row in zip(frame.index, frame.to_numpy(dtype=float)):
+        if previous is not None and speed > 0 and \
+                _wait(stop, (timestamp - previous).total_seconds() / 60.0 / speed):
+            return
+        if stop.is_set():
+            return
+        previous = timestamp
+        valid = np.isfinite(row)
+        yield timestamp, dict(zip(frame.columns[valid], row[valid]))
+
+
+# ==========================================
+# Feeds
+# ==========================================
+class YFinanceFeed:
+    """Polls today's 1-minute bars and yields the ones newer than the last poll."""
+    name = 'yfinance'
+
+    def __init__(self, poll_seconds=POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+
+    def bars(self, symbols, closes, stop):
+        import yfinance as yf  # Deferred: importing the server shouldn't load it
+        last = None
+        while not stop.is_set():
+            try:
+                data = yf.download(symbols, period='1d', interval='1m', progress=False,
+                                   threads=False, auto_adjust=True)
+            except Exception:
+                data = None
+                telemetry.inc('alpha_fetch_failures_total', kind='intraday')
+                log.exception("Intraday download failed")
+            if data is not None and not data.empty:
+                close = data['Close']
+                if isinstance(close, pd.Series):
+                    close = close.to_frame(symbols[0])
+                if close.index.tz is not None:
+                    close.index = close.index.tz_convert('UTC').tz_localize(None)
+                if last is not None:
+                    close = close[close.index > last]
+                if not close.empty:
+                    last = close.index[-1]
+                yield from _paced(close, 0, stop)
+            if _wait(stop, self.poll_seconds):
+                return
+
+
+class ReplayFeed:
+    """
+    A recorded session: a CSV or Parquet file with a `timestamp` column and one
+    price column per symbol, or long rows of (timestamp, symbol, close). Empty
+    cells mean no bar for that symbol in that minute.
+    """
+    name = 'replay'
+
+    def __init__(self, path, speed=REPLAY_SPEED):
+        self.path = path
+        self.speed = speed
+
+    def load(self):
+        frame = pd.read_parquet(self.path) if self.path.endswith('.parquet') else pd.read_csv(self.path)
+        frame.columns = [str(c) for c in frame.columns]
+        frame['timestamp'] = pd.to_datetime(frame['timestamp'])
+        if 'symbol' in frame.columns:
+            frame = frame.pivot_table(index='timestamp', columns='symbol', values='close', aggfunc='last')
+        else:
+            frame = frame.set_index('timestamp')
+        if frame.index.tz is not None:
+            frame.index = frame.index.tz_convert('UTC').tz_localize(None)
+        return frame.sort_index().astype(float)
+
+    def bars(self, symbols, closes, stop):
+        frame = self.load()
+        yield from _paced(frame[[s for s in frame.columns if s in set(symbols)]], self.speed, stop)
+
+    @staticmethod
+    def save(path, bars):
+        """Write (timestamp, {symbol: price}) bars as a wide replay file (.parquet or .csv)."""
+        frame = pd.DataFrame([prices for _, prices in bars],
+                             index=pd.DatetimeIndex([t for t, _ in bars], name='timestamp'))
+        if path.endswith('.parquet'):
+            frame.reset_index().to_parquet(path, index=False)
+        else:
+            frame.to_csv(path)
+
+
+class SyntheticFeed:
+    """
+    One session of correlated minute-bar GBM for today, starting from the last
+    daily closes. Deterministic per seed, symbol and date; FX pairs ('=X')
+    move independently at a lower volatility.
+    """
+    name = 'synthetic'
+
+    def __init__(self, seed=0, speed=REPLAY_SPEED, bars=BARS_PER_DAY, correlation=0.3,
+                 annual_vol=0.3, fx_vol=0.08):
+        self.seed = seed
+        self.speed = speed
+        self.n_bars = bars
+        self.correlation = correlation
+        self.annual_vol = annual_vol
+        self.fx_vol = fx_vol
+
+    def _rng(self, *key):
+        return np.random.default_rng([self.seed] + [zlib.crc32(str(k).encode('utf-8')) for k in key])
+
+    def frame(self, closes, day):
+        """The session of `day` as a bar frame, one column per symbol with a close."""
+        symbols = [s for s, price in closes.items() if np.isfinite(price) and price > 0]
+        index = pd.date_range(pd.Timestamp(day) + pd.Timedelta(hours=13, minutes=30),
+                              periods=self.n_bars, freq='min', name='timestamp')
+        scale = 1 / np.sqrt(ANNUAL_FACTOR * BARS_PER_DAY)
+        date_key = pd.Timestamp(day).strftime('%Y%m%d')
+        market = self._rng('market', date_key).standard_normal(self.n_bars)
+        paths = {}
+        for symbol in symbols:
+            own = self._rng(symbol, date_key).standard_normal(self.n_bars)
+            if symbol.endswith('=X'):
+                shocks = own * self.fx_vol * scale
+            else:
+                rho = self.correlation
+                shocks = (np.sqrt(rho) * market + np.sqrt(1 - rho) * own) * self.annual_vol * scale
+            paths[symbol] = closes[symbol] * np.exp(np.cumsum(shocks))
+        return pd.DataFrame(paths, index=index)
+
+    def bars(self, symbols, closes, stop):
+        day = pd.Timestamp(providers.now()).normalize()
+        yield from _paced(self.frame({s: closes.get(s, np.nan) for s in symbols}, day), self.speed, stop)
+
+
+FEEDS = {'yfinance': YFinanceFeed, 'replay': ReplayFeed, 'synthetic': SyntheticFeed}
+
+
+def from_spec(spec, speed=None):
+    """Feed for a spec such as 'yfinance', 'replay:session.csv' or 'synthetic:42'."""
+    if speed is None:
+        speed = float(os.environ.get('ALPHA_INTRADAY_SPEED', REPLAY_SPEED))
+    name, _, arg = spec.partition(':')
+    if name not in FEEDS:
+        raise ValueError(f"Unknown intraday feed '{name}'. Use one of: {', '.join(FEEDS)}")
+    if name == 'replay':
+        if not arg:
+            raise ValueError("The replay feed needs a file: replay:<file.csv|.parquet>")
+        return ReplayFeed(arg, speed)
+    if name == 'synthetic':
+        return SyntheticFeed(seed=int(arg) if arg else 0, speed=speed)
+    return YFinanceFeed()
+
+
+# ==========================================
+# Incremental book
+# ==========================================
+class IntradayBook:
+    """
+    The house book marked to the latest bar, in every reporting currency.
+
+    Returns are measured from the previous session's close, in the same
+    weighted-return convention as calculate_risk_metrics (an asset missing
+    from the daily panel contributes nothing, a symbol without a bar yet is
+    flat). The value continues the daily history curve, so `drawdown` is
+    measured from its peak; the intraday figures from the session's high.
+    """
+
+    def __init__(self, portfolio=None, bases=None):
+        portfolio = portfolio or risk.PORTFOLIO_CONFIG
+        self.bases = list(bases or risk.REPORTING_CURRENCIES)
+        self.tickers = list(portfolio)
+        self.weights = np.array([info['weight'] * (1 if info['type'] == 'Long' else -1)
+                                 for info in portfolio.values()], dtype=float)
+        holding_currencies = [info['currency'] for info in portfolio.values()]
+        self.currencies = sorted(set(holding_currencies + self.bases + [risk.BASE_CURRENCY]))
+        pairs = [f"{c}{risk.BASE_CURRENCY}=X" for c in self.currencies if c != risk.BASE_CURRENCY]
+        self.symbols = self.tickers + [risk.BENCHMARK] + pairs
+        self._column = {symbol: i for i, symbol in enumerate(self.symbols)}
+        # Column of each currency's USD rate (-1: the base currency itself, always 1)
+        self._pair = np.array([self._column.get(f"{c}{risk.BASE_CURRENCY}=X", -1) for c in self.currencies])
+        self._holding_currency = np.array([self.currencies.index(c) for c in holding_currencies])
+        self._benchmark = self._column[risk.BENCHMARK]
+        self.day = None
+
+    def closes(self, day=None, panel=None):
+        """Last daily close of every symbol before `day` (default: today on the provider's clock)."""
+        day = pd.Timestamp(day if day is not None else providers.now()).normalize()
+        panel = panel or data_store.get_panel()
+        frame = pd.concat([panel['raw_prices'], panel['fx_rates']], axis=1)
+        frame = frame.loc[:, ~frame.columns.duplicated()].reindex(columns=self.symbols)
+        before = frame[frame.index < day]
+        if before.empty:
+            return {symbol: np.nan for symbol in self.symbols}, None
+        return dict(zip(self.symbols, before.ffill().iloc[-1].to_numpy(dtype=float))), before.index[-1]
+
+    def open(self, day, panel=None):
+        """Start the session of `day` from the daily panel: previous closes, value and peak per base."""
+        panel = panel or data_store.get_panel()
+        closes, close_date = self.closes(day, panel)
+        self.day = pd.Timestamp(day).normalize()
+        self.close_date = close_date.strftime('%Y-%m-%d') if close_date is not None else None
+        self.previous = np.array([closes[s] for s in self.symbols], dtype=float)
+        self.previous[~(self.previous > 0)] = np.nan
+        self.last = self.previous.copy()
+        self.active = np.isfinite(self.previous[:len(self.tickers)])
+        for ticker in np.array(self.tickers)[~self.active]:
+            log.warning("No daily close for %s before %s. Left out of the intraday book.", ticker,
+                        self.day.date(), extra={'ticker': ticker})
+        self.bar_count = 0
+        self.tracks = {}
+        for base in self.bases:
+            metrics = data_store.get_risk_metrics(base, panel)
+            value = peak = float(HISTORY_BASE)
+            if metrics is not None:
+                returns = metrics['Returns_Stream']
+                curve = (1 + returns[returns.index < self.day]).cumprod() * HISTORY_BASE
+                if not curve.empty:
+                    value, peak = float(curve.iloc[-1]), float(curve.max())
+            self.tracks[base] = {
+                'previous_value': value, 'value': value, 'peak': max(peak, value), 'high': value,
+                'max_intraday_drawdown': 0.0, 'sum_sq': 0.0, 'moves': 0, 'path': [],
+            }
+        log.info("Intraday session %s opened from the %s close", self.day.date(), self.close_date)
+
+    def update(self, timestamp, prices):
+        """Apply one bar and return the snapshot per base currency."""
+        timestamp = pd.Timestamp(timestamp)
+        if self.day is None or timestamp.normalize() != self.day:
+            self.open(timestamp.normalize())
+        for symbol, price in prices.items():
+            column = self._column.get(symbol)
+            if column is not None and np.isfinite(price) and price > 0:
+                self.last[column] = price
+        self.bar_count += 1
+        self.timestamp = timestamp
+
+        relative = self.last / self.previous
+        relative[~np.isfinite(relative)] = 1.0
+        currency_relative = np.where(self._pair >= 0, relative[self._pair], 1.0)
+        holding_relative = np.where(self.active, relative[:len(self.tickers)], 1.0)
+        return {base: self._mark(base, holding_relative, currency_relative, relative) for base in self.bases}
+
+    def _mark(self, base, holding_relative, currency_relative, relative):
+        base_relative = currency_relative[self.currencies.index(base)]
+        growth = holding_relative * currency_relative[self._holding_currency] / base_relative
+        weights = np.where(self.active, self.weights, 0.0)
+        portfolio_return = float(weights @ (growth - 1))
+        benchmark_return = float(relative[self._benchmark] / base_relative - 1)
+
+        track = self.tracks[base]
+        value = track['previous_value'] * (1 + portfolio_return)
+        if self.bar_count > 1 and value > 0 and track['value'] > 0:
+            # Bar-to-bar moves only: the overnight gap into the first bar is not intraday vol
+            track['sum_sq'] += np.log(value / track['value']) ** 2
+            track['moves'] += 1
+        track['value'] = value
+        track['peak'] = max(track['peak'], value)
+        track['high'] = max(track['high'], value)
+        intraday_drawdown = value / track['high'] - 1
+        track['max_intraday_drawdown'] = min(track['max_intraday_drawdown'], intraday_drawdown)
+        drawdown = value / track['peak'] - 1
+        realized_vol = np.sqrt(track['sum_sq'] / track['moves'] * BARS_PER_DAY * ANNUAL_FACTOR) \
+            if track['moves'] else None
+        track['path'].append((self.timestamp, value, portfolio_return, benchmark_return, drawdown, intraday_drawdown))
+
+        # Weights drift with prices: exposure as a share of today's equity
+        exposure = weights * growth / (1 + portfolio_return)
+        gross = np.abs(exposure)
+        currency_gross = np.bincount(self._holding_currency, gross, minlength=len(self.currencies))
+        return {
+            "time": self.timestamp.isoformat(),
+            "sessionDate": self.day.strftime('%Y-%m-%d'),
+            "previousClose": self.close_date,
+            "baseCurrency": base,
+            "bars": self.bar_count,
+            "value": value,
+            "previousValue": track['previous_value'],
+            "return": portfolio_return,
+            "benchmarkReturn": benchmark_return,
+            "drawdown": drawdown,
+            "intradayDrawdown": intraday_drawdown,
+            "intradayMaxDrawdown": track['max_intraday_drawdown'],
+            "realizedVol": realized_vol,
+            "leverage": {
+                'Long_Exp': float(exposure[exposure > 0].sum()),
+                'Short_Exp': float(-exposure[exposure < 0].sum()),
+                'Gross_Exp': float(gross.sum()),
+                'Net_Exp': float(exposure.sum()),
+            },
+            "currencyExposure": {
+                currency: float(currency_gross[i] / gross.sum())
+                for i, currency in enumerate(self.currencies) if currency_gross[i] > 0
+            } if gross.sum() > 0 else {},
+            "positions": pd.DataFrame({
+                "ticker": self.tickers,
+                "return": growth - 1,
+                "exposure": exposure,
+            })[self.active].reset_index(drop=True),
+        }
+
+    def path(self, base):
+        """The session so far, one row per bar."""
+        return pd.DataFrame(
+            self.tracks[base]['path'] if self.day is not None else [],
+            columns=["time", "value", "return", "benchmarkReturn", "drawdown", "intradayDrawdown"],
+        ).assign(time=lambda f: pd.to_datetime(f["time"]).dt.strftime('%Y-%m-%dT%H:%M:%S'))
+
+
+# ==========================================
+# Live session
+# ==========================================
+_lock = threading.RLock()
+_updated = threading.Condition(_lock)
+_session = None
+_state = {'seq': 0, 'snapshots': {}, 'status': 'stopped', 'feed': None, 'error': None}
+
+
+def start(feed=None):
+    """
+    Run `feed` (default ALPHA_INTRADAY_FEED) into a new book on a daemon
+    thread. Once per process: a finished replay keeps its last snapshot, only a
+    failed feed is restarted.
+    """
+    global _session
+    with _lock:
+        if _session is not None and _state['status'] != 'failed':
+            return _session
+        if feed is None:
+            feed = from_spec(os.environ.get('ALPHA_INTRADAY_FEED', 'yfinance'))
+        elif isinstance(feed, str):
+            feed = from_spec(feed)
+        book = IntradayBook()
+
+        def _run():
+            try:
+                closes, _ = book.closes()
+                for timestamp, prices in feed.bars(book.symbols, closes, threading.Event()):
+                    with _lock, telemetry.stage('intraday_bar'):
+                        _state.update(seq=_state['seq'] + 1, snapshots=book.update(timestamp, prices))
+                        _updated.notify_all()
+                    telemetry.inc('alpha_intraday_bars_total', feed=feed.name)
+                status, error = 'finished', None
+            except Exception as e:
+                telemetry.inc('alpha_fetch_failures_total', kind='intraday')
+                log.exception("Intraday feed %s failed", feed.name)
+                status, error = 'failed', str(e)
+            with _lock:
+                _state.update(seq=_state['seq'] + 1, status=status, error=error)
+                _updated.notify_all()
+
+        _state.update(status='running', feed=feed.name, error=None, snapshots={})
+        log.info("Intraday feed: %s", feed.name)
+        _session = threading.Thread(target=_run, name="intraday-feed", daemon=True)
+        _session.book = book
+        _session.start()
+        return _session
+
+
+def current(base, since=0, session_date=None):
+    """
+    (sequence number, payload) for `base`: the latest snapshot and the
+    session's bars from number `since` on. A client still on an older
+    `session_date` gets the whole session.
+    """
+    with _lock:
+        seq, snapshot = _state['seq'], _state['snapshots'].get(base)
+        payload = {"status": _state['status'], "feed": _state['feed'], "error": _state['error'],
+                   "intraday": snapshot}
+        if snapshot is not None:
+            if snapshot["sessionDate"] != session_date:
+                since = 0
+            payload["path"] = _session.book.path(base).iloc[since:].reset_index(drop=True)
+    return seq, payload
+
+
+def wait_for_bar(seq, timeout=None):
+    """Block until the sequence number moves past `seq` (a new bar or the feed ending). The new seq, or None on timeout."""
+    with _updated:
+        if _updated.wait_for(lambda: _state['seq'] != seq, timeout):
+            return _state['seq']
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--feed", default=os.environ.get('ALPHA_INTRADAY_FEED', 'yfinance'),
+                        help="yfinance, replay:<file> or synthetic[:seed]")
+    parser.add_argument("--base", default=risk.BASE_CURRENCY, help="reporting currency of the printed bars")
+    parser.add_argument("--speed", type=float, default=None,
+                        help="replay / synthetic bar minutes per second (0 = no pacing)")
+    parser.add_argument("--write", metavar="FILE", help="also save the received bars as a replay file")
+    args = parser.parse_args(argv)
+
+    base = args.base.upper()
+    if base not in risk.REPORTING_CURRENCIES:
+        parser.error(f"Unsupported base currency '{base}'. Use one of: {', '.join(risk.REPORTING_CURRENCIES)}")
+    feed = from_spec(args.feed, args.speed)
+    book = IntradayBook()
+    closes, _ = book.closes()
+    received = []
+    started = time.perf_counter()
+    try:
+        for timestamp, prices in feed.bars(book.symbols, closes, threading.Event()):
+            snapshot = book.update(timestamp, prices)[base]
+            received.append((timestamp, prices))
+            vol = snapshot['realizedVol']
+            print(f"{snapshot['time']}  value {snapshot['value']:10.2f}  return {snapshot['return']:+8.3%}  "
+                  f"drawdown {snapshot['drawdown']:+8.3%}  intraday {snapshot['intradayDrawdown']:+8.3%}  "
+                  f"vol {'-' if vol is None else f'{vol:.1%}':>6}  gross {snapshot['leverage']['Gross_Exp']:.3f}")
+    except KeyboardInterrupt:
+        pass
+    elapsed = time.perf_counter() - started
+    print(f"{len(received)} bars in {elapsed:.2f}s")
+    if args.write and received:
+        ReplayFeed.save(args.write, received)
+        print(f"Saved {args.write}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
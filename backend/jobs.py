@@ -0,0 +1,401 @@
+"""
+Asynchronous analytics jobs.
+
+Heavy requests (large Monte Carlo runs, bootstrap studies, multi-portfolio
+comparisons) are submitted as a spec, run on a bounded worker pool against the
+cached market data panel, and polled for status/progress. The job id is a hash
+of the spec and the data version, so identical submissions share one run and
+its result.
+
+Spec format:
+    {
+        "kind": "montecarlo" | "bootstrap" | "compare",
+        "base": "USD",                 # optional reporting currency
+        "portfolio": {...},            # optional, PORTFOLIO_CONFIG schema
+        "params": {...}                # kind-specific, see JOB_KINDS
+    }
+"""
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import batch
+import data_store
+import diagnostics
+import risk
+import telemetry
+
+log = diagnostics.get_logger('jobs')
+
+MAX_WORKERS = 2
+MAX_JOBS_KEPT = 200                 # Finished jobs beyond this are forgotten, oldest first
+MAX_MC_CELLS = 25_000_000           # num_sims * days cap (~100MB of float32 paths)
+MAX_BOOTSTRAP_CELLS = 25_000_000    # num_samples * horizon cap
+MC_CHUNK_SIMS = 5000
+BOOTSTRAP_CHUNK_SAMPLES = 1000
+PERCENTILES = [1, 5, 25, 50, 75, 95, 99]
+ANNUAL_FACTOR = 252
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="job")
+_lock = threading.Lock()
+_jobs = {}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# ==========================================
+# Job kinds
+# ==========================================
+def _int_param(params, name, default, low, high):
+    value = params.get(name, default)
+    if isinstance(value, bool) or not isinstance(value, int) or not low <= value <= high:
+        raise ValueError(f"params.{name} must be an integer between {low} and {high}")
+    return value
+
+
+def _union_portfolio(portfolios):
+    """
+    batch.union_portfolio of `portfolios`, also rejecting tickers the house book
+    quotes in another currency: the cached panel converted them with its currency.
+    """
+    union = batch.union_portfolio(portfolios)
+    for ticker, info in union.items():
+        house = risk.PORTFOLIO_CONFIG.get(ticker)
+        if house is not None and house['currency'] != info['currency']:
+            raise ValueError(f"{ticker} is quoted in {house['currency']} in the house portfolio and {info['currency']} "
+                             f"in the job's portfolio")
+    return union
+
+
+def _job_market(portfolios, base, panel):
+    """
+    (prices in `base`, FX rates) covering every ticker of `portfolios`. Tickers
+    and currencies the cached panel lacks are fetched like batch.py does and
+    joined onto it; raises ValueError naming tickers that still have no prices.
+    """
+    union = _union_portfolio(portfolios)
+    usd_prices, fx_rates = panel['usd_prices'], panel['fx_rates']
+    missing = {
+        ticker: info for ticker, info in union.items()
+        if ticker not in usd_prices.columns
+        or (info['currency'] != risk.BASE_CURRENCY
+            and f"{info['currency']}{risk.BASE_CURRENCY}=X" not in fx_rates.columns)
+    }
+    if not missing:
+        return data_store.get_prices(base, panel), fx_rates
+
+    log.info("Fetching %d ticker(s) missing from the panel: %s", len(missing), ', '.join(missing))
+    raw_prices, fetched_fx, _ = risk.fetch_data(missing)
+    fx_rates = fx_rates.combine_first(fetched_fx[fetched_fx.columns.difference(fx_rates.columns)])
+    fetched = [ticker for ticker in missing if ticker in raw_prices.columns]
+    extra = risk.normalize_to_base_currency(raw_prices[fetched], fx_rates, missing)
+    usd_prices = pd.concat(
+        [usd_prices.drop(columns=fetched, errors='ignore'), extra.reindex(usd_prices.index)], axis=1
+    )
+
+    unavailable = [ticker for ticker in union if ticker not in usd_prices.columns or usd_prices[ticker].isna().all()]
+    if unavailable:
+        raise ValueError(f"No price data for ticker(s): {', '.join(unavailable)}")
+    return risk.rebase_to_currency(usd_prices, fx_rates, base), fx_rates
+
+
+def _job_metrics(spec, panel):
+    """Risk metrics for the spec's portfolio (cached house book when none is given)."""
+    base = spec.get('base', risk.BASE_CURRENCY)
+    if spec.get('portfolio') is None:
+        metrics = data_store.get_risk_metrics(base, panel)
+    else:
+        prices, fx_rates = _job_market({'portfolio': spec['portfolio']}, base, panel)
+        metrics = risk.calculate_risk_metrics(
+            prices, None, fx_rates, base_currency=base, portfolio=spec['portfolio']
+        )
+    if metrics is None:
+        raise ValueError("Insufficient data to calculate metrics for this portfolio")
+    return metrics
+
+
+def validate_montecarlo(params):
+    num_sims = _int_param(params, 'num_sims', 10000, 1, MAX_MC_CELLS)
+    days = _int_param(params, 'days', 252, 1, 2520)
+    if num_sims * days > MAX_MC_CELLS:
+        raise ValueError(f"num_sims * days must not exceed {MAX_MC_CELLS}")
+
+
+def run_montecarlo(spec, panel, report):
+    """GBM cone from risk.run_monte_carlo, simulated in chunks for progress/cancel."""
+    params = spec.get('params', {})
+    num_sims = params.get('num_sims', 10000)
+    days = params.get('days', 252)
+    metrics = _job_metrics(spec, panel)
+
+    paths = np.empty((num_sims, days + 1), dtype=np.float32)
+    done = 0
+    while done < num_sims:
+        n = min(MC_CHUNK_SIMS, num_sims - done)
+        paths[done:done + n] = risk.run_monte_carlo(metrics, num_sims=n, days=days)
+        done += n
+        report(done / num_sims)
+
+    bands = np.percentile(paths, PERCENTILES, axis=0)
+    cone = pd.DataFrame({'day': np.arange(days + 1)})
+    for i, p in enumerate(PERCENTILES):
+        cone[f"p{p:02d}"] = bands[i]
+
+    terminal = paths[:, -1].astype(float)
+    return {
+        'monteCarlo': cone,
+        'terminal': {
+            'mean': terminal.mean(),
+            'probLoss': (terminal < 1.0).mean(),
+            'var95': 1.0 - np.percentile(terminal, 5),
+            'cvar95': 1.0 - terminal[terminal <= np.percentile(terminal, 5)].mean(),
+        },
+        'numSims': num_sims,
+        'days': days,
+    }
+
+
+def validate_bootstrap(params):
+    num_samples = _int_param(params, 'num_samples', 1000, 1, MAX_BOOTSTRAP_CELLS)
+    horizon = _int_param(params, 'horizon', 252, 2, 2520 * 4)
+    _int_param(params, 'block_size', 21, 1, 252)
+    if num_samples * horizon > MAX_BOOTSTRAP_CELLS:
+        raise ValueError(f"num_samples * horizon must not exceed {MAX_BOOTSTRAP_CELLS}")
+
+
+def run_bootstrap(spec, panel, report):
+    """
+    Moving-block bootstrap of the daily portfolio return stream: distribution of
+    annual return, volatility, Sharpe, total return and max drawdown over `horizon`.
+    """
+    params = spec.get('params', {})
+    num_samples = params.get('num_samples', 1000)
+    horizon = params.get('horizon', 252)
+    block_size = params.get('block_size', 21)
+    metrics = _job_metrics(spec, panel)
+
+    returns = metrics['Returns_Stream'].dropna().to_numpy()
+    if len(returns) < block_size + 1:
+        raise ValueError("Return history is shorter than the bootstrap block size")
+    rf_rate = metrics.get('Risk_Free_Rate', 0.0)
+
+    rng = np.random.default_rng()
+    n_blocks = -(-horizon // block_size)
+    offsets = np.arange(block_size)
+    stats = {name: [] for name in ('annualReturn', 'annualVol', 'sharpe', 'totalReturn', 'maxDrawdown')}
+
+    done = 0
+    while done < num_samples:
+        n = min(BOOTSTRAP_CHUNK_SAMPLES, num_samples - done)
+        starts = rng.integers(0, len(returns) - block_size + 1, size=(n, n_blocks))
+        idx = (starts[:, :, None] + offsets).reshape(n, -1)[:, :horizon]
+        sample = returns[idx]
+
+        ann_ret = sample.mean(axis=1) * ANNUAL_FACTOR
+        ann_vol = sample.std(axis=1) * np.sqrt(ANNUAL_FACTOR)
+        cum = np.cumprod(1 + sample, axis=1)
+        drawdown = cum / np.maximum.accumulate(cum, axis=1) - 1
+
+        stats['annualReturn'].append(ann_ret)
+        stats['annualVol'].append(ann_vol)
+        stats['sharpe'].append(np.divide(ann_ret - rf_rate, ann_vol, out=np.zeros_like(ann_ret), where=ann_vol > 0))
+        stats['totalReturn'].append(cum[:, -1] - 1)
+        stats['maxDrawdown'].append(drawdown.min(axis=1))
+
+        done += n
+        report(done / num_samples)
+
+    rows = []
+    for name, chunks in stats.items():
+        values = np.concatenate(chunks)
+        row = {'stat': name, 'mean': values.mean()}
+        for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+            row[f"p{p:02d}"] = v
+        rows.append(row)
+    return {
+        'distribution': pd.DataFrame(rows),
+        'numSamples': num_samples,
+        'horizon': horizon,
+        'blockSize': block_size,
+    }
+
+
+def validate_compare(params):
+    portfolios = params.get('portfolios')
+    if not isinstance(portfolios, dict) or not portfolios:
+        raise ValueError("params.portfolios must map portfolio names to PORTFOLIO_CONFIG-style definitions")
+    for name, config in portfolios.items():
+        try:
+            risk.validate_portfolio_config(config)
+        except ValueError as e:
+            raise ValueError(f"Portfolio '{name}': {e}")
+    _union_portfolio(portfolios)
+
+
+def run_compare(spec, panel, report):
+    """Headline vitals for several portfolios on the same cached panel (plus any tickers it lacks)."""
+    base = spec.get('base', risk.BASE_CURRENCY)
+    portfolios = spec['params']['portfolios']
+    prices, fx_rates = _job_market(portfolios, base, panel)
+
+    rows = []
+    for i, (name, config) in enumerate(portfolios.items()):
+        metrics = risk.calculate_risk_metrics(prices, None, fx_rates, base_currency=base, portfolio=config)
+        rows.append(batch.vitals_row(name, metrics))
+        report((i + 1) / len(portfolios))
+    return {'portfolios': pd.DataFrame(rows)}
+
+
+# kind -> (params validator, runner)
+JOB_KINDS = {
+    'montecarlo': (validate_montecarlo, run_montecarlo),
+    'bootstrap': (validate_bootstrap, run_bootstrap),
+    'compare': (validate_compare, run_compare),
+}
+
+
+# ==========================================
+# Job lifecycle
+# ==========================================
+def validate_spec(spec):
+    """Normalized copy of a job spec; raises ValueError if it is malformed."""
+    if not isinstance(spec, dict):
+        raise ValueError("Job spec must be a JSON object")
+    kind = spec.get('kind')
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unknown job kind '{kind}'. Use one of: {', '.join(JOB_KINDS)}")
+
+    base = str(spec.get('base', risk.BASE_CURRENCY)).upper()
+    if base not in risk.REPORTING_CURRENCIES:
+        raise ValueError(f"Unsupported base currency '{base}'. Use one of: {', '.join(risk.REPORTING_CURRENCIES)}")
+
+    params = spec.get('params') or {}
+    if not isinstance(params, dict):
+        raise ValueError("params must be a JSON object")
+    portfolio = spec.get('portfolio')
+    if portfolio is not None:
+        risk.validate_portfolio_config(portfolio)
+        _union_portfolio({'portfolio': portfolio})
+
+    JOB_KINDS[kind][0](params)
+    return {'kind': kind, 'base': base, 'portfolio': portfolio, 'params': params}
+
+
+def spec_hash(spec, version_tag):
+    payload = json.dumps({'spec': spec, 'data': version_tag}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def describe(job):
+    """Public status view of a job (no result payload)."""
+    return {
+        'id': job['id'],
+        'kind': job['spec']['kind'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'dataVersion': job['data_version'],
+        'submittedAt': job['submitted_at'],
+        'startedAt': job['started_at'],
+        'finishedAt': job['finished_at'],
+        'error': job['error'],
+    }
+
+
+def _prune():
+    finished = [j for j in _jobs.values() if j['status'] in ('done', 'failed', 'cancelled')]
+    excess = len(_jobs) - MAX_JOBS_KEPT
+    for job in sorted(finished, key=lambda j: j['finished_at'] or 0)[:max(0, excess)]:
+        del _jobs[job['id']]
+
+
+def _run(job, panel):
+    if job['cancel'].is_set():
+        job['status'] = 'cancelled'
+        job['finished_at'] = time.time()
+        return
+
+    def report(fraction):
+        job['progress'] = round(min(max(fraction, 0.0), 1.0), 4)
+        if job['cancel'].is_set():
+            raise JobCancelled()
+
+    job['status'] = 'running'
+    job['started_at'] = time.time()
+    log.info("Job %s (%s) started", job['id'], job['spec']['kind'])
+    try:
+        with telemetry.stage(f"job_{job['spec']['kind']}"):
+            job['result'] = JOB_KINDS[job['spec']['kind']][1](job['spec'], panel, report)
+        job['progress'] = 1.0
+        job['status'] = 'done'
+    except JobCancelled:
+        job['status'] = 'cancelled'
+    except Exception as e:
+        log.exception("Job %s failed", job['id'], extra={'job': job['id']})
+        job['error'] = str(e)
+        job['status'] = 'failed'
+    job['finished_at'] = time.time()
+    log.info("Job %s %s in %.2fs", job['id'], job['status'], job['finished_at'] - job['started_at'])
+
+
+def submit(spec):
+    """
+    Queue a job. Returns (job, deduplicated): an identical spec against the same
+    data version that is queued, running or done is returned instead of re-run.
+    """
+    spec = validate_spec(spec)
+    panel = data_store.get_panel()
+    job_id = spec_hash(spec, panel['version_tag'])
+
+    with _lock:
+        existing = _jobs.get(job_id)
+        if existing is not None and existing['status'] in ('queued', 'running', 'done'):
+            return existing, True
+
+        job = {
+            'id': job_id,
+            'spec': spec,
+            'status': 'queued',
+            'progress': 0.0,
+            'data_version': panel['version_tag'],
+            'submitted_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'error': None,
+            'result': None,
+            'cancel': threading.Event(),
+        }
+        _jobs[job_id] = job
+        _prune()
+
+    job['future'] = _executor.submit(_run, job, panel)
+    return job, False
+
+
+def get(job_id):
+    with _lock:
+        return _jobs.get(job_id)
+
+
+def list_jobs():
+    with _lock:
+        return [describe(job) for job in _jobs.values()]
+
+
+def cancel(job_id):
+    """Request cancellation. Queued jobs never start; running jobs stop at their next progress report."""
+    job = get(job_id)
+    if job is None:
+        return None
+    if job['status'] in ('queued', 'running'):
+        job['cancel'].set()
+        if job.get('future') is not None and job['future'].cancel():
+            job['status'] = 'cancelled'
+            job['finished_at'] = time.time()
+    return job
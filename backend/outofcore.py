@@ -0,0 +1,581 @@
+"""
+Out-of-core risk statistics for long histories and large universes.
+
+A chunk store keeps a base-currency price panel on disk as date-ordered chunks
+(<dir>/chunk-00000.npy, one trading year each by default), every chunk a
+column-major float64 array opened memory-mapped, with the dates next to it
+(chunk-00000.index.npy) and the symbols and book in meta.json. The store is
+written one symbol batch at a time and read one chunk at a time, so neither
+step ever holds the full panel and history is not capped by LOOKBACK_YEARS.
+
+Statistics are folded over the chunks with partial aggregates that merge:
+
+  Moments        count / mean / M2..M4 per column (Pebay's pairwise update)
+  CoMoments      pairwise-complete co-moments of two column sets (covariance, beta, MCTR)
+  TailSketch     the k smallest values per column: exact VaR / CVaR at a fixed quantile
+  Drawdown       running value / peak / max drawdown (ordered: chunks merge left to right)
+  PeriodicWindow last 5y of observations and the year-end close per column (YTD / 1Y / 3Y / 5Y)
+
+Peak memory is one chunk plus the aggregates, whose size depends on the
+number of columns, except TailSketch: it keeps quantile x rows values, so it
+grows with history length (about 5% of one column of the panel at VaR 95).
+stream_risk() follows calculate_risk_metrics' definitions (daily returns of a
+constant-weight book, missing returns counted as cash), so on a panel that
+fits in memory both give the same numbers up to floating-point rounding.
+
+Usage: python outofcore.py build DIR [--years 20] [--portfolio FILE | --synthetic N] [--provider SPEC]
+       python outofcore.py stats DIR [--covariance] [--out DIR] [--format parquet|csv]
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import diagnostics
+import providers
+import rates
+import risk
+import telemetry
+
+log = diagnostics.get_logger('outofcore')
+
+CHUNK_ROWS = 252            # Trading days per chunk file
+SYMBOL_BATCH = 200          # Symbols downloaded / normalized at a time while building
+META_NAME = 'meta.json'
+ANNUAL_FACTOR = 252
+PERIODS = {'1Y': 252, '3Y': 252 * 3, '5Y': 252 * 5}
+
+
+# ==========================================
+# Chunk store
+# ==========================================
+def _chunk_path(directory, i, suffix='npy'):
+    return os.path.join(directory, f"chunk-{i:05d}.{suffix}")
+
+
+def read_meta(directory):
+    with open(os.path.join(directory, META_NAME)) as f:
+        return json.load(f)
+
+
+def build_store(directory, portfolio, provider=None, years=20, end=None,
+                chunk_rows=CHUNK_ROWS, symbol_batch=SYMBOL_BATCH):
+    """
+    Download `years` of history for the book (plus the benchmark), convert it
+    to the base currency and write it as a chunk store. Symbols are fetched in
+    batches of `symbol_batch`, each written straight into the memory-mapped
+    chunks, so memory scales with the batch, not the universe.
+    """
+    provider = provider or providers.get_provider()
+    end = pd.Timestamp(end or provider.now()).normalize()
+    start = end - pd.DateOffset(years=years)
+    calendar = pd.bdate_range(start, end, name='Date')
+    symbols = list(portfolio) + [risk.BENCHMARK]
+    currencies = sorted({info['currency'] for info in portfolio.values()} - {risk.BASE_CURRENCY})
+    fx_rates, _ = provider.download([f"{c}{risk.BASE_CURRENCY}=X" for c in currencies],
+                                    start=start.strftime('%Y-%m-%d'))
+
+    staging = f"{directory.rstrip(os.sep)}.tmp{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    bounds = list(range(0, len(calendar), chunk_rows)) + [len(calendar)]
+    chunks = []
+    for i, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+        chunk = np.lib.format.open_memmap(_chunk_path(staging, i), mode='w+', dtype=np.float64,
+                                          shape=(hi - lo, len(symbols)), fortran_order=True)
+        chunk[:] = np.nan
+        chunks.append(chunk)
+        np.save(_chunk_path(staging, i, 'index.npy'), calendar[lo:hi].to_numpy())
+
+    with telemetry.stage('outofcore_build'):
+        for b in range(0, len(symbols), symbol_batch):
+            batch = symbols[b:b + symbol_batch]
+            close, _ = provider.download(batch, start=start.strftime('%Y-%m-%d'))
+            book = {t: portfolio[t] for t in batch if t in portfolio}
+            if book:  # An empty book would fall back to PORTFOLIO_CONFIG
+                close = risk.normalize_to_base_currency(close, fx_rates, book)
+            usd = close.reindex(index=calendar, columns=batch)
+            values = usd.to_numpy(dtype=np.float64)
+            for chunk, lo, hi in zip(chunks, bounds[:-1], bounds[1:]):
+                chunk[:, b:b + len(batch)] = values[lo:hi]
+            log.info("Stored %d/%d symbols", min(b + symbol_batch, len(symbols)), len(symbols))
+    for chunk in chunks:
+        chunk.flush()
+    del chunks
+
+    meta = {
+        'symbols': symbols,
+        'portfolio': portfolio,
+        'baseCurrency': risk.BASE_CURRENCY,
+        'provider': provider.name,
+        'chunks': len(bounds) - 1,
+        'rows': len(calendar),
+        'start': calendar[0].strftime('%Y-%m-%d'),
+        'end': calendar[-1].strftime('%Y-%m-%d'),
+        'builtAt': time.time(),
+    }
+    with open(os.path.join(staging, META_NAME), 'w') as f:
+        json.dump(meta, f)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(staging, directory)
+    return meta
+
+
+def iter_chunks(directory, meta=None):
+    """(dates, values) per chunk, oldest first; values is a read-only memory map (rows x symbols)."""
+    meta = meta or read_meta(directory)
+    for i in range(meta['chunks']):
+        dates = pd.DatetimeIndex(np.load(_chunk_path(directory, i, 'index.npy')))
+        yield dates, np.load(_chunk_path(directory, i), mmap_mode='r')
+
+
+def load_store(directory):
+    """The whole store as one DataFrame (all-NaN rows dropped). Only for panels that fit in memory."""
+    meta = read_meta(directory)
+    frames = [pd.DataFrame(np.asarray(values), index=dates, columns=meta['symbols'])
+              for dates, values in iter_chunks(directory, meta)]
+    return pd.concat(frames).dropna(how='all')
+
+
+# ==========================================
+# Mergeable aggregates
+# ==========================================
+def _columns(values):
+    """float64 (rows x columns) view of a block; a 1-D array is one column."""
+    values = np.asarray(values, dtype=np.float64)
+    return values[:, None] if values.ndim == 1 else values
+
+
+class Moments:
+    """Count, mean and central moments M2..M4 per column, NaNs ignored."""
+
+    def __init__(self, width):
+        self.n = np.zeros(width)
+        self.mean = np.zeros(width)
+        self.m2 = np.zeros(width)
+        self.m3 = np.zeros(width)
+        self.m4 = np.zeros(width)
+
+    def update(self, values):
+        """Fold in a (rows x width) block."""
+        values = _columns(values)
+        part = Moments(values.shape[1])
+        part.n = np.sum(~np.isnan(values), axis=0).astype(np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            part.mean = np.where(part.n > 0, np.nansum(values, axis=0) / part.n, 0.0)
+        d = values - part.mean
+        part.m2 = np.nansum(d ** 2, axis=0)
+        part.m3 = np.nansum(d ** 3, axis=0)
+        part.m4 = np.nansum(d ** 4, axis=0)
+        self.merge(part)
+
+    def merge(self, other):
+        na, nb = self.n, other.n
+        n = na + nb
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = other.mean - self.mean
+            mean = np.where(n > 0, self.mean + delta * nb / n, 0.0)
+            m2 = self.m2 + other.m2 + np.where(n > 0, delta ** 2 * na * nb / n, 0.0)
+            m3 = self.m3 + other.m3 + np.where(
+                n > 0, delta ** 3 * na * nb * (na - nb) / n ** 2 + 3 * delta * (na * other.m2 - nb * self.m2) / n, 0.0)
+            m4 = self.m4 + other.m4 + np.where(
+                n > 0, delta ** 4 * na * nb * (na ** 2 - na * nb + nb ** 2) / n ** 3
+                + 6 * delta ** 2 * (na ** 2 * other.m2 + nb ** 2 * self.m2) / n ** 2
+                + 4 * delta * (na * other.m3 - nb * self.m3) / n, 0.0)
+        self.n, self.mean, self.m2, self.m3, self.m4 = n, mean, m2, m3, m4
+        return self
+
+    def variance(self, ddof=0):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.n > ddof, self.m2 / (self.n - ddof), np.nan)
+
+    def std(self, ddof=0):
+        return np.sqrt(self.variance(ddof))
+
+    def skew(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(self.n) * self.m3 / self.m2 ** 1.5
+
+    def kurtosis(self):
+        """Excess kurtosis."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.n * self.m4 / self.m2 ** 2 - 3.0
+
+
+class CoMoments:
+    """
+    Co-moments of every column of X with every column of Y over the rows where
+    both are present (pandas / np.cov on pairwise-complete data).
+    """
+
+    def __init__(self, width_x, width_y):
+        shape = (width_x, width_y)
+        self.n = np.zeros(shape)
+        self.mean_x = np.zeros(shape)
+        self.mean_y = np.zeros(shape)
+        self.c = np.zeros(shape)
+
+    def update(self, x, y):
+        x, y = _columns(x), _columns(y)
+        mx, my = ~np.isnan(x), ~np.isnan(y)
+        # Shift by the block means first: the sums below are then small and cancel little
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sx = np.nan_to_num(np.nansum(x, axis=0) / mx.sum(axis=0))
+            sy = np.nan_to_num(np.nansum(y, axis=0) / my.sum(axis=0))
+        x0 = np.where(mx, x - sx, 0.0)
+        y0 = np.where(my, y - sy, 0.0)
+        mxf, myf = mx.astype(np.float64), my.astype(np.float64)
+        part = CoMoments(*self.n.shape)
+        part.n = mxf.T @ myf
+        sum_x, sum_y = x0.T @ myf, mxf.T @ y0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            part.mean_x = np.where(part.n > 0, sum_x / part.n, 0.0) + sx[:, None]
+            part.mean_y = np.where(part.n > 0, sum_y / part.n, 0.0) + sy[None, :]
+            part.c = x0.T @ y0 - np.where(part.n > 0, sum_x * sum_y / part.n, 0.0)
+        self.merge(part)
+
+    def merge(self, other):
+        na, nb = self.n, other.n
+        n = na + nb
+        with np.errstate(invalid='ignore', divide='ignore'):
+            dx, dy = other.mean_x - self.mean_x, other.mean_y - self.mean_y
+            self.mean_x = np.where(n > 0, self.mean_x + dx * nb / n, 0.0)
+            self.mean_y = np.where(n > 0, self.mean_y + dy * nb / n, 0.0)
+            self.c = self.c + other.c + np.where(n > 0, dx * dy * na * nb / n, 0.0)
+        self.n = n
+        return self
+
+    def covariance(self, ddof=1):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.n > ddof, self.c / (self.n - ddof), np.nan)
+
+
+class TailSketch:
+    """
+    The `k` smallest values seen per column. With k = tail_size(q, rows) it
+    answers np.percentile(values, q * 100) and the mean below it exactly (up
+    to ties at the cut-off) for any number of values up to `rows`.
+    """
+
+    def __init__(self, k, width=1):
+        self.k = k
+        self.n = np.zeros(width)
+        self.smallest = np.full((0, width), np.inf)
+
+    @staticmethod
+    def tail_size(q, rows):
+        return int(math.floor(q * max(rows - 1, 0))) + 2
+
+    def update(self, values):
+        values = _columns(values)
+        self.n += np.sum(~np.isnan(values), axis=0)
+        self._keep(np.where(np.isnan(values), np.inf, values))
+
+    def merge(self, other):
+        self.n += other.n
+        self._keep(other.smallest)
+        return self
+
+    def _keep(self, values):
+        stacked = np.vstack([self.smallest, values])
+        if len(stacked) > self.k:
+            stacked = np.partition(stacked, self.k - 1, axis=0)[:self.k]
+        self.smallest = stacked
+
+    def var(self, q):
+        """Per-column q-quantile (linear interpolation, as np.percentile)."""
+        ordered = np.sort(self.smallest, axis=0)
+        out = np.full(len(self.n), np.nan)
+        for j, n in enumerate(self.n.astype(int)):
+            if n == 0:
+                continue
+            h = q * (n - 1)
+            lo = int(math.floor(h))
+            hi = min(lo + 1, n - 1)
+            if hi >= len(ordered):
+                raise ValueError(f"TailSketch of {self.k} values is too small for {n} observations")
+            out[j] = ordered[lo, j] + (h - lo) * (ordered[hi, j] - ordered[lo, j])
+        return out
+
+    def cvar(self, q):
+        """Per-column mean of the values at or below the q-quantile."""
+        var = self.var(q)
+        with np.errstate(invalid='ignore'):
+            below = np.where(self.smallest <= var, self.smallest, np.nan)
+            return np.nanmean(below, axis=0)
+
+
+class Drawdown:
+    """Max drawdown of compounded returns per column (NaN = flat). Chunks must arrive in date order."""
+
+    def __init__(self, width=1):
+        self.value = np.ones(width)
+        self.peak = np.full(width, -np.inf)
+        self.max_drawdown = np.zeros(width)
+        self.started = False
+
+    def update(self, returns):
+        growth = 1 + np.nan_to_num(_columns(returns))
+        if not self.started:
+            # The first value is the first day's growth, as (1 + r).cumprod()
+            cum = np.cumprod(growth, axis=0)
+            self.started = True
+        else:
+            cum = np.cumprod(np.vstack([self.value, growth]), axis=0)[1:]
+        running = np.maximum(self.peak, np.maximum.accumulate(cum, axis=0))
+        self.max_drawdown = np.minimum(self.max_drawdown, ((cum - running) / running).min(axis=0))
+        self.value, self.peak = cum[-1], running[-1]
+
+
+class PeriodicWindow:
+    """
+    Per column: the last max(PERIODS) + 1 observations and the last close before
+    `ytd_start`, enough for calculate_periodic_returns' YTD / 1Y / 3Y / 5Y.
+    """
+
+    def __init__(self, columns, ytd_start):
+        self.columns = list(columns)
+        self.ytd_start = pd.Timestamp(ytd_start)
+        self.keep = max(PERIODS.values()) + 1
+        self.tails = [np.empty(0) for _ in self.columns]
+        self.counts = np.zeros(len(self.columns), dtype=np.int64)
+        self.year_end = np.full(len(self.columns), np.nan)
+        self.first = np.full(len(self.columns), np.nan)
+
+    def update(self, dates, values):
+        before = int(dates.searchsorted(self.ytd_start))
+        for j in range(len(self.columns)):
+            column = values[:, j]
+            valid = ~np.isnan(column)
+            if not valid.any():
+                continue
+            observed = column[valid]
+            if np.isnan(self.first[j]):
+                self.first[j] = observed[0]
+            prior = column[:before][valid[:before]]
+            if len(prior):
+                self.year_end[j] = prior[-1]
+            self.counts[j] += len(observed)
+            self.tails[j] = np.concatenate([self.tails[j], observed])[-self.keep:]
+
+    def result(self):
+        rows = {}
+        for j, ticker in enumerate(self.columns):
+            tail = self.tails[j]
+            if not len(tail):
+                continue
+            current = tail[-1]
+            base = self.year_end[j] if not np.isnan(self.year_end[j]) else self.first[j]
+            res = {'YTD': (current - base) / base}
+            for name, days in PERIODS.items():
+                res[name] = (current - tail[-(days + 1)]) / tail[-(days + 1)] if self.counts[j] > days else np.nan
+            rows[ticker] = res
+        return pd.DataFrame(rows).T
+
+
+# ==========================================
+# Streaming risk
+# ==========================================
+def stream_risk(directory, portfolio=None, quantile=0.05, covariance=False, base_currency=None):
+    """
+    Headline risk of `portfolio` (default: the book the store was built for)
+    over the store's whole history, one chunk at a time. Same definitions and
+    keys as calculate_risk_metrics for the metrics both compute, plus
+    per-symbol moments, periodic returns and, with `covariance`, the full
+    pairwise covariance of the book's daily returns.
+    """
+    meta = read_meta(directory)
+    portfolio = portfolio or meta['portfolio']
+    base_currency = base_currency or meta['baseCurrency']
+    symbols = meta['symbols']
+    position = {s: i for i, s in enumerate(symbols)}
+    if risk.BENCHMARK not in position:
+        raise ValueError(f"Benchmark {risk.BENCHMARK} is not in the store")
+    active = [t for t in portfolio if t in position]
+    active_idx = [position[t] for t in active]
+    signed = [(position[t], portfolio[t]['weight'], 1 if portfolio[t]['type'] == 'Long' else -1) for t in active]
+    bench_idx = position[risk.BENCHMARK]
+
+    asset = Moments(len(symbols))
+    port, downside, bench = Moments(1), Moments(1), Moments(1)
+    beta = CoMoments(1, 1)
+    mctr = CoMoments(len(active), 1)
+    cov = CoMoments(len(active), len(active)) if covariance else None
+    tail = TailSketch(TailSketch.tail_size(quantile, meta['rows']))
+    drawdown = Drawdown()
+    periodic = PeriodicWindow(symbols, f"{providers.now().year}-01-01")
+    curve = rates.get_curve(base_currency)
+    # Returns dated before the curve starts, waiting for the first rate joined on a later date
+    rf_sum, rf_pending, first_date, last_date, prev = 0.0, 0, None, None, None
+
+    with telemetry.stage('outofcore_stream'):
+        for dates, values in iter_chunks(directory, meta):
+            values = np.asarray(values)
+            present = ~np.isnan(values).all(axis=1)
+            dates, values = dates[present], values[present]
+            if not len(values):
+                continue
+            periodic.update(dates, values)
+
+            # pct_change across the chunk boundary, then dropna(how='all')
+            prices = values if prev is None else np.vstack([prev, values])
+            ret_dates = dates[1:] if prev is None else dates
+            prev = values[-1:]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                returns = prices[1:] / prices[:-1] - 1
+            keep = ~np.isnan(returns).all(axis=1)
+            returns, ret_dates = returns[keep], ret_dates[keep]
+            if not len(returns):
+                continue
+
+            port_ret = np.zeros(len(returns))
+            for j, weight, direction in signed:
+                port_ret += np.nan_to_num(returns[:, j], nan=0.0) * weight * direction
+            bench_ret = returns[:, bench_idx]
+
+            asset.update(returns)
+            port.update(port_ret)
+            downside.update(port_ret[port_ret < 0])
+            bench.update(bench_ret)
+            beta.update(port_ret, bench_ret)
+            mctr.update(returns[:, active_idx], port_ret)
+            if cov is not None:
+                cov.update(returns[:, active_idx], returns[:, active_idx])
+            tail.update(port_ret)
+            drawdown.update(port_ret)
+            # rates.align_rates over the whole history: as-of join, pre-curve dates backfilled
+            if curve.empty:
+                rf_sum += rates.FALLBACK_RATE * len(ret_dates)
+            else:
+                rf = curve.reindex(curve.index.union(pd.DatetimeIndex(ret_dates))).ffill().reindex(ret_dates)
+                rf_pending += int(rf.isna().sum())
+                if rf_pending and rf.notna().any():
+                    rf_sum += rf_pending * float(rf.dropna().iloc[0])
+                    rf_pending = 0
+                rf_sum += float(rf.sum())
+            first_date = first_date if first_date is not None else ret_dates[0]
+            last_date = ret_dates[-1]
+
+    n = port.n[0]
+    if n < 2:
+        return None
+    rf_hist = (rf_sum + rf_pending * rates.FALLBACK_RATE) / n
+    daily_vol = float(port.std()[0])
+    annual_vol = daily_vol * np.sqrt(ANNUAL_FACTOR)
+    annual_ret = float(port.mean[0]) * ANNUAL_FACTOR
+    downside_std = float(downside.std()[0]) * np.sqrt(ANNUAL_FACTOR) if downside.n[0] else np.nan
+    bench_var = float(bench.variance()[0])
+
+    risk_contribution = {}
+    if daily_vol > 0:
+        cov_with_port = mctr.covariance()[:, 0]
+        for i, (ticker, (_, weight, direction)) in enumerate(zip(active, signed)):
+            contribution = (np.nan_to_num(cov_with_port[i]) * weight * direction) / daily_vol
+            risk_contribution[ticker] = {'MCTR': contribution, 'Pct_Risk': contribution / daily_vol,
+                                         'Weight': weight * direction}
+
+    annual = pd.DataFrame({
+        'Annual_Return': asset.mean * ANNUAL_FACTOR,
+        'Annual_Vol': asset.std() * np.sqrt(ANNUAL_FACTOR),
+        'Skew': asset.skew(),               # Population (biased) estimators
+        'Excess_Kurtosis': asset.kurtosis(),
+        'Observations': asset.n.astype(int),
+    }, index=symbols)
+    label = f"{round((1 - quantile) * 100):d}"
+    metrics = {
+        'Base_Currency': base_currency,
+        'Beta': float(beta.covariance()[0, 0] / bench_var) if bench_var > 0 else 0,
+        'Annual_Return': annual_ret,
+        'Annual_Vol': annual_vol,
+        'Sharpe': (annual_ret - rf_hist) / annual_vol if annual_vol > 0 else 0,
+        'Sortino': (annual_ret - rf_hist) / downside_std if downside_std > 0 else 0,
+        f"VaR_{label}": float(tail.var(quantile)[0]),
+        f"CVaR_{label}": float(tail.cvar(quantile)[0]),
+        'Max_Drawdown': float(drawdown.max_drawdown[0]),
+        'Risk_Attribution': risk_contribution,
+        'Asset_Stats': annual,
+        'Periodic_Returns': periodic.result(),
+        'Period_Info': {
+            'Start_Date': first_date.strftime('%Y-%m-%d'),
+            'End_Date': last_date.strftime('%Y-%m-%d'),
+            'Years': round((last_date - first_date).days / 365.25, 1),
+        },
+    }
+    if cov is not None:
+        metrics['Covariance'] = pd.DataFrame(cov.covariance(), index=active, columns=active)
+    return metrics
+
+
+# ==========================================
+# CLI
+# ==========================================
+def main():
+    import batch  # CLI only: portfolio files and table output
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help="download history into a chunk store")
+    build.add_argument("directory")
+    build.add_argument("--years", type=int, default=20)
+    book = build.add_mutually_exclusive_group()
+    book.add_argument("--portfolio", help="portfolio .json / .yaml file (default: PORTFOLIO_CONFIG)")
+    book.add_argument("--synthetic", type=int, metavar="N", help="synthetic book of N tickers")
+    build.add_argument("--provider", help="provider spec (default: ALPHA_DATA_PROVIDER)")
+    build.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    build.add_argument("--batch", type=int, default=SYMBOL_BATCH, help="symbols per download")
+    stats = sub.add_parser('stats', help="stream the risk statistics of a chunk store")
+    stats.add_argument("directory")
+    stats.add_argument("--covariance", action="store_true", help="also compute the book's covariance matrix")
+    stats.add_argument("--out", help="write asset stats / attribution / periodic returns tables here")
+    stats.add_argument("--format", default=batch.DEFAULT_FORMAT, choices=batch.OUTPUT_FORMATS)
+    args = parser.parse_args()
+    diagnostics.setup_logging()
+
+    if args.command == 'build':
+        if args.provider:
+            providers.set_provider(args.provider)
+        if args.synthetic:
+            portfolio = providers.synthetic_portfolio(args.synthetic)
+        elif args.portfolio:
+            portfolio = batch.load_portfolio(args.portfolio)
+        else:
+            portfolio = risk.PORTFOLIO_CONFIG
+        start = time.perf_counter()
+        meta = build_store(args.directory, portfolio, years=args.years,
+                           chunk_rows=args.chunk_rows, symbol_batch=args.batch)
+        print(f"{len(meta['symbols'])} symbols x {meta['rows']} days ({meta['start']} to {meta['end']}) "
+              f"in {meta['chunks']} chunks, {time.perf_counter() - start:.1f}s")
+        return
+
+    # The risk-free curve from the cache; refreshed only when there is none yet
+    if rates.get_curve(read_meta(args.directory)['baseCurrency']).empty:
+        rates.refresh_rates()
+    start = time.perf_counter()
+    metrics = stream_risk(args.directory, covariance=args.covariance)
+    if metrics is None:
+        sys.exit("Not enough data in the store")
+    info = metrics['Period_Info']
+    print(f"{info['Start_Date']} to {info['End_Date']} ({info['Years']}y), {time.perf_counter() - start:.1f}s")
+    for key in ('Annual_Return', 'Annual_Vol', 'Sharpe', 'Sortino', 'Beta', 'VaR_95', 'CVaR_95', 'Max_Drawdown'):
+        print(f"  {key:<14}{metrics[key]:>10.4f}")
+    if args.out:
+        attribution = pd.DataFrame.from_dict(metrics['Risk_Attribution'], orient='index')
+        tables = {
+            'asset_stats': metrics['Asset_Stats'].rename_axis('ticker').reset_index(),
+            'attribution': attribution.rename_axis('ticker').reset_index(),
+            'periodic': metrics['Periodic_Returns'].rename_axis('ticker').reset_index(),
+        }
+        if 'Covariance' in metrics:
+            tables['covariance'] = metrics['Covariance'].rename_axis('ticker').reset_index()
+        for path in batch.write_tables(tables, args.out, args.format):
+            print(f"  {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+On-demand profiling of a single run.
+
+`profile_run(func)` executes `func()` under cProfile and tracemalloc, collects
+per-stage wall/CPU time from the telemetry stage timers and counts pandas
+DataFrame/Series constructions per call site. All hooks are installed only for
+the duration of the run, so requests that don't ask for a profile pay nothing.
+"""
+import cProfile
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from pandas.core.generic import NDFrame
+
+import telemetry
+
+TOP_FUNCTIONS = 30
+TOP_ALLOCATION_SITES = 15
+SORT_KEYS = ('cumulative', 'tottime', 'ncalls')
+
+# cProfile, tracemalloc and the NDFrame hook are process-wide: one profile at a time
+_lock = threading.Lock()
+# filename -> is pandas / numpy source; consulted on every allocation while profiling
+_library_files = {}
+
+
+def _is_library(filename):
+    internal = _library_files.get(filename)
+    if internal is None:
+        internal = _library_files[filename] = bool(set(filename.replace('\\', '/').split('/')) & {'pandas', 'numpy'})
+    return internal
+
+
+def _call_site(frame):
+    """(code, line) of the first frame outside pandas / numpy."""
+    while frame is not None and _is_library(frame.f_code.co_filename):
+        frame = frame.f_back
+    return (frame.f_code, frame.f_lineno) if frame is not None else (None, 0)
+
+
+def _format_site(code, line):
+    if code is None:
+        return 'unknown'
+    return f"{os.path.basename(code.co_filename)}:{line} {code.co_name}"
+
+
+def _function_rows(stats, sort_by, limit):
+    rows = []
+    for (filename, line, name), (cc, nc, tt, ct, _) in stats.stats.items():
+        rows.append({
+            'function': f"{os.path.basename(filename)}:{line} {name}" if line else name,
+            'ncalls': nc,
+            'primitiveCalls': cc,
+            'tottime': tt,
+            'cumtime': ct,
+        })
+    key = {'cumulative': 'cumtime', 'tottime': 'tottime', 'ncalls': 'ncalls'}[sort_by]
+    rows.sort(key=lambda r: r[key], reverse=True)
+    return rows[:limit]
+
+
+def profile_run(func, sort_by='cumulative', limit=TOP_FUNCTIONS):
+    """
+    Run `func()` with profiling enabled. Returns (result, report, stats) where
+    `report` is a JSON-ready summary and `stats` the pstats.Stats of the run.
+    Only work done on the calling thread is attributed to stages and allocations.
+    """
+    if sort_by not in SORT_KEYS:
+        raise ValueError(f"Unsupported sort '{sort_by}'. Use one of: {', '.join(SORT_KEYS)}")
+
+    with _lock:
+        thread_id = threading.get_ident()
+        stages = {}
+        allocations = Counter()
+        sites = Counter()
+
+        def on_stage(name, wall, cpu):
+            if threading.get_ident() != thread_id:
+                return
+            entry = stages.setdefault(name, {'stage': name, 'calls': 0, 'wallSeconds': 0.0, 'cpuSeconds': 0.0})
+            entry['calls'] += 1
+            entry['wallSeconds'] += wall
+            entry['cpuSeconds'] += cpu
+
+        original_init = NDFrame.__init__
+
+        def counting_init(self, *args, **kwargs):
+            if threading.get_ident() == thread_id:
+                kind = type(self).__name__
+                allocations[kind] += 1
+                sites[(kind, _call_site(sys._getframe(1)))] += 1
+            original_init(self, *args, **kwargs)
+
+        already_tracing = tracemalloc.is_tracing()
+        profiler = cProfile.Profile()
+        telemetry.add_stage_hook(on_stage)
+        NDFrame.__init__ = counting_init
+        if already_tracing:
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start()
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        try:
+            profiler.enable()
+            try:
+                result = func()
+            finally:
+                profiler.disable()
+            wall, cpu = time.perf_counter() - wall_start, time.thread_time() - cpu_start
+            current_memory, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            if not already_tracing:
+                tracemalloc.stop()
+            NDFrame.__init__ = original_init
+            telemetry.remove_stage_hook(on_stage)
+
+    stats = pstats.Stats(profiler)
+    report = {
+        'wallSeconds': wall,
+        'cpuSeconds': cpu,
+        'peakMemoryBytes': peak_memory,
+        'retainedMemoryBytes': current_memory,
+        'stages': sorted(stages.values(), key=lambda e: e['wallSeconds'], reverse=True),
+        'allocations': {
+            'counts': dict(allocations),
+            'topSites': [
+                {'type': kind, 'site': _format_site(*site), 'count': count}
+                for (kind, site), count in sites.most_common(TOP_ALLOCATION_SITES)
+            ],
+        },
+        'functions': _function_rows(stats, sort_by, limit),
+        'totalCalls': stats.total_calls,
+    }
+    return result, report, stats
+
+
+def stats_bytes(stats):
+    """pstats.Stats in the on-disk .pstats format (loadable with pstats / snakeviz)."""
+    return marshal.dumps(stats.stats)
+
+
+def print_report(report, stream=None):
+    """Human-readable summary of a `profile_run` report."""
+    out = stream or sys.stdout
+    print(f"\n[PROFILE] wall {report['wallSeconds']:.3f}s | cpu {report['cpuSeconds']:.3f}s | "
+          f"peak traced memory {report['peakMemoryBytes'] / 2**20:.1f} MiB", file=out)
+
+    print(f"\n  {'STAGE':<24} {'CALLS':>6} {'WALL s':>9} {'CPU s':>9}", file=out)
+    for entry in report['stages']:
+        print(f"  {entry['stage']:<24} {entry['calls']:>6} {entry['wallSeconds']:>9.3f} {entry['cpuSeconds']:>9.3f}", file=out)
+
+    counts = report['allocations']['counts']
+    print("\n  pandas objects created: " + ", ".join(f"{k} {v}" for k, v in counts.items()), file=out)
+    for site in report['allocations']['topSites']:
+        print(f"    {site['count']:>6}  {site['type']:<10} {site['site']}", file=out)
+
+    print(f"\n  {'FUNCTION':<60} {'NCALLS':>8} {'TOTTIME':>9} {'CUMTIME':>9}", file=out)
+    for row in report['functions']:
+        print(f"  {row['function'][:60]:<60} {row['ncalls']:>8} {row['tottime']:>9.3f} {row['cumtime']:>9.3f}", file=out)
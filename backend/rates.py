@@ -0,0 +1,176 @@
+"""
+Risk-free rate curve service.
+
+Keeps the full daily history of the configured yield tickers (^TNX for USD,
+optionally one per reporting currency) on disk and in memory, refreshes it on
+a background schedule and serves point-in-time rates. Metric calculations only
+ever read the cached curve, so no network call happens on the request path.
+"""
+import os
+import threading
+import time
+
+import pandas as pd
+
+import diagnostics
+import providers
+import shared_cache
+import telemetry
+
+log = diagnostics.get_logger('rates')
+
+# Yield tickers quoted in percent (4.25 -> 4.25%). Add e.g. 'PLN' or 'EUR'
+# entries here to give those reporting currencies their own curve; currencies
+# without one fall back to the USD curve.
+RATE_TICKERS = {
+    'USD': '^TNX',
+}
+FALLBACK_RATE = 0.04               # Used until a curve has been fetched
+REFRESH_INTERVAL_SECONDS = 6 * 3600
+# Shared cache: how long a dead worker's rates refresh blocks the others
+REFRESH_LEASE_SECONDS = 10 * 60
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+
+_lock = threading.Lock()
+_curves = {}
+_scheduler = None
+
+
+def _cache_path(currency):
+    # Curves from an offline provider (synthetic, files) never overwrite the live cache
+    provider = providers.get_provider().name
+    suffix = '' if provider == 'yfinance' else f".{provider}"
+    return os.path.join(CACHE_DIR, f"rates_{currency}{suffix}.csv")
+
+
+def _load_from_disk(currency):
+    path = _cache_path(currency)
+    if not os.path.exists(path):
+        return None
+    try:
+        curve = pd.read_csv(path, index_col=0, parse_dates=True).iloc[:, 0]
+        curve.name = currency
+        return curve.dropna()
+    except Exception as e:
+        log.error("Error reading cached rate curve %s: %s", path, e)
+        return None
+
+
+@telemetry.timed('rates_refresh')
+def refresh_rates():
+    """Download the full history of every configured yield ticker and persist it."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    for currency, ticker in RATE_TICKERS.items():
+        try:
+            close, _ = providers.get_provider().download([ticker])
+            if ticker not in close or close[ticker].dropna().empty:
+                telemetry.inc('alpha_fetch_failures_total', kind='rates')
+                log.warning("%s returned no data. Keeping cached %s curve.", ticker, currency, extra={'ticker': ticker})
+                continue
+
+            # Yield is quoted in percent, store as decimal (4.25 -> 0.0425)
+            curve = (close[ticker] / 100.0).dropna()
+            curve.index = curve.index.normalize()
+            curve.name = currency
+            # Written aside and swapped in, so readers in other processes never see a partial file
+            path = _cache_path(currency)
+            staging = f"{path}.tmp{os.getpid()}"
+            curve.to_csv(staging)
+            os.replace(staging, path)
+
+            with _lock:
+                _curves[currency] = curve
+            log.info("Rate curve %s (%s) refreshed: %d rows, latest %.4f%%", currency, ticker, len(curve), curve.iloc[-1] * 100)
+        except Exception as e:
+            telemetry.inc('alpha_fetch_failures_total', kind='rates')
+            log.error("Error refreshing %s: %s. Keeping cached %s curve.", ticker, e, currency, extra={'ticker': ticker})
+
+
+def _reload_rates(max_age):
+    """
+    Load every curve from disk if all of them were written less than `max_age`
+    seconds ago (by another worker). Returns False if any is missing or older.
+    """
+    paths = {currency: _cache_path(currency) for currency in RATE_TICKERS}
+    now = time.time()
+    if any(not os.path.exists(path) or now - os.path.getmtime(path) > max_age for path in paths.values()):
+        return False
+    curves = {currency: _load_from_disk(currency) for currency in paths}
+    if any(curve is None for curve in curves.values()):
+        return False
+    with _lock:
+        _curves.update(curves)
+    log.info("Rate curves reloaded from %s", CACHE_DIR)
+    return True
+
+
+def get_curve(currency='USD'):
+    """Cached daily rate series (decimal, annualized) for `currency`, possibly empty."""
+    if currency not in RATE_TICKERS:
+        currency = 'USD'
+    with _lock:
+        curve = _curves.get(currency)
+    if curve is None:
+        curve = _load_from_disk(currency)
+        if curve is None:
+            return pd.Series(dtype=float, name=currency)
+        with _lock:
+            _curves[currency] = curve
+    return curve
+
+
+def get_rate(currency='USD', as_of=None):
+    """Point-in-time rate: the last observation on or before `as_of` (default: latest)."""
+    curve = get_curve(currency)
+    if as_of is not None:
+        curve = curve[curve.index <= pd.Timestamp(as_of)]
+    if curve.empty:
+        return FALLBACK_RATE
+    return float(curve.iloc[-1])
+
+
+def align_rates(index, currency='USD'):
+    """
+    Rate curve joined onto `index` (as-of join: last known rate for each date).
+    Dates before the first observation take the earliest rate; with no curve
+    at all the series is flat at FALLBACK_RATE.
+    """
+    curve = get_curve(currency)
+    if curve.empty:
+        return pd.Series(FALLBACK_RATE, index=index)
+    union_idx = curve.index.union(index)
+    aligned = curve.reindex(union_idx).ffill().reindex(index)
+    return aligned.bfill().fillna(FALLBACK_RATE)
+
+
+def start_scheduler(interval=REFRESH_INTERVAL_SECONDS):
+    """
+    Refresh the curves now and then every `interval` seconds on a daemon thread.
+    With the shared cache, workers refresh one at a time, and curves another
+    worker wrote in the last half interval are reloaded instead of downloaded.
+    """
+    global _scheduler
+    if _scheduler is not None:
+        return _scheduler
+
+    stop_event = threading.Event()
+
+    def _loop():
+        while True:
+            try:
+                if shared_cache.enabled():
+                    with shared_cache.lease('rates', REFRESH_LEASE_SECONDS):
+                        if not _reload_rates(interval / 2):
+                            refresh_rates()
+                else:
+                    refresh_rates()
+            except Exception:
+                telemetry.inc('alpha_fetch_failures_total', kind='rates')
+                log.exception("Scheduled rates refresh failed")
+            if stop_event.wait(interval):
+                break
+
+    _scheduler = threading.Thread(target=_loop, name="rates-refresh", daemon=True)
+    _scheduler.stop_event = stop_event
+    _scheduler.start()
+    return _scheduler
@@ -0,0 +1,241 @@
+"""
+Console risk report and matplotlib/seaborn figures.
+
+Kept out of risk.py so the API server (which never plots) does not pay for
+importing the plotting libraries; risk.generate_report imports this module
+on first use. `render()` draws the same figures headless (Agg) to PNG/PDF
+files; report_renderer.py runs it in a background process for /api/report.
+"""
+import os
+from datetime import datetime
+
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
+import numpy as np
+import seaborn as sns
+
+import risk
+
+RENDER_FORMATS = ('png', 'pdf')
+PNG_DPI = 110
+PDF_NAME = 'report.pdf'
+
+
+def generate_report(metrics, data):
+    """Print the console risk report and show the dashboard, scenario and leverage figures."""
+    if metrics is None: return
+    print_report(metrics, data)
+    build_figures(metrics, data)
+    plt.show()
+
+
+def print_report(metrics, data):
+    """Console risk report: periodic returns, vitals, tail risk, stress tests, attribution."""
+    print("\n" + "="*50)
+    print(f"      HEDGE FUND RISK REPORT ({datetime.now().strftime('%Y-%m-%d')})      ")
+    print("="*50)
+    
+    # --- 0. PERIODIC RETURNS (Print First) ---
+    periodic_rets = risk.calculate_periodic_returns(data)
+    
+    print(f"\n[INDIVIDUAL TICKER PERFORMANCE]")
+    print(f"  {'TICKER':<10} | {'1 YEAR':<10} | {'3 YEARS':<10} | {'5 YEARS':<10}")
+    print("-" * 55)
+    
+    # Sort by 1Y return for display
+    sorted_periodic = periodic_rets.sort_values('1Y', ascending=False)
+    
+    for ticker, row in sorted_periodic.iterrows():
+        r1y = f"{row['1Y']:.1%}" if not np.isnan(row['1Y']) else "N/A"
+        r3y = f"{row['3Y']:.1%}" if not np.isnan(row['3Y']) else "N/A"
+        r5y = f"{row['5Y']:.1%}" if not np.isnan(row['5Y']) else "N/A"
+        
+        print(f"  {ticker:<10} | {r1y:<10} | {r3y:<10} | {r5y:<10}")
+    
+    # --- SUMMARY STATS ---
+    print(f"\n[PORTFOLIO VITALS]")
+    print(f"  Beta:             {metrics['Beta']:.2f}")
+    print(f"  Sharpe Ratio:     {metrics['Sharpe']:.2f}")
+    print(f"  Sortino Ratio:    {metrics['Sortino']:.2f}")
+    print(f"  Ann. Volatility:  {metrics['Annual_Vol']:.1%}")
+    print(f"  Max Drawdown:     {metrics['Max_Drawdown']:.1%}")
+    
+    print(f"\n[TAIL RISK]")
+    print(f"  VaR (95% Daily):  {metrics['VaR_95']:.2%}  (Loss exceeded 5% of days)")
+    print(f"  CVaR (95% Daily): {metrics['CVaR_95']:.2%}  (Arg loss on bad days)")
+    print(f"  *On $100k, Exp. Shortfall is ~${abs(metrics['CVaR_95']*100000):.0f} per day in crisis.*")
+
+    # --- STRESS TEST ---
+    stress_results = risk.stress_test_portfolio(metrics)
+    print(f"\n[STRESS TESTS (Linear Beta Approximation)]")
+    for scenario, result in stress_results.items():
+        print(f"  {scenario:<25} -> PnL Impact: {result:+.2%}")
+
+    # --- RISK ATTRIBUTION ---
+    print(f"\n[RISK ATTRIBUTION (Top Drivers of Volatility)]")
+    sorted_risk = sorted(metrics['Risk_Attribution'].items(), key=lambda x: x[1]['Pct_Risk'], reverse=True)
+    
+    print(f"  {'TICKER':<10} | {'WEIGHT':<8} | {'% TOTAL RISK':<12} | {'COMMENT'}")
+    print("-" * 60)
+    
+    for ticker, stats in sorted_risk[:8]: # Top 8
+        pct_risk = stats['Pct_Risk']
+        weight = stats['Weight']
+        comment = "High Risk Efficiency" if abs(pct_risk) < abs(weight) else "Volatile!"
+        print(f"  {ticker:<10} | {weight:<8.1%} | {pct_risk:<12.1%} | {comment}")
+
+
+def build_figures(metrics, data):
+    """The dashboard, future scenarios and leverage figures as [(name, Figure)]."""
+    stress_results = risk.stress_test_portfolio(metrics)
+    sorted_risk = sorted(metrics['Risk_Attribution'].items(), key=lambda x: x[1]['Pct_Risk'], reverse=True)
+
+    # 1. Dashboard Plot
+    fig, axes = plt.subplots(2, 2, figsize=(15, 10))
+    fig.suptitle('Institutional Risk Dashboard', fontsize=16)
+    
+    # A. Current Correlations
+    valid_tickers = [t for t in risk.PORTFOLIO_CONFIG.keys() if t in data.columns]
+    corr_matrix = metrics['Correlation_Matrix'].loc[valid_tickers, valid_tickers]
+    sns.heatmap(corr_matrix, ax=axes[0,0], cmap='RdBu', center=0, annot=False, cbar=True)
+    axes[0,0].set_title('Correlation Heatmap')
+    
+    # B. Cumulative Returns (Alpha Check)
+    cum_returns = (1 + metrics['Returns_Stream']).cumprod()
+    cum_bench = (1 + metrics['Benchmark_Stream']).cumprod()
+    
+    final_port_ret = cum_returns.iloc[-1] - 1
+    final_bench_ret = cum_bench.iloc[-1] - 1
+    alpha = final_port_ret - final_bench_ret
+    
+    axes[0,1].plot(cum_returns, color='green', linewidth=2, label=f'Portfolio ({final_port_ret:+.1%})')
+    axes[0,1].plot(cum_bench, color='gray', linestyle='--', alpha=0.7, label=f'Market ({final_bench_ret:+.1%})')
+    
+    axes[0,1].set_title(f'Alpha Check (Excess Ret: {alpha:+.1%})')
+    axes[0,1].legend()
+    axes[0,1].grid(True, alpha=0.3)
+    
+    # C. Drawdowns
+    drawdown = metrics['Drawdown_Stream']
+    axes[1,0].fill_between(drawdown.index, drawdown, 0, color='red', alpha=0.3)
+    axes[1,0].plot(drawdown, color='red', lw=1)
+    axes[1,0].set_title('Underwater Plot (Drawdowns)')
+    axes[1,0].grid(True, alpha=0.3)
+    
+    # D. Risk Contribution Bar Chart
+    tickers = [x[0] for x in sorted_risk]
+    vals = [x[1]['Pct_Risk'] for x in sorted_risk]
+    colors = ['red' if v > 0 else 'green' for v in vals] # Short positions adding risk are usually hedging (negative risk contrib), if positive they add risk
+    
+    axes[1,1].bar(tickers[:10], vals[:10], color='purple')
+    axes[1,1].set_title('Top Risk Contributors (%)')
+    axes[1,1].tick_params(axis='x', rotation=45)
+    fig.tight_layout(rect=(0, 0, 1, 0.96))
+    
+    # 2. Future Scenarios Plot (New Figure)
+    fig2, axes2 = plt.subplots(1, 2, figsize=(15, 6))
+    fig2.suptitle('Future Scenarios: "What happens next?"', fontsize=16)
+    
+    # E. Monte Carlo Cone
+    mc_paths = risk.run_monte_carlo(metrics)
+    if mc_paths is not None:
+        days = mc_paths.shape[1] - 1
+        x_axis = range(days + 1)
+        
+        # Percentiles
+        p5 = np.percentile(mc_paths, 5, axis=0)
+        p50 = np.percentile(mc_paths, 50, axis=0)
+        p95 = np.percentile(mc_paths, 95, axis=0)
+        p1 = np.percentile(mc_paths, 1, axis=0) # Worst case
+        
+        axes2[0].plot(x_axis, p50, color='blue', lw=2, label='Median Path')
+        axes2[0].fill_between(x_axis, p5, p95, color='blue', alpha=0.2, label='90% Confidence Cone')
+        axes2[0].plot(x_axis, p1, color='red', linestyle='--', lw=1, label='Worst Case (1%)')
+        
+        axes2[0].set_title(f'Monte Carlo: Next {days} Days (1000 Sims)')
+        axes2[0].set_ylabel('Portfolio Value (Start=1.0)')
+        axes2[0].set_xlabel('Trading Days Ahead')
+        axes2[0].legend()
+        axes2[0].grid(True, alpha=0.3)
+        
+    # F. Stress Test Bar Chart
+    scenarios = list(stress_results.keys())
+    impacts = list(stress_results.values())
+    colors_stress = ['red' if x < 0 else 'green' for x in impacts]
+    
+    axes2[1].barh(scenarios, impacts, color=colors_stress)
+    axes2[1].set_title('Stress Test PnL Impact')
+    axes2[1].set_xlabel('Estimated Return')
+    axes2[1].grid(True, alpha=0.3)
+    # Add value labels
+    for i, v in enumerate(impacts):
+        axes2[1].text(v if v > 0 else 0, i, f' {v:+.1%}', va='center')
+
+    fig2.tight_layout()
+
+
+    # 3. Leverage & Ticker Performance (New Figure)
+    periodic_rets = risk.calculate_periodic_returns(data)
+    
+    fig3, axes3 = plt.subplots(1, 2, figsize=(16, 8))
+    fig3.suptitle('Leverage Impact & Asset Performance', fontsize=16)
+    
+    # G. Gross vs Net Equity Curve
+    gross_curve = (1 + metrics['Returns_Stream']).cumprod()
+    net_curve = (1 + metrics['Net_Stream']).cumprod()
+    
+    axes3[0].plot(gross_curve, color='green', linestyle='--', label='Gross Return (Pre-Fee)')
+    axes3[0].plot(net_curve, color='darkgreen', linewidth=2, label='Net Return (Post-Fee)')
+    
+    lev_stats = metrics['Leverage_Stats']
+    cost_text = (f"Leverage Profile:\n"
+                 f"Long: {lev_stats['Long_Exp']:.0%}\n"
+                 f"Short: {lev_stats['Short_Exp']:.0%}\n\n"
+                 f"Est Annual Drag: -{lev_stats['Daily_Drag']*360:.1%}")
+    
+    axes3[0].text(0.05, 0.95, cost_text, transform=axes3[0].transAxes, 
+                  verticalalignment='top', bbox=dict(boxstyle='round', facecolor='white', alpha=0.8))
+    
+    axes3[0].set_title('Cost of Leverage: Gross vs Net')
+    axes3[0].legend()
+    axes3[0].grid(True, alpha=0.3)
+    
+    # H. Ticker Performance Heatmap
+    # Prepare data for heatmap
+    sorted_periodic = periodic_rets.sort_values('1Y', ascending=False)
+    # Convert to numeric, handle NaNs
+    heatmap_data = sorted_periodic.astype(float)
+    
+    # Annotations: Format as percentage string or "" if NaN
+    annot_data = heatmap_data.map(lambda x: f"{x:.1%}" if not np.isnan(x) else "")
+    
+    sns.heatmap(heatmap_data, annot=annot_data, fmt="", cmap="RdYlGn", center=0, ax=axes3[1], cbar_kws={'label': 'Total Return'})
+    axes3[1].set_title('Asset Performance Heatmap')
+    
+    fig3.tight_layout()
+    return [('dashboard', fig), ('scenarios', fig2), ('leverage', fig3)]
+
+
+def render(metrics, data, out_dir, formats=RENDER_FORMATS):
+    """
+    Draw the figures with the Agg backend into `out_dir`: one <name>.png per
+    figure and all of them as pages of report.pdf. Returns the file names written.
+    """
+    plt.switch_backend('Agg')
+    os.makedirs(out_dir, exist_ok=True)
+    figures = build_figures(metrics, data)
+    files = []
+    try:
+        if 'png' in formats:
+            for name, fig in figures:
+                fig.savefig(os.path.join(out_dir, f"{name}.png"), dpi=PNG_DPI)
+                files.append(f"{name}.png")
+        if 'pdf' in formats:
+            with PdfPages(os.path.join(out_dir, PDF_NAME)) as pdf:
+                for _, fig in figures:
+                    pdf.savefig(fig)
+            files.append(PDF_NAME)
+    finally:
+        for _, fig in figures:
+            plt.close(fig)
+    return files
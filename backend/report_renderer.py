@@ -0,0 +1,185 @@
+"""
+Background rendering of the PNG/PDF risk report for /api/report.
+
+report.render() draws the figures with the Agg backend in a separate worker
+process, so matplotlib never runs in (or holds the GIL of) the API process.
+Reports are written to backend/cache/reports/<fingerprint>/, where the
+fingerprint hashes the metrics and prices the report is drawn from: a data
+refresh that leaves them unchanged keeps serving the existing files, and only
+a real change triggers a new render. A render becomes visible by renaming its
+staging directory, so readers (including other uvicorn workers) only ever see
+complete reports.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait as wait_futures
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+import data_store
+import diagnostics
+import risk
+import telemetry
+
+log = diagnostics.get_logger('report_renderer')
+
+REPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'reports')
+MANIFEST_NAME = 'manifest.json'
+KEEP_REPORTS = 6            # Rendered reports kept on disk, newest first
+
+# Re-entrant: a render that is already finished runs its done-callback inside _submit
+_lock = threading.RLock()
+_executor = None
+_pending = {}               # fingerprint -> Future of the render in progress
+
+
+def _hash_value(h, value):
+    if isinstance(value, (pd.Series, pd.DataFrame)):
+        labels = list(value.columns) if isinstance(value, pd.DataFrame) else value.name
+        h.update(repr(labels).encode('utf-8'))
+        h.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, dict):
+        for key in sorted(value, key=str):
+            h.update(str(key).encode('utf-8'))
+            _hash_value(h, value[key])
+    elif isinstance(value, np.ndarray):
+        h.update(np.ascontiguousarray(value).tobytes())
+    else:
+        h.update(repr(value).encode('utf-8'))
+
+
+def fingerprint(base, metrics, prices):
+    """Content hash of everything the report is drawn from (not the data version)."""
+    h = hashlib.sha256(base.encode('utf-8'))
+    _hash_value(h, metrics)
+    _hash_value(h, prices)
+    return h.hexdigest()[:16]
+
+
+def report_path(fp, filename=None):
+    directory = os.path.join(REPORT_DIR, fp)
+    return os.path.join(directory, filename) if filename else directory
+
+
+def read_manifest(fp):
+    """Manifest of the rendered report `fp`, or None if it has not been rendered."""
+    try:
+        with open(report_path(fp, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _render(fp, base, version_tag, metrics, prices):
+    """Runs in the worker process: render into a staging directory, then publish it."""
+    import report
+
+    final = report_path(fp)
+    staging = f"{final}.tmp{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    start = time.perf_counter()
+    files = report.render(metrics, prices, staging)
+    manifest = {
+        'fingerprint': fp,
+        'base': base,
+        'version': version_tag,
+        'renderedAt': time.time(),
+        'renderSeconds': time.perf_counter() - start,
+        'files': files,
+    }
+    with open(os.path.join(staging, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f)
+    try:
+        os.replace(staging, final)
+    except OSError:
+        # Published meanwhile by another server worker
+        shutil.rmtree(staging, ignore_errors=True)
+    return manifest
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # spawn, not fork: the child must not inherit the server's threads and locks
+        _executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def _prune():
+    """Delete all but the newest KEEP_REPORTS rendered reports."""
+    try:
+        names = [n for n in os.listdir(REPORT_DIR) if '.tmp' not in n]
+    except FileNotFoundError:
+        return
+    names.sort(key=lambda n: os.path.getmtime(os.path.join(REPORT_DIR, n)), reverse=True)
+    for name in names[KEEP_REPORTS:]:
+        if name not in _pending:
+            shutil.rmtree(os.path.join(REPORT_DIR, name), ignore_errors=True)
+
+
+def _submit(fp, base, panel):
+    metrics = data_store.get_risk_metrics(base, panel)
+    if metrics is None:
+        raise ValueError("Insufficient data to calculate metrics for the report")
+    prices = data_store.get_prices(base, panel)
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    log.info("Rendering report %s (%s, data version %s)", fp, base, panel['version_tag'])
+    future = _get_executor().submit(_render, fp, base, panel['version_tag'], metrics, prices)
+
+    def done(f):
+        global _executor
+        if f.exception() is not None:
+            telemetry.inc('alpha_stage_errors_total', stage='report_render')
+            log.error("Report %s failed to render: %s", fp, f.exception())
+            if isinstance(f.exception(), BrokenProcessPool):
+                # The worker process died; the retry starts a new one
+                with _lock:
+                    _executor = None
+            return
+        telemetry.observe('alpha_stage_seconds', f.result()['renderSeconds'], stage='report_render')
+        with _lock:
+            _pending.pop(fp, None)
+            _prune()
+
+    future.add_done_callback(done)
+    return future
+
+
+def get_report(base=risk.BASE_CURRENCY, panel=None, wait=0):
+    """
+    Status of the report for the current data: 'ready' (with its manifest),
+    'rendering' or 'failed'. Starts a render when no report exists for the
+    metrics' fingerprint, then waits up to `wait` seconds for it to finish.
+    A failed render is retried on the next call.
+    """
+    if panel is None:
+        panel = data_store.get_panel()
+    fp = data_store.get_cached(
+        ('report_fingerprint', base),
+        lambda p: fingerprint(base, data_store.get_risk_metrics(base, p), data_store.get_prices(base, p)),
+        panel
+    )
+    status = {'version': panel['version_tag'], 'base': base, 'fingerprint': fp}
+
+    manifest = read_manifest(fp)
+    if manifest is None:
+        with _lock:
+            future = _pending.get(fp)
+            if future is None or (future.done() and future.exception() is not None):
+                future = _pending[fp] = _submit(fp, base, panel)
+        if wait > 0:
+            wait_futures([future], timeout=wait)
+        if future.done() and future.exception() is not None:
+            return {**status, 'status': 'failed', 'error': str(future.exception())}
+        manifest = read_manifest(fp)
+        if manifest is None:
+            return {**status, 'status': 'rendering'}
+    return {**status, 'status': 'ready', 'renderedFor': manifest['version'],
+            'renderedAt': manifest['renderedAt'], 'files': manifest['files']}
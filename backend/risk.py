@@ -1,9 +1,13 @@
-import yfinance as yf
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from datetime import datetime, timedelta
+from datetime import timedelta
+
+import diagnostics
+import providers
+import rates
+import telemetry
+
+log = diagnostics.get_logger('risk')
 
 
 # ==========================================
@@ -47,6 +51,7 @@ BENCHMARK_WIG = 'WIG20.WA'  # Polish WIG20 Index
 BENCHMARK_MSCI = 'URTH'     # iShares MSCI World ETF
 WATCHLIST_FX = ['USDPLN=X', 'EURPLN=X', 'EURUSD=X', 'DKKEUR=X', 'JPYUSD=X'] # Pairs to track
 BASE_CURRENCY = 'USD'
+REPORTING_CURRENCIES = ['USD', 'PLN', 'EUR'] # Currencies the dashboard can be rebased into
 LOOKBACK_YEARS = 6
 
 # Cost of Carry Assumptions
@@ -60,16 +65,24 @@ BORROW_FEE = 0.01   # 1.0% hard-to-borrow fee estimate
 # ==========================================
 # 2. DATA ENGINE: Fetch & Normalize
 # ==========================================
-def fetch_data():
-    print("--- 1. Initializing Data Download ---")
-    
-    tickers = list(PORTFOLIO_CONFIG.keys())
+@telemetry.timed('fetch_data')
+def fetch_data(portfolio=None):
+    """
+    Prices, FX rates and volume for `portfolio` (default: the house book) plus
+    the benchmarks, from the active market data provider (providers.py).
+    """
+    log.debug("1. Initializing data download")
+    if portfolio is None:
+        portfolio = PORTFOLIO_CONFIG
+    provider = providers.get_provider()
+    
+    tickers = list(portfolio.keys())
     tickers.append(BENCHMARK)
     tickers.append(BENCHMARK_WIG)   # Polish WIG
     tickers.append(BENCHMARK_MSCI)  # MSCI World
     
-    # Identify unique currencies
-    currencies = list(set([item['currency'] for item in PORTFOLIO_CONFIG.values()]))
+    # Identify unique currencies (holdings + reporting currencies for rebasing)
+    currencies = list(set([item['currency'] for item in portfolio.values()] + REPORTING_CURRENCIES))
     fx_pairs = []
     for curr in currencies:
         if curr != BASE_CURRENCY:
@@ -80,52 +93,34 @@ def fetch_data():
         if fx not in fx_pairs:
             fx_pairs.append(fx)
     
-    start_date = (datetime.now() - timedelta(days=LOOKBACK_YEARS*365)).strftime('%Y-%m-%d')
+    start_date = (providers.now() - timedelta(days=LOOKBACK_YEARS*365)).strftime('%Y-%m-%d')
     
-    print(f"Fetching stock data for {len(tickers)} tickers from {start_date}...")
-    stock_raw = yf.download(tickers, start=start_date, auto_adjust=True)
-    print(f"Stock Raw Shape: {stock_raw.shape}")
-    if stock_raw.empty:
-         print("WARNING: Stock Raw is EMPTY!")
-    
-    # Handle Data Structure (MultiIndex vs Single)
-    if isinstance(stock_raw.columns, pd.MultiIndex):
-        try:
-            stock_data = stock_raw['Close']
-            volume_data = stock_raw['Volume']
-        except KeyError:
-             stock_data = stock_raw.xs('Close', axis=1, level=0, drop_level=True)
-             volume_data = stock_raw.xs('Volume', axis=1, level=0, drop_level=True)
-    elif 'Close' in stock_raw.columns:
-         stock_data = stock_raw['Close']
-         volume_data = stock_raw['Volume']
-    else:
-        stock_data = stock_raw
-        # Use dummy volume if missing (should not happen with standard downloads)
-        volume_data = pd.DataFrame(1, index=stock_raw.index, columns=stock_raw.columns)
+    log.info("Fetching stock data for %d tickers from %s (%s)", len(tickers), start_date, provider.name)
+    with telemetry.stage('download_stocks'):
+        stock_data, volume_data = provider.download(tickers, start=start_date)
+    log.info("Stock data shape: %s", stock_data.shape)
+    telemetry.inc('alpha_rows_fetched_total', len(stock_data), kind='stocks')
+    if stock_data.empty:
+         log.warning("Stock download returned no data")
+         telemetry.inc('alpha_fetch_failures_total', kind='stocks')
         
-    print(f"Fetching FX rates for: {fx_pairs}...")
-    fx_raw = yf.download(fx_pairs, start=start_date, auto_adjust=True)
-    
-    if isinstance(fx_raw.columns, pd.MultiIndex):
-        try:
-            fx_data = fx_raw['Close']
-        except KeyError:
-             fx_data = fx_raw.xs('Close', axis=1, level=0, drop_level=True)
-    elif 'Close' in fx_raw.columns:
-         fx_data = fx_raw['Close']
-    else:
-        fx_data = fx_raw
+    log.info("Fetching FX rates for: %s", fx_pairs)
+    with telemetry.stage('download_fx'):
+        fx_data, _ = provider.download(fx_pairs, start=start_date)
+    telemetry.inc('alpha_rows_fetched_total', len(fx_data), kind='fx')
+    if fx_data.empty:
+        telemetry.inc('alpha_fetch_failures_total', kind='fx')
 
     return stock_data, fx_data, volume_data
 
-def normalize_to_base_currency(stock_df, fx_df):
-    print("--- 2. Normalizing Currencies to USD ---")
+@telemetry.timed('normalize')
+def normalize_to_base_currency(stock_df, fx_df, portfolio=None):
+    log.debug("2. Normalizing currencies to %s", BASE_CURRENCY)
     normalized_df = stock_df.copy()
     
-    for ticker, info in PORTFOLIO_CONFIG.items():
+    for ticker, info in (portfolio or PORTFOLIO_CONFIG).items():
         if ticker not in normalized_df.columns:
-            print(f"Warning: Data for {ticker} not found (Might be new or delisted). Skipping.")
+            log.warning("Data for %s not found (might be new or delisted). Skipping.", ticker, extra={'ticker': ticker})
             continue
             
         currency = info['currency']
@@ -138,45 +133,87 @@ def normalize_to_base_currency(stock_df, fx_df):
             fx_series = fx_df[fx_ticker].reindex(normalized_df.index).ffill()
             normalized_df[ticker] = normalized_df[ticker] * fx_series
         else:
-            print(f"Error: FX data missing for {currency}. Calculations for {ticker} might be wrong.")
+            log.error("FX data missing for %s. Calculations for %s might be wrong.", currency, ticker,
+                      extra={'ticker': ticker, 'currency': currency})
             
     return normalized_df
 
+def get_fx_rate(fx_df, from_currency, to_currency, index=None):
+    """
+    Units of `to_currency` per one unit of `from_currency`, taken from the direct
+    pair (e.g. USDPLN=X) or inverted from the reverse pair (PLNUSD=X).
+    Returns None if neither pair is in the FX panel.
+    """
+    if from_currency == to_currency:
+        return pd.Series(1.0, index=index if index is not None else fx_df.index)
+
+    direct = f"{from_currency}{to_currency}=X"
+    inverse = f"{to_currency}{from_currency}=X"
+    if fx_df is not None and direct in fx_df.columns:
+        fx_series = fx_df[direct]
+    elif fx_df is not None and inverse in fx_df.columns:
+        fx_series = 1.0 / fx_df[inverse]
+    else:
+        return None
+
+    if index is not None:
+        fx_series = fx_series.reindex(index).ffill()
+    return fx_series
+
+@telemetry.timed('rebase')
+def rebase_to_currency(usd_df, fx_df, currency):
+    """
+    Re-express the canonical USD panel in another reporting currency.
+    Every column (holdings and benchmarks) is multiplied by the same USD->currency
+    series, so all downstream returns/metrics are as seen by a `currency` investor.
+    """
+    if currency == BASE_CURRENCY:
+        return usd_df
+
+    log.debug("2b. Rebasing %s panel to %s", BASE_CURRENCY, currency)
+    fx_series = get_fx_rate(fx_df, BASE_CURRENCY, currency, usd_df.index)
+    if fx_series is None:
+        raise ValueError(f"FX data missing for {BASE_CURRENCY}->{currency}. Cannot rebase.")
+
+    return usd_df.mul(fx_series, axis=0)
+
+def validate_portfolio_config(config):
+    """
+    Check a portfolio definition follows the PORTFOLIO_CONFIG schema:
+    {ticker: {'weight': float > 0, 'type': 'Long'|'Short', 'currency': str}}.
+    Raises ValueError describing the first problem found.
+    """
+    if not isinstance(config, dict) or not config:
+        raise ValueError("Portfolio must be a non-empty mapping of ticker -> position")
+    for ticker, info in config.items():
+        if not isinstance(info, dict):
+            raise ValueError(f"{ticker}: position must be a mapping")
+        weight = info.get('weight')
+        if isinstance(weight, bool) or not isinstance(weight, (int, float)) or weight <= 0:
+            raise ValueError(f"{ticker}: 'weight' must be a positive number")
+        if info.get('type') not in ('Long', 'Short'):
+            raise ValueError(f"{ticker}: 'type' must be 'Long' or 'Short'")
+        if not isinstance(info.get('currency'), str):
+            raise ValueError(f"{ticker}: 'currency' must be a currency code")
+    return config
+
 # ==========================================
 # 3. RISK CALCULATOR
 # ==========================================
 # ==========================================
 # 3. RISK CALCULATOR (ADVANCED)
 # ==========================================
-def calculate_risk_metrics(price_df, volume_df=None, fx_df=None):
-    print("--- 3. Calculating Advanced Risk Metrics ---")
+@telemetry.timed('risk_metrics')
+def calculate_risk_metrics(price_df, volume_df=None, fx_df=None, base_currency=BASE_CURRENCY, portfolio=None):
+    log.debug("3. Calculating advanced risk metrics (%s)", base_currency)
+    lap = telemetry.laps('risk_metrics')  # Per-section timings (stages risk_metrics.<section>)
     
-    if price_df.empty or len(price_df) < 2:
-        print("Error: Insufficient price data.")
-        return None
-        
-    # Use dropna(how='all') to only drop rows where ALL values are NaN
-    # This prevents dropping rows where just some tickers are missing
-    returns_df = price_df.pct_change().dropna(how='all')
-    
-    # ... (skipping unchanged parts) ...
-
-    # --- 5. YTD METRICS ---
-    # ... (skipping calculation setup) ...
-
-    # [Locate where we insert the FX Logic]
-    # It was around line 493 where the error happened.
-    pass
-
-    # ... (Wait, I need to replace the whole function start or find the specific block)
-    # Let's replace the signature first.
-
-# Actually, let's fix the block I messed up first.
-
-    print("--- 3. Calculating Advanced Risk Metrics ---")
+    # Defaults to the house book; batch / job callers pass their own config
+    if portfolio is None:
+        portfolio = PORTFOLIO_CONFIG
     
     if price_df.empty or len(price_df) < 2:
-        print("Error: Insufficient price data.")
+        log.warning("Insufficient price data (%d rows)", len(price_df))
         return None
         
     # Use dropna(how='all') to only drop rows where ALL values are NaN
@@ -184,30 +221,23 @@ def calculate_risk_metrics(price_df, volume_df=None, fx_df=None):
     returns_df = price_df.pct_change().dropna(how='all')
     
     if returns_df.empty or len(returns_df) < 2:
-        print("Error: Insufficient returns data after pct_change.")
+        log.warning("Insufficient returns data after pct_change")
         return None
     
     if BENCHMARK not in returns_df.columns:
-        print(f"Critical Error: Benchmark {BENCHMARK} data missing.")
+        log.error("Benchmark %s data missing", BENCHMARK, extra={'ticker': BENCHMARK})
         return None
 
     benchmark_ret = returns_df[BENCHMARK]
     
-    # --- 0.5. DYNAMIC RISK FREE RATE (^TNX) ---
-    try:
-        tnx = yf.Ticker("^TNX")
-        tnx_hist = tnx.history(period="5d")
-        if not tnx_hist.empty:
-            # TNX is yield (e.g., 4.25), convert to decimal (0.0425)
-            latest_yield = tnx_hist['Close'].iloc[-1]
-            rf_rate = latest_yield / 100.0
-            print(f"DEBUG: Using Dynamic Risk-Free Rate (^TNX): {rf_rate:.4%}")
-        else:
-            rf_rate = 0.04
-            print("Warning: ^TNX data unavailable. Defaulting Rf to 4%.")
-    except Exception as e:
-        print(f"Error fetching ^TNX: {e}. Defaulting Rf to 4%.")
-        rf_rate = 0.04
+    # --- 0.5. DYNAMIC RISK FREE RATE (Cached Curve) ---
+    # Point-in-time daily curve from the rates service (no network call here).
+    rf_daily_series = rates.align_rates(returns_df.index, base_currency)
+    rf_rate = rates.get_rate(base_currency) # Latest rate (reporting / Monte Carlo)
+    rf_hist = rf_daily_series.mean()        # Average rate over the history window
+    log.debug("Risk-free rate latest %.4f%%, period avg %.4f%%", rf_rate * 100, rf_hist * 100,
+              extra={'rf_rate': rf_rate, 'rf_hist': rf_hist})
+    lap('returns')
     
     # --- 1. PREPARE PORTFOLIO RETURNS ---
     # Construct a weighted portfolio return series
@@ -222,7 +252,7 @@ def calculate_risk_metrics(price_df, volume_df=None, fx_df=None):
     # We need to normalize weights to 100% of invested capital for some metrics,
     # but for risk attribution, we use the actual exposure weights.
     
-    for ticker, info in PORTFOLIO_CONFIG.items():
+    for ticker, info in portfolio.items():
         if ticker in returns_df.columns:
             weight = info['weight']
             direction = 1 if info['type'] == 'Long' else -1
@@ -241,12 +271,15 @@ def calculate_risk_metrics(price_df, volume_df=None, fx_df=None):
     # Net Debit = Max(0, Long Exposure - 1.0) -> Assuming 1.0 is our Equity
     
     net_debit = max(0, total_long_weight - 1.0)
-    daily_margin_cost = (net_debit * MARGIN_RATE) / 360
+    # Margin floats with the risk-free curve; constant MARGIN_RATE is implied by today's rate
+    margin_rate_series = rf_daily_series + (MARGIN_RATE - rf_rate)
+    daily_margin_cost = (net_debit * margin_rate_series) / 360
     daily_borrow_cost = (total_short_weight * BORROW_FEE) / 360
     total_daily_drag = daily_margin_cost + daily_borrow_cost
     
     # Net Returns (After Cost)
     portfolio_net_ret = portfolio_daily_ret - total_daily_drag
+    lap('portfolio')
 
     # --- 2. CORE METRICS ---
     # Annualize factor
@@ -273,13 +306,14 @@ def calculate_risk_metrics(price_df, volume_df=None, fx_df=None):
     avg_daily_ret = np.mean(portfolio_daily_ret)
     annual_ret = avg_daily_ret * ANNUAL_FACTOR
     
-    # Sharpe Ratio (Dynamic Rf)
-    sharpe_ratio = (annual_ret - rf_rate) / annual_vol if annual_vol > 0 else 0
+    # Sharpe Ratio (Time-varying Rf averaged over the window)
+    sharpe_ratio = (annual_ret - rf_hist) / annual_vol if annual_vol > 0 else 0
     
     # Sortino Ratio (Downside Risk only)
     downside_returns = portfolio_daily_ret[portfolio_daily_ret < 0]
     downside_std = np.std(downside_returns) * np.sqrt(ANNUAL_FACTOR)
-    sortino_ratio = (annual_ret - rf_rate) / downside_std if downside_std > 0 else 0
+    sortino_ratio = (annual_ret - rf_hist) / downside_std if downside_std > 0 else 0
+    lap('core')
     
     # --- 3. TAIL RISK ---
     # Rolling 1-Month Standard Deviation (Annualized)
@@ -305,6 +339,7 @@ def calculate_risk_metrics(price_df, volume_df=None, fx_df=None):
     running_max = cum_ret.cummax()
     drawdown = (cum_ret - running_max) / running_max
     max_drawdown = drawdown.min()
+    lap('tail')
 
     # --- 4. RISK ATTRIBUTION (MCTR) ---
     # Marginal Contribution to Total Risk
@@ -315,7 +350,7 @@ def calculate_risk_metrics(price_df, volume_df=None, fx_df=None):
     
     if daily_vol > 0:
         for ticker in active_tickers:
-            info = PORTFOLIO_CONFIG[ticker]
+            info = portfolio[ticker]
             weight = info['weight']
             direction = 1 if info['type'] == 'Long' else -1 # Directional weight
             signed_weight = weight * direction
@@ -360,16 +395,17 @@ def calculate_risk_metrics(price_df, volume_df=None, fx_df=None):
     avg_bench_ret = np.mean(benchmark_ret)
     annual_bench_ret = avg_bench_ret * ANNUAL_FACTOR
     
-    expected_return = rf_rate + portfolio_beta * (annual_bench_ret - rf_rate)
+    expected_return = rf_hist + portfolio_beta * (annual_bench_ret - rf_hist)
     jensens_alpha = annual_ret - expected_return
     
     # Metadata for transparency
     calc_start_date = returns_df.index[0].strftime('%Y-%m-%d')
     calc_end_date = returns_df.index[-1].strftime('%Y-%m-%d')
     period_years = (returns_df.index[-1] - returns_df.index[0]).days / 365.25
+    lap('attribution')
 
     # --- 5. YTD METRICS ---
-    current_year = datetime.now().year
+    current_year = providers.now().year
     ytd_calc_start = f"{current_year}-01-01"
     
     # Standard YTD Logic: Return = (Current_Price - Prev_Year_Close) / Prev_Year_Close
@@ -417,8 +453,8 @@ def calculate_risk_metrics(price_df, volume_df=None, fx_df=None):
         # So for Benchmark *Returns* Series, we don't need to change the slice (it should start Jan 2).
         # We only need to be careful if we are comparing price series.
         pass
-    except Exception as e:
-        print(f"Error adjusting YTD Start Date: {e}")
+    except Exception:
+        log.exception("Error adjusting YTD start date")
         # Fallback to current year start is already set
         ytd_prices = price_df_filled[price_df_filled.index >= ytd_calc_start]
         pass
@@ -443,7 +479,7 @@ def calculate_risk_metrics(price_df, volume_df=None, fx_df=None):
         # This correctly starts the chart at 0% (Value 1.0) on Dec 31.
         
         for ticker in active_tickers:
-            info = PORTFOLIO_CONFIG[ticker]
+            info = portfolio[ticker]
             weight = info['weight'] 
             direction = 1 if info['type'] == 'Long' else -1
             
@@ -483,23 +519,27 @@ def calculate_risk_metrics(price_df, volume_df=None, fx_df=None):
         else:
             ytd_beta = 0
             
+        # YTD Risk-Free Rate (curve averaged over the YTD window)
+        rf_ytd_series = rf_daily_series[rf_daily_series.index >= ytd_calc_start]
+        rf_ytd = rf_ytd_series.mean() if not rf_ytd_series.empty else rf_rate
+
         # Risk Efficiency -> YTD Sharpe
         ytd_vol = np.std(ytd_portfolio_daily_ret) * np.sqrt(ANNUAL_FACTOR)
         ytd_ann_ret = np.mean(ytd_portfolio_daily_ret) * ANNUAL_FACTOR
-        ytd_sharpe = (ytd_ann_ret - rf_rate) / ytd_vol if ytd_vol > 0 else 0
+        ytd_sharpe = (ytd_ann_ret - rf_ytd) / ytd_vol if ytd_vol > 0 else 0
         
         # Benchmark YTD Sharpe
         bench_ytd_vol = np.std(ytd_benchmark) * np.sqrt(ANNUAL_FACTOR)
         bench_ytd_ann_ret = np.mean(ytd_benchmark) * ANNUAL_FACTOR
-        bench_ytd_sharpe = (bench_ytd_ann_ret - rf_rate) / bench_ytd_vol if bench_ytd_vol > 0 else 0
+        bench_ytd_sharpe = (bench_ytd_ann_ret - rf_ytd) / bench_ytd_vol if bench_ytd_vol > 0 else 0
         
         # YTD Jensen's Alpha
-        ytd_expected_return = rf_rate + ytd_beta * (bench_ytd_ann_ret - rf_rate)
+        ytd_expected_return = rf_ytd + ytd_beta * (bench_ytd_ann_ret - rf_ytd)
         ytd_alpha = ytd_ann_ret - ytd_expected_return
 
         # Benchmark Historical Sharpe
         bench_ann_vol = np.std(benchmark_ret) * np.sqrt(ANNUAL_FACTOR)
-        bench_hist_sharpe = (annual_bench_ret - rf_rate) / bench_ann_vol if bench_ann_vol > 0 else 0
+        bench_hist_sharpe = (annual_bench_ret - rf_hist) / bench_ann_vol if bench_ann_vol > 0 else 0
         
         # YTD Max Drawdown (Portfolio)
         ytd_cum_max = portfolio_val_series.cummax()
@@ -517,73 +557,43 @@ def calculate_risk_metrics(price_df, volume_df=None, fx_df=None):
         else:
             ytd_bench_max_drawdown = 0.0
 
-        # --- 5.1 FX WATCHLIST YTD ---
-        fx_watchlist_data = {}
-        if fx_df is not None:
-            for fx_ticker in WATCHLIST_FX:
-                try:
-                    if fx_ticker in fx_df.columns:
-                        series = fx_df[fx_ticker]
-                        # Fix TZ if needed
-                        if hasattr(series.index, 'tz') and series.index.tz is not None:
-                            series.index = series.index.tz_localize(None)
-
-                        if not series.empty:
-                            curr_val = series.iloc[-1]
-                            # Find start val (close of prev year)
-                            start_idx = series.index.searchsorted(pd.Timestamp(ytd_calc_start))
-                            if start_idx > 0:
-                                start_val = series.iloc[start_idx - 1]
-                                ytd_fx = (curr_val - start_val) / start_val
-                                fx_watchlist_data[fx_ticker] = ytd_fx
-                            elif start_idx == 0:
-                                start_val = series.iloc[0]
-                                ytd_fx = (curr_val - start_val) / start_val
-                                fx_watchlist_data[fx_ticker] = ytd_fx
-                except Exception as e:
-                     print(f"Error calc FX YTD for {fx_ticker}: {e}")
-
-        # PLN Return (USD Return + FX Change)
+        # PLN Return (Base-Currency Return + FX Change)
+        # Uses the already-fetched FX panel instead of a separate USDPLN download.
         try:
-            usdpln = yf.Ticker("USDPLN=X")
-            # Fetch explicitly covering end of last year
-            pln_hist = usdpln.history(start=(pd.Timestamp(ytd_calc_start) - pd.Timedelta(days=10)))
-            
-            if not pln_hist.empty:
+            pln_hist = None
+            if fx_df is not None:
+                pln_hist = get_fx_rate(fx_df, base_currency, 'PLN')
+
+            if base_currency == 'PLN':
+                ytd_return_pln = ytd_return
+            elif pln_hist is not None and not pln_hist.dropna().empty:
+                pln_hist = pln_hist.dropna()
                 # Normalize timezone to match price_df
-                if hasattr(pln_hist.index, 'tz'):
+                if hasattr(pln_hist.index, 'tz') and pln_hist.index.tz is not None:
                     pln_hist.index = pln_hist.index.tz_localize(None)
 
-                # Find the closest available price to YTD start (Dec 31 if possible, else Jan 1/2)
-                # We want the last price BEFORE or ON ytd_calc_start (actually before Jan 1 usually means Dec 31)
-                # But since we use simple pct_change for FX, let's just grab the price at the START of our ytd_prices period.
-                
+                # Grab the FX rate at the START of our ytd_prices period (Dec 31 or closest previous)
                 target_start_date = ytd_prices.index[0] # Should be Dec 31 or Jan 2
-                
-                # Find available index closest to target_start_date
-                # Using searchsorted / get_indexer methodology or just loop
-                
-                # Simplest: reindex
                 idx_loc = pln_hist.index.searchsorted(target_start_date)
-                # If exact match or close
                 if idx_loc < len(pln_hist) and pln_hist.index[idx_loc] == target_start_date:
-                    pln_start_val = pln_hist['Close'].iloc[idx_loc]
+                    pln_start_val = pln_hist.iloc[idx_loc]
                 elif idx_loc > 0:
-                     # If target date (e.g. Dec 31) exists, it should be matched. 
-                     # If not (maybe FX trades on Jan 1?), take closest previous.
-                     pln_start_val = pln_hist['Close'].iloc[idx_loc-1]
+                    pln_start_val = pln_hist.iloc[idx_loc-1]
                 else:
-                    pln_start_val = pln_hist['Close'].iloc[0]
+                    pln_start_val = pln_hist.iloc[0]
                 
-                pln_end_val = pln_hist['Close'].iloc[-1]
+                pln_end_val = pln_hist.iloc[-1]
                 
                 fx_ytd_change = (pln_end_val - pln_start_val) / pln_start_val
                 ytd_return_pln = (1 + ytd_return) * (1 + fx_ytd_change) - 1
                 
             else:
+                log.warning("No %s/PLN FX rate; YTD_Return_PLN falls back to the %s return",
+                            base_currency, base_currency, extra={'currency': base_currency})
                 ytd_return_pln = ytd_return
                 
-        except Exception as e:
+        except Exception:
+            log.exception("Error calculating PLN YTD return")
             ytd_return_pln = ytd_return
         
         # WIG YTD
@@ -636,104 +646,24 @@ def calculate_risk_metrics(price_df, volume_df=None, fx_df=None):
         ytd_shorts_contrib = 0.0
         ytd_max_drawdown = 0.0
         ytd_bench_max_drawdown = 0.0
+    lap('ytd')
 
     # --- 6. VOLUME WEIGHTED CORRELATION (Past 1 Year) ---
     vol_weighted_corr = pd.DataFrame()
     if volume_df is not None and not volume_df.empty:
-        try:
-            print("Calculating Volume Weighted Correlation Matrix...")
-            # Filter for last 1 year (252 trading days)
-            one_year_ago = price_df.index[-1] - pd.Timedelta(days=365)
-            
-            # Align slices
-            sub_rets = returns_df[returns_df.index >= one_year_ago]
-            # Reindex aligned volume and prices
-            sub_vol = volume_df.reindex(sub_rets.index).fillna(0)
-            sub_prices = price_df.reindex(sub_rets.index).ffill()
-            
-            # Use active tickers only involved in portfolio
-            calc_tickers = [t for t in active_tickers if t in sub_rets.columns and t in sub_vol.columns]
-            
-            # Calculate Dollar Volume = Price * Volume
-            dv_df = sub_prices[calc_tickers] * sub_vol[calc_tickers]
-            
-            # Initialize Matrix
-            n = len(calc_tickers)
-            vw_corr_mat = np.eye(n)
-            
-            # Pairwise Calculation
-            for i in range(n):
-                for j in range(i + 1, n):
-                    t1, t2 = calc_tickers[i], calc_tickers[j]
-                    
-                    r1 = sub_rets[t1].values
-                    r2 = sub_rets[t2].values
-                    dv1 = dv_df[t1].values
-                    dv2 = dv_df[t2].values
-                    
-                    # Weights: Geometric mean of Dollar Volumes
-                    w = np.sqrt(dv1 * dv2)
-                    w_sum = np.sum(w)
-                    
-                    if w_sum != 0:
-                        w_norm = w / w_sum
-                        mu1 = np.sum(r1 * w_norm)
-                        mu2 = np.sum(r2 * w_norm)
-                        cov = np.sum(w_norm * (r1 - mu1) * (r2 - mu2))
-                        var1 = np.sum(w_norm * (r1 - mu1)**2)
-                        var2 = np.sum(w_norm * (r2 - mu2)**2)
-                        
-                        if var1 > 0 and var2 > 0:
-                            corr_val = cov / np.sqrt(var1 * var2)
-                        else:
-                            corr_val = 0
-                        
-                        vw_corr_mat[i, j] = corr_val
-                        vw_corr_mat[j, i] = corr_val
-
-            vol_weighted_corr = pd.DataFrame(vw_corr_mat, index=calc_tickers, columns=calc_tickers)
-            
-        except Exception as e:
-            print(f"Error calculating Volume Weighted Correlation: {e}")
-            vol_weighted_corr = pd.DataFrame()
+        vol_weighted_corr = calculate_volume_weighted_correlation(price_df, volume_df, active_tickers, returns_df)
+    correlation_matrix = returns_df.corr()
+    lap('correlation')
 
-    with open("debug_risk.txt", "a") as f:
-        f.write(f"DEBUG: YTD Return (Cum): {ytd_return:.4%}\n")
+    log.debug("YTD return (cumulative) %.4f%%", ytd_return * 100,
+              extra={'ytd_return': ytd_return, 'ytd_return_pln': ytd_return_pln, 'base_currency': base_currency})
 
     # --- 9. FX WATCHLIST METRICS ---
-    fx_watchlist_metrics = {}
-    if fx_df is not None and not fx_df.empty:
-        try:
-            curr_year_start = pd.Timestamp(f"{datetime.now().year}-01-01")
-            for fx_ticker in WATCHLIST_FX:
-                if fx_ticker in fx_df.columns:
-                    series = fx_df[fx_ticker].dropna()
-                    if series.empty: continue
-                    if hasattr(series.index, 'tz') and series.index.tz is not None:
-                        series.index = series.index.tz_localize(None)
-                    
-                    current_val = series.iloc[-1]
-                    idx_start = series.index.searchsorted(curr_year_start)
-                    
-                    if idx_start > 0:
-                        start_val = series.iloc[idx_start - 1]
-                        ytd_perf = (current_val - start_val) / start_val
-                    elif idx_start == 0:
-                        start_val = series.iloc[0]
-                        ytd_perf = (current_val - start_val) / start_val
-                    else:
-                        ytd_perf = 0.0
-                    
-                    # Clean Name
-                    clean_name = fx_ticker.replace("=X", "").replace("-", "/")
-                    if len(clean_name) == 6 and "/" not in clean_name:
-                         clean_name = f"{clean_name[:3]}/{clean_name[3:]}"
-                    
-                    fx_watchlist_metrics[clean_name] = ytd_perf
-        except Exception as e:
-            print(f"Error calculating FX metrics: {e}")
+    fx_watchlist_metrics = calculate_fx_watchlist(fx_df)
+    lap('fx_watchlist')
 
     return {
+        'Base_Currency': base_currency,
         'Beta': portfolio_beta,
         'Annual_Return': annual_ret,
         'Annual_Vol': annual_vol,
@@ -745,6 +675,7 @@ def calculate_risk_metrics(price_df, volume_df=None, fx_df=None):
         'VaR_95': var_95,
         'Max_Drawdown': max_drawdown,
         'Jensens_Alpha': jensens_alpha,
+        'Risk_Free_Rate': rf_rate,
         'Period_Info': {
             'Start_Date': calc_start_date,
             'End_Date': calc_end_date,
@@ -769,22 +700,133 @@ def calculate_risk_metrics(price_df, volume_df=None, fx_df=None):
         'Benchmark_Stream': benchmark_ret, 
         'Drawdown_Stream': drawdown,
         'Risk_Attribution': risk_contribution,
-        'Correlation_Matrix': returns_df.corr(),
+        'Correlation_Matrix': correlation_matrix,
         'Volume_Weighted_Correlation': vol_weighted_corr,
         'Leverage_Stats': {
             'Long_Exp': total_long_weight,
             'Short_Exp': total_short_weight,
             'Gross_Exp': total_long_weight + total_short_weight,
             'Net_Exp': total_long_weight - total_short_weight,
-            'Daily_Drag': total_daily_drag
+            'Daily_Drag': float(total_daily_drag.iloc[-1]) # Current carry at today's rates
         },
         'Fx_Watchlist': fx_watchlist_metrics,
         'YTD_Stream': portfolio_val_series if 'portfolio_val_series' in locals() else None,
         'YTD_Benchmark_Stream': ytd_benchmark if 'ytd_benchmark' in locals() else None
     }
 
+@telemetry.timed('vw_correlation')
+def calculate_volume_weighted_correlation(price_df, volume_df, tickers=None, returns_df=None):
+    """
+    Pairwise correlation of the last year of daily returns, each day weighted by the
+    geometric mean of the two names' dollar volumes. Can be run on its own (without
+    the rest of calculate_risk_metrics) for the correlation widget.
+    """
+    if volume_df is None or volume_df.empty:
+        return pd.DataFrame()
+    if returns_df is None:
+        returns_df = price_df.pct_change().dropna(how='all')
+    if tickers is None:
+        tickers = [t for t in PORTFOLIO_CONFIG if t in returns_df.columns]
+
+    try:
+        log.debug("Calculating volume weighted correlation matrix")
+        # Filter for last 1 year (252 trading days)
+        one_year_ago = price_df.index[-1] - pd.Timedelta(days=365)
+        
+        # Align slices
+        sub_rets = returns_df[returns_df.index >= one_year_ago]
+        # Reindex aligned volume and prices
+        sub_vol = volume_df.reindex(sub_rets.index).fillna(0)
+        sub_prices = price_df.reindex(sub_rets.index).ffill()
+        
+        # Use active tickers only involved in portfolio
+        calc_tickers = [t for t in tickers if t in sub_rets.columns and t in sub_vol.columns]
+        
+        # Calculate Dollar Volume = Price * Volume
+        dv_df = sub_prices[calc_tickers] * sub_vol[calc_tickers]
+        
+        # Initialize Matrix
+        n = len(calc_tickers)
+        vw_corr_mat = np.eye(n)
+        
+        # Pairwise Calculation
+        for i in range(n):
+            for j in range(i + 1, n):
+                t1, t2 = calc_tickers[i], calc_tickers[j]
+                
+                r1 = sub_rets[t1].values
+                r2 = sub_rets[t2].values
+                dv1 = dv_df[t1].values
+                dv2 = dv_df[t2].values
+                
+                # Weights: Geometric mean of Dollar Volumes
+                w = np.sqrt(dv1 * dv2)
+                w_sum = np.sum(w)
+                
+                if w_sum != 0:
+                    w_norm = w / w_sum
+                    mu1 = np.sum(r1 * w_norm)
+                    mu2 = np.sum(r2 * w_norm)
+                    cov = np.sum(w_norm * (r1 - mu1) * (r2 - mu2))
+                    var1 = np.sum(w_norm * (r1 - mu1)**2)
+                    var2 = np.sum(w_norm * (r2 - mu2)**2)
+                    
+                    if var1 > 0 and var2 > 0:
+                        corr_val = cov / np.sqrt(var1 * var2)
+                    else:
+                        corr_val = 0
+                    
+                    vw_corr_mat[i, j] = corr_val
+                    vw_corr_mat[j, i] = corr_val
+
+        vol_weighted_corr = pd.DataFrame(vw_corr_mat, index=calc_tickers, columns=calc_tickers)
+        
+    except Exception:
+        log.exception("Error calculating volume weighted correlation")
+        vol_weighted_corr = pd.DataFrame()
+
+    return vol_weighted_corr
+
+@telemetry.timed('fx_watchlist')
+def calculate_fx_watchlist(fx_df):
+    """YTD move of each WATCHLIST_FX pair, keyed by display name (e.g. 'USD/PLN')."""
+    fx_watchlist_metrics = {}
+    if fx_df is not None and not fx_df.empty:
+        try:
+            curr_year_start = pd.Timestamp(f"{providers.now().year}-01-01")
+            for fx_ticker in WATCHLIST_FX:
+                if fx_ticker in fx_df.columns:
+                    series = fx_df[fx_ticker].dropna()
+                    if series.empty: continue
+                    if hasattr(series.index, 'tz') and series.index.tz is not None:
+                        series.index = series.index.tz_localize(None)
+                    
+                    current_val = series.iloc[-1]
+                    idx_start = series.index.searchsorted(curr_year_start)
+                    
+                    if idx_start > 0:
+                        start_val = series.iloc[idx_start - 1]
+                        ytd_perf = (current_val - start_val) / start_val
+                    elif idx_start == 0:
+                        start_val = series.iloc[0]
+                        ytd_perf = (current_val - start_val) / start_val
+                    else:
+                        ytd_perf = 0.0
+                    
+                    # Clean Name
+                    clean_name = fx_ticker.replace("=X", "").replace("-", "/")
+                    if len(clean_name) == 6 and "/" not in clean_name:
+                         clean_name = f"{clean_name[:3]}/{clean_name[3:]}"
+                    
+                    fx_watchlist_metrics[clean_name] = ytd_perf
+        except Exception:
+            log.exception("Error calculating FX watchlist metrics")
+
+    return fx_watchlist_metrics
+
+@telemetry.timed('stress_test')
 def stress_test_portfolio(metrics):
-    print("--- 4. Running Stress Tests ---")
+    log.debug("4. Running stress tests")
     if metrics is None: return {}
     
     beta = metrics['Beta']
@@ -806,14 +848,15 @@ def stress_test_portfolio(metrics):
         
     return results
 
+@telemetry.timed('monte_carlo')
 def run_monte_carlo(metrics, num_sims=1000, days=60):
-    print(f"--- 5. Running Monte Carlo Simulation ({num_sims} paths, {days} days) ---")
+    log.debug("5. Running Monte Carlo simulation (%d paths, %d days)", num_sims, days)
     if metrics is None: return None
     
     annual_vol = metrics['Annual_Vol']
     # Geometric Brownian Motion Parameters
     # drift = r - 0.5 * sigma^2
-    rf_rate = 0.04 
+    rf_rate = metrics.get('Risk_Free_Rate', rates.FALLBACK_RATE)
     dt = 1/252
     
     drift = rf_rate - 0.5 * annual_vol**2
@@ -836,8 +879,9 @@ def run_monte_carlo(metrics, num_sims=1000, days=60):
         
     return price_paths
 
+@telemetry.timed('periodic_returns')
 def calculate_periodic_returns(data):
-    print("--- 6. Calculating Periodic Returns (YTD, 1Y, 3Y, 5Y) ---")
+    log.debug("6. Calculating periodic returns (YTD, 1Y, 3Y, 5Y)")
     periods = {
         '1Y': 252,
         '3Y': 252 * 3,
@@ -845,7 +889,7 @@ def calculate_periodic_returns(data):
     }
     
     # YTD calculation: from Jan 1st of current year
-    current_year = datetime.now().year
+    current_year = providers.now().year
     ytd_start = f"{current_year}-01-01"
     
     results = {}
@@ -894,193 +938,13 @@ def calculate_periodic_returns(data):
         
     return pd.DataFrame(results).T
 
-# ==========================================
-# 4. VISUALIZATION
-# ==========================================
 # ==========================================
 # 4. VISUALIZATION & REPORTING
 # ==========================================
 def generate_report(metrics, data):
-    if metrics is None: return
-
-    print("\n" + "="*50)
-    print(f"      HEDGE FUND RISK REPORT ({datetime.now().strftime('%Y-%m-%d')})      ")
-    print("="*50)
-    
-    # --- 0. PERIODIC RETURNS (Print First) ---
-    periodic_rets = calculate_periodic_returns(data)
-    
-    print(f"\n[INDIVIDUAL TICKER PERFORMANCE]")
-    print(f"  {'TICKER':<10} | {'1 YEAR':<10} | {'3 YEARS':<10} | {'5 YEARS':<10}")
-    print("-" * 55)
-    
-    # Sort by 1Y return for display
-    sorted_periodic = periodic_rets.sort_values('1Y', ascending=False)
-    
-    for ticker, row in sorted_periodic.iterrows():
-        r1y = f"{row['1Y']:.1%}" if not np.isnan(row['1Y']) else "N/A"
-        r3y = f"{row['3Y']:.1%}" if not np.isnan(row['3Y']) else "N/A"
-        r5y = f"{row['5Y']:.1%}" if not np.isnan(row['5Y']) else "N/A"
-        
-        print(f"  {ticker:<10} | {r1y:<10} | {r3y:<10} | {r5y:<10}")
-    
-    # --- SUMMARY STATS ---
-    print(f"\n[PORTFOLIO VITALS]")
-    print(f"  Beta:             {metrics['Beta']:.2f}")
-    print(f"  Sharpe Ratio:     {metrics['Sharpe']:.2f}")
-    print(f"  Sortino Ratio:    {metrics['Sortino']:.2f}")
-    print(f"  Ann. Volatility:  {metrics['Annual_Vol']:.1%}")
-    print(f"  Max Drawdown:     {metrics['Max_Drawdown']:.1%}")
-    
-    print(f"\n[TAIL RISK]")
-    print(f"  VaR (95% Daily):  {metrics['VaR_95']:.2%}  (Loss exceeded 5% of days)")
-    print(f"  CVaR (95% Daily): {metrics['CVaR_95']:.2%}  (Arg loss on bad days)")
-    print(f"  *On $100k, Exp. Shortfall is ~${abs(metrics['CVaR_95']*100000):.0f} per day in crisis.*")
-
-    # --- STRESS TEST ---
-    stress_results = stress_test_portfolio(metrics)
-    print(f"\n[STRESS TESTS (Linear Beta Approximation)]")
-    for scenario, result in stress_results.items():
-        print(f"  {scenario:<25} -> PnL Impact: {result:+.2%}")
-
-    # --- RISK ATTRIBUTION ---
-    print(f"\n[RISK ATTRIBUTION (Top Drivers of Volatility)]")
-    sorted_risk = sorted(metrics['Risk_Attribution'].items(), key=lambda x: x[1]['Pct_Risk'], reverse=True)
-    
-    print(f"  {'TICKER':<10} | {'WEIGHT':<8} | {'% TOTAL RISK':<12} | {'COMMENT'}")
-    print("-" * 60)
-    
-    for ticker, stats in sorted_risk[:8]: # Top 8
-        pct_risk = stats['Pct_Risk']
-        weight = stats['Weight']
-        comment = "High Risk Efficiency" if abs(pct_risk) < abs(weight) else "Volatile!"
-        print(f"  {ticker:<10} | {weight:<8.1%} | {pct_risk:<12.1%} | {comment}")
-
-    # --- PLOTS ---
-    # 1. Dashboard Plot
-    fig, axes = plt.subplots(2, 2, figsize=(15, 10))
-    fig.suptitle('Institutional Risk Dashboard', fontsize=16)
-    
-    # A. Current Correlations
-    valid_tickers = [t for t in PORTFOLIO_CONFIG.keys() if t in data.columns]
-    corr_matrix = metrics['Correlation_Matrix'].loc[valid_tickers, valid_tickers]
-    sns.heatmap(corr_matrix, ax=axes[0,0], cmap='RdBu', center=0, annot=False, cbar=True)
-    axes[0,0].set_title('Correlation Heatmap')
-    
-    # B. Cumulative Returns (Alpha Check)
-    cum_returns = (1 + metrics['Returns_Stream']).cumprod()
-    cum_bench = (1 + metrics['Benchmark_Stream']).cumprod()
-    
-    final_port_ret = cum_returns.iloc[-1] - 1
-    final_bench_ret = cum_bench.iloc[-1] - 1
-    alpha = final_port_ret - final_bench_ret
-    
-    axes[0,1].plot(cum_returns, color='green', linewidth=2, label=f'Portfolio ({final_port_ret:+.1%})')
-    axes[0,1].plot(cum_bench, color='gray', linestyle='--', alpha=0.7, label=f'Market ({final_bench_ret:+.1%})')
-    
-    axes[0,1].set_title(f'Alpha Check (Excess Ret: {alpha:+.1%})')
-    axes[0,1].legend()
-    axes[0,1].grid(True, alpha=0.3)
-    
-    # C. Drawdowns
-    drawdown = metrics['Drawdown_Stream']
-    axes[1,0].fill_between(drawdown.index, drawdown, 0, color='red', alpha=0.3)
-    axes[1,0].plot(drawdown, color='red', lw=1)
-    axes[1,0].set_title('Underwater Plot (Drawdowns)')
-    axes[1,0].grid(True, alpha=0.3)
-    
-    # D. Risk Contribution Bar Chart
-    tickers = [x[0] for x in sorted_risk]
-    vals = [x[1]['Pct_Risk'] for x in sorted_risk]
-    colors = ['red' if v > 0 else 'green' for v in vals] # Short positions adding risk are usually hedging (negative risk contrib), if positive they add risk
-    
-    axes[1,1].bar(tickers[:10], vals[:10], color='purple')
-    axes[1,1].set_title('Top Risk Contributors (%)')
-    axes[1,1].tick_params(axis='x', rotation=45)
-    
-    # 2. Future Scenarios Plot (New Figure)
-    fig2, axes2 = plt.subplots(1, 2, figsize=(15, 6))
-    fig2.suptitle('Future Scenarios: "What happens next?"', fontsize=16)
-    
-    # E. Monte Carlo Cone
-    mc_paths = run_monte_carlo(metrics)
-    if mc_paths is not None:
-        days = mc_paths.shape[1] - 1
-        x_axis = range(days + 1)
-        
-        # Percentiles
-        p5 = np.percentile(mc_paths, 5, axis=0)
-        p50 = np.percentile(mc_paths, 50, axis=0)
-        p95 = np.percentile(mc_paths, 95, axis=0)
-        p1 = np.percentile(mc_paths, 1, axis=0) # Worst case
-        
-        axes2[0].plot(x_axis, p50, color='blue', lw=2, label='Median Path')
-        axes2[0].fill_between(x_axis, p5, p95, color='blue', alpha=0.2, label='90% Confidence Cone')
-        axes2[0].plot(x_axis, p1, color='red', linestyle='--', lw=1, label='Worst Case (1%)')
-        
-        axes2[0].set_title(f'Monte Carlo: Next {days} Days (1000 Sims)')
-        axes2[0].set_ylabel('Portfolio Value (Start=1.0)')
-        axes2[0].set_xlabel('Trading Days Ahead')
-        axes2[0].legend()
-        axes2[0].grid(True, alpha=0.3)
-        
-    # F. Stress Test Bar Chart
-    scenarios = list(stress_results.keys())
-    impacts = list(stress_results.values())
-    colors_stress = ['red' if x < 0 else 'green' for x in impacts]
-    
-    axes2[1].barh(scenarios, impacts, color=colors_stress)
-    axes2[1].set_title('Stress Test PnL Impact')
-    axes2[1].set_xlabel('Estimated Return')
-    axes2[1].grid(True, alpha=0.3)
-    # Add value labels
-    for i, v in enumerate(impacts):
-        axes2[1].text(v if v > 0 else 0, i, f' {v:+.1%}', va='center')
-
-    plt.tight_layout()
-    plt.show()
-
-
-    # 3. Leverage & Ticker Performance (New Figure)
-    periodic_rets = calculate_periodic_returns(data)
-    
-    fig3, axes3 = plt.subplots(1, 2, figsize=(16, 8))
-    fig3.suptitle('Leverage Impact & Asset Performance', fontsize=16)
-    
-    # G. Gross vs Net Equity Curve
-    gross_curve = (1 + metrics['Returns_Stream']).cumprod()
-    net_curve = (1 + metrics['Net_Stream']).cumprod()
-    
-    axes3[0].plot(gross_curve, color='green', linestyle='--', label='Gross Return (Pre-Fee)')
-    axes3[0].plot(net_curve, color='darkgreen', linewidth=2, label='Net Return (Post-Fee)')
-    
-    lev_stats = metrics['Leverage_Stats']
-    cost_text = (f"Leverage Profile:\n"
-                 f"Long: {lev_stats['Long_Exp']:.0%}\n"
-                 f"Short: {lev_stats['Short_Exp']:.0%}\n\n"
-                 f"Est Annual Drag: -{lev_stats['Daily_Drag']*360:.1%}")
-    
-    axes3[0].text(0.05, 0.95, cost_text, transform=axes3[0].transAxes, 
-                  verticalalignment='top', bbox=dict(boxstyle='round', facecolor='white', alpha=0.8))
-    
-    axes3[0].set_title('Cost of Leverage: Gross vs Net')
-    axes3[0].legend()
-    axes3[0].grid(True, alpha=0.3)
-    
-    # H. Ticker Performance Heatmap
-    # Prepare data for heatmap
-    sorted_periodic = periodic_rets.sort_values('1Y', ascending=False)
-    # Convert to numeric, handle NaNs
-    heatmap_data = sorted_periodic.astype(float)
-    
-    # Annotations: Format as percentage string or "" if NaN
-    annot_data = heatmap_data.applymap(lambda x: f"{x:.1%}" if not np.isnan(x) else "")
-    
-    sns.heatmap(heatmap_data, annot=annot_data, fmt="", cmap="RdYlGn", center=0, ax=axes3[1], cbar_kws={'label': 'Total Return'})
-    axes3[1].set_title('Asset Performance Heatmap')
-    
-    plt.tight_layout()
-    plt.show()
+    """Console report and figures (report.py; plotting libraries are only imported here)."""
+    import report
+    report.generate_report(metrics, data)
 
 def audit_data_quality(df):
     print("\n" + "="*50)
@@ -1125,9 +989,41 @@ def audit_data_quality(df):
     else:
         print("\n[OK] All tickers have sufficient data coverage.")
 
-if __name__ == "__main__":
-    raw_prices, fx_rates = fetch_data()
+def run_report(export_dir=None):
+    rates.refresh_rates()
+    raw_prices, fx_rates, volume_data = fetch_data()
     usd_prices = normalize_to_base_currency(raw_prices, fx_rates)
     audit_data_quality(usd_prices)
-    metrics = calculate_risk_metrics(usd_prices)
-    generate_report(metrics, usd_prices)
\ No newline at end of file
+    metrics = calculate_risk_metrics(usd_prices, volume_data, fx_rates)
+    if export_dir is None or metrics is None:
+        generate_report(metrics, usd_prices)
+        return
+    # Headless: write PNG/PDF files instead of opening figure windows
+    import report
+    report.print_report(metrics, usd_prices)
+    files = report.render(metrics, usd_prices, export_dir)
+    print(f"\nReport written to {export_dir}: {', '.join(files)}")
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fetch data and print the portfolio risk report.")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile the run (cProfile, per-stage wall/CPU time, peak memory, DataFrame allocations)")
+    parser.add_argument("--profile-out", metavar="PATH",
+                        help="also write the cProfile stats to PATH (.pstats) for pstats / snakeviz")
+    parser.add_argument("--profile-sort", default="cumulative", help="cumulative | tottime | ncalls")
+    parser.add_argument("--export", metavar="DIR",
+                        help="render the figures headless to DIR (one PNG per figure plus report.pdf) instead of showing them")
+    args = parser.parse_args()
+    diagnostics.setup_logging()
+
+    if args.profile or args.profile_out:
+        import profiling
+        _, report, stats = profiling.profile_run(lambda: run_report(args.export), args.profile_sort)
+        profiling.print_report(report)
+        if args.profile_out:
+            stats.dump_stats(args.profile_out)
+            print(f"\nProfile stats written to {args.profile_out}")
+    else:
+        run_report(args.export)
\ No newline at end of file
@@ -0,0 +1,651 @@
+"""
+Frozen reference implementation of the risk engine.
+
+A verbatim copy of calculate_risk_metrics (with the helpers it calls) as it
+stood before any performance work, minus the telemetry timers. Fast paths in
+risk.py are checked against it with check_equivalence.py. Do not optimize or
+"fix" this module: its output is the definition of the current numbers. Change
+it only together with a deliberate change of a metric's definition in risk.py.
+"""
+import pandas as pd
+import numpy as np
+
+import diagnostics
+import providers
+import rates
+from risk import (BASE_CURRENCY, BENCHMARK, BENCHMARK_MSCI, BENCHMARK_WIG, BORROW_FEE, MARGIN_RATE,
+                  PORTFOLIO_CONFIG, WATCHLIST_FX)
+
+log = diagnostics.get_logger('risk_reference')
+
+
+def get_fx_rate(fx_df, from_currency, to_currency, index=None):
+    """
+    Units of `to_currency` per one unit of `from_currency`, taken from the direct
+    pair (e.g. USDPLN=X) or inverted from the reverse pair (PLNUSD=X).
+    Returns None if neither pair is in the FX panel.
+    """
+    if from_currency == to_currency:
+        return pd.Series(1.0, index=index if index is not None else fx_df.index)
+
+    direct = f"{from_currency}{to_currency}=X"
+    inverse = f"{to_currency}{from_currency}=X"
+    if fx_df is not None and direct in fx_df.columns:
+        fx_series = fx_df[direct]
+    elif fx_df is not None and inverse in fx_df.columns:
+        fx_series = 1.0 / fx_df[inverse]
+    else:
+        return None
+
+    if index is not None:
+        fx_series = fx_series.reindex(index).ffill()
+    return fx_series
+
+def calculate_risk_metrics(price_df, volume_df=None, fx_df=None, base_currency=BASE_CURRENCY, portfolio=None):
+    log.debug("3. Calculating advanced risk metrics (%s)", base_currency)
+    
+    # Defaults to the house book; batch / job callers pass their own config
+    if portfolio is None:
+        portfolio = PORTFOLIO_CONFIG
+    
+    if price_df.empty or len(price_df) < 2:
+        log.warning("Insufficient price data (%d rows)", len(price_df))
+        return None
+        
+    # Use dropna(how='all') to only drop rows where ALL values are NaN
+    # This prevents dropping rows where just some tickers are missing
+    returns_df = price_df.pct_change().dropna(how='all')
+    
+    if returns_df.empty or len(returns_df) < 2:
+        log.warning("Insufficient returns data after pct_change")
+        return None
+    
+    if BENCHMARK not in returns_df.columns:
+        log.error("Benchmark %s data missing", BENCHMARK, extra={'ticker': BENCHMARK})
+        return None
+
+    benchmark_ret = returns_df[BENCHMARK]
+    
+    # --- 0.5. DYNAMIC RISK FREE RATE (Cached Curve) ---
+    # Point-in-time daily curve from the rates service (no network call here).
+    rf_daily_series = rates.align_rates(returns_df.index, base_currency)
+    rf_rate = rates.get_rate(base_currency) # Latest rate (reporting / Monte Carlo)
+    rf_hist = rf_daily_series.mean()        # Average rate over the history window
+    log.debug("Risk-free rate latest %.4f%%, period avg %.4f%%", rf_rate * 100, rf_hist * 100,
+              extra={'rf_rate': rf_rate, 'rf_hist': rf_hist})
+    
+    # --- 1. PREPARE PORTFOLIO RETURNS ---
+    # Construct a weighted portfolio return series
+    portfolio_daily_ret = pd.Series(0.0, index=returns_df.index)
+    
+    # Track Gross Exposure for Leverage Calc
+    total_long_weight = 0
+    total_short_weight = 0
+    
+    active_tickers = []
+    
+    # We need to normalize weights to 100% of invested capital for some metrics,
+    # but for risk attribution, we use the actual exposure weights.
+    
+    for ticker, info in portfolio.items():
+        if ticker in returns_df.columns:
+            weight = info['weight']
+            direction = 1 if info['type'] == 'Long' else -1
+            
+            if direction == 1: total_long_weight += weight
+            else: total_short_weight += weight
+            
+            # If ticker didn't exist yet (return is 0), it contributes 0.
+            # This implicitly assumes "Cash" was held instead.
+            # Use fillna(0) to ensure missing returns (incomplete data) don't poison the whole portfolio series
+            portfolio_daily_ret += returns_df[ticker].fillna(0.0) * weight * direction
+            active_tickers.append(ticker)
+
+    # --- 1.5 LEVERAGE COST (DRAG) ---
+    # Daily Cost = (Net Debit * Margin / 360) + (Gross Short * Borrow / 360)
+    # Net Debit = Max(0, Long Exposure - 1.0) -> Assuming 1.0 is our Equity
+    
+    net_debit = max(0, total_long_weight - 1.0)
+    # Margin floats with the risk-free curve; constant MARGIN_RATE is implied by today's rate
+    margin_rate_series = rf_daily_series + (MARGIN_RATE - rf_rate)
+    daily_margin_cost = (net_debit * margin_rate_series) / 360
+    daily_borrow_cost = (total_short_weight * BORROW_FEE) / 360
+    total_daily_drag = daily_margin_cost + daily_borrow_cost
+    
+    # Net Returns (After Cost)
+    portfolio_net_ret = portfolio_daily_ret - total_daily_drag
+
+    # --- 2. CORE METRICS ---
+    # Annualize factor
+    ANNUAL_FACTOR = 252
+    
+    # Beta
+    # Beta (Robust Calculation)
+    valid_mask = ~(np.isnan(portfolio_daily_ret) | np.isnan(benchmark_ret))
+    clean_port = portfolio_daily_ret[valid_mask]
+    clean_bench = benchmark_ret[valid_mask]
+    
+    if len(clean_bench) > 1:
+        covariance = np.cov(clean_port, clean_bench)[0][1]
+        market_variance = np.var(clean_bench)
+        portfolio_beta = covariance / market_variance if market_variance > 0 else 0
+    else:
+        portfolio_beta = 0
+    
+    # Volatility (Annualized)
+    daily_vol = np.std(portfolio_daily_ret)
+    annual_vol = daily_vol * np.sqrt(ANNUAL_FACTOR)
+    
+    # Returns (Annualized)
+    avg_daily_ret = np.mean(portfolio_daily_ret)
+    annual_ret = avg_daily_ret * ANNUAL_FACTOR
+    
+    # Sharpe Ratio (Time-varying Rf averaged over the window)
+    sharpe_ratio = (annual_ret - rf_hist) / annual_vol if annual_vol > 0 else 0
+    
+    # Sortino Ratio (Downside Risk only)
+    downside_returns = portfolio_daily_ret[portfolio_daily_ret < 0]
+    downside_std = np.std(downside_returns) * np.sqrt(ANNUAL_FACTOR)
+    sortino_ratio = (annual_ret - rf_hist) / downside_std if downside_std > 0 else 0
+    
+    # --- 3. TAIL RISK ---
+    # Rolling 1-Month Standard Deviation (Annualized)
+    rolling_window = 21  # ~1 month of trading days
+    if len(portfolio_daily_ret) >= rolling_window:
+        rolling_1m_vol = portfolio_daily_ret.iloc[-rolling_window:].std() * np.sqrt(ANNUAL_FACTOR)
+    else:
+        rolling_1m_vol = annual_vol  # Fallback: use overall vol if not enough data
+    
+    # CVaR 95% (Expected Shortfall) - Average of losses exceeding 5th percentile
+    # Safeguard: check for empty or all-NaN data
+    valid_returns = portfolio_daily_ret.dropna()
+    if len(valid_returns) > 0:
+        var_95 = np.percentile(valid_returns, 5)
+        cvar_95 = valid_returns[valid_returns <= var_95].mean()
+    else:
+        var_95 = 0
+        cvar_95 = 0
+
+    
+    # Max Drawdown
+    cum_ret = (1 + portfolio_daily_ret).cumprod()
+    running_max = cum_ret.cummax()
+    drawdown = (cum_ret - running_max) / running_max
+    max_drawdown = drawdown.min()
+
+    # --- 4. RISK ATTRIBUTION (MCTR) ---
+    # Marginal Contribution to Total Risk
+    # Formula: MCTR_i = (Cov(R_i, R_p) / Std(R_p)) * Weight_i
+    
+    risk_contribution = {}
+    total_risk_sum = 0
+    
+    if daily_vol > 0:
+        for ticker in active_tickers:
+            info = portfolio[ticker]
+            weight = info['weight']
+            direction = 1 if info['type'] == 'Long' else -1 # Directional weight
+            signed_weight = weight * direction
+            
+            asset_ret = returns_df[ticker]
+            # Covariance between Asset and Portfolio (Robust to NaNs)
+            valid_mask = ~(np.isnan(asset_ret) | np.isnan(portfolio_daily_ret))
+            clean_asset = asset_ret[valid_mask]
+            clean_port = portfolio_daily_ret[valid_mask]
+            
+            if len(clean_asset) > 1:
+                cov_asset_port = np.cov(clean_asset, clean_port)[0][1]
+            else:
+                cov_asset_port = 0
+            
+            # Marginal Contribution to Volatility
+            mctr = (cov_asset_port * signed_weight) / daily_vol
+            
+            # Percent contribution to total volatility
+            pct_contribution = mctr / daily_vol
+            
+            risk_contribution[ticker] = {
+                'MCTR': mctr,
+                'Pct_Risk': pct_contribution,
+                'Weight': signed_weight
+            }
+            total_risk_sum += mctr
+
+            total_risk_sum += mctr
+            
+    # --- 4.4 Rolling Volatility ---
+    # Rolling 1-Month Volatility (Annualized)
+    rolling_vol_series = portfolio_daily_ret.rolling(window=21).std()
+    rolling_1m_vol = rolling_vol_series.iloc[-1] * np.sqrt(ANNUAL_FACTOR) if not rolling_vol_series.empty else 0
+    
+    bench_rolling_vol_series = benchmark_ret.rolling(window=21).std()
+    bench_rolling_1m_vol = bench_rolling_vol_series.iloc[-1] * np.sqrt(ANNUAL_FACTOR) if not bench_rolling_vol_series.empty else 0
+
+    # --- 4.5 CAPM Metrics (Jensen's Alpha) ---
+    # Alpha = Rp - (Rf + Beta * (Rm - Rf))
+    # We need annualized benchmark return for this
+    avg_bench_ret = np.mean(benchmark_ret)
+    annual_bench_ret = avg_bench_ret * ANNUAL_FACTOR
+    
+    expected_return = rf_hist + portfolio_beta * (annual_bench_ret - rf_hist)
+    jensens_alpha = annual_ret - expected_return
+    
+    # Metadata for transparency
+    calc_start_date = returns_df.index[0].strftime('%Y-%m-%d')
+    calc_end_date = returns_df.index[-1].strftime('%Y-%m-%d')
+    period_years = (returns_df.index[-1] - returns_df.index[0]).days / 365.25
+
+    # --- 5. YTD METRICS ---
+    current_year = providers.now().year
+    ytd_calc_start = f"{current_year}-01-01"
+    
+    # Standard YTD Logic: Return = (Current_Price - Prev_Year_Close) / Prev_Year_Close
+    # To implement this, we need to include the last data point from the previous year in our "YTD Series"
+    # or explicitly fetch that "base price".
+    
+    # Check timezone again to be safe
+    if hasattr(price_df.index, 'tz'):
+        price_df.index = price_df.index.tz_localize(None)
+    if hasattr(benchmark_ret.index, 'tz'):
+        benchmark_ret.index = benchmark_ret.index.tz_localize(None)
+
+    # Pre-fill prices to handle holidays (e.g. if Dec 31 is holiday for some tickers)
+    # This ensures we get the last available price from previous year as the base.
+    price_df_filled = price_df.ffill()
+
+    # Find the index of the first date >= current_year
+    # We want to slice from [prev_date : end]
+    # This effectively makes the "YTD Stream" start at the Prev Year Close (Day 0)
+    
+    # Fallback default
+    ytd_prices = pd.DataFrame() 
+    ytd_benchmark = benchmark_ret[benchmark_ret.index >= ytd_calc_start]
+    
+    # Try to find the insertion point
+    # Search for the first index that is >= ytd_calc_start
+    # using searchsorted on the index
+    try:
+        start_idx_loc = price_df.index.searchsorted(pd.Timestamp(ytd_calc_start))
+        if start_idx_loc > 0:
+            # Include the previous day (Year-End Close)
+            # We use the FILLED dataframe so we get Dec 30 price on the Dec 31 row if needed
+            ytd_prices = price_df_filled.iloc[start_idx_loc-1 :]
+            
+        # Do the same for benchmark returns -> wait, benchmark is returns.
+        # For benchmark, if we have returns, the "YTD Return" is usually sum/prod of returns starting Jan 2.
+        # But for consistency in the "Growth Chart" starting at 0%, we usually just cumulate from Jan 1.
+        # However, if we want to align the chart:
+        # Day 0 (Dec 31): Val = 1.0
+        # Day 1 (Jan 2): Val = 1.0 * (1 + r_jan2)
+        # So we just need the returns from >= Jan 1.
+        
+        # But the user asked for "standard calculation" for performance.
+        # If we just sum returns from Jan 2, that IS (P_curr / P_prev_close) - 1.
+        # So for Benchmark *Returns* Series, we don't need to change the slice (it should start Jan 2).
+        # We only need to be careful if we are comparing price series.
+        pass
+    except Exception:
+        log.exception("Error adjusting YTD start date")
+        # Fallback to current year start is already set
+        ytd_prices = price_df_filled[price_df_filled.index >= ytd_calc_start]
+        pass
+
+    if not ytd_prices.empty and len(ytd_prices) > 1:
+        # --- BUY & HOLD SIMULATION ---
+        # Normalize prices to start at 1.0
+        # This "Start" is now effectively Dec 31st (Price_0)
+        # Note: ytd_prices is already filled from history, but let's ffill forward too if any holes remain?
+        ytd_prices_filled = ytd_prices.ffill() 
+        ytd_rel_prices = ytd_prices_filled / ytd_prices_filled.iloc[0]
+        
+        # Calculate Value Series
+        portfolio_val_series = pd.Series(0.0, index=ytd_rel_prices.index)
+        
+        ytd_longs_contrib = 0
+        ytd_shorts_contrib = 0
+        
+        # NOTE: If ytd_prices includes Dec 31, then ytd_rel_prices[0] is 1.0 by definition.
+        # The code below calculates contribution based on (Price_t / Price_0 - 1).
+        # At t=0 (Dec 31), Price_t=Price_0 => Contrib = 0.
+        # This correctly starts the chart at 0% (Value 1.0) on Dec 31.
+        
+        for ticker in active_tickers:
+            info = portfolio[ticker]
+            weight = info['weight'] 
+            direction = 1 if info['type'] == 'Long' else -1
+            
+            # Check if ticker exists
+            if ticker in ytd_rel_prices.columns:
+                asset_cum_ret = ytd_rel_prices[ticker] - 1
+                
+                # Position Contribution
+                position_contrib = weight * direction * asset_cum_ret
+                portfolio_val_series += position_contrib.fillna(0)
+                
+                # Final Contribution (for summary)
+                final_contrib = position_contrib.iloc[-1]
+                if not pd.isna(final_contrib):
+                    if direction == 1:
+                        ytd_longs_contrib += final_contrib
+                    else:
+                        ytd_shorts_contrib += final_contrib
+
+        # Add initial base (1.0)
+        portfolio_val_series += 1.0
+        
+        # YTD Return (B&H)
+        ytd_return = portfolio_val_series.iloc[-1] - 1
+        benchmark_ytd = (1 + ytd_benchmark).prod() - 1
+
+        # Derive Daily Returns for Vol/Beta/Sharpe consistency
+        ytd_portfolio_daily_ret = portfolio_val_series.pct_change().dropna()
+        
+        # Align benchmark
+        ytd_benchmark_aligned = ytd_benchmark.reindex(ytd_portfolio_daily_ret.index).dropna()
+        ytd_portfolio_daily_ret = ytd_portfolio_daily_ret.loc[ytd_benchmark_aligned.index]
+
+        # YTD Beta
+        if not ytd_benchmark_aligned.empty and np.var(ytd_benchmark_aligned) > 0:
+            ytd_beta = np.cov(ytd_portfolio_daily_ret, ytd_benchmark_aligned)[0][1] / np.var(ytd_benchmark_aligned)
+        else:
+            ytd_beta = 0
+            
+        # YTD Risk-Free Rate (curve averaged over the YTD window)
+        rf_ytd_series = rf_daily_series[rf_daily_series.index >= ytd_calc_start]
+        rf_ytd = rf_ytd_series.mean() if not rf_ytd_series.empty else rf_rate
+
+        # Risk Efficiency -> YTD Sharpe
+        ytd_vol = np.std(ytd_portfolio_daily_ret) * np.sqrt(ANNUAL_FACTOR)
+        ytd_ann_ret = np.mean(ytd_portfolio_daily_ret) * ANNUAL_FACTOR
+        ytd_sharpe = (ytd_ann_ret - rf_ytd) / ytd_vol if ytd_vol > 0 else 0
+        
+        # Benchmark YTD Sharpe
+        bench_ytd_vol = np.std(ytd_benchmark) * np.sqrt(ANNUAL_FACTOR)
+        bench_ytd_ann_ret = np.mean(ytd_benchmark) * ANNUAL_FACTOR
+        bench_ytd_sharpe = (bench_ytd_ann_ret - rf_ytd) / bench_ytd_vol if bench_ytd_vol > 0 else 0
+        
+        # YTD Jensen's Alpha
+        ytd_expected_return = rf_ytd + ytd_beta * (bench_ytd_ann_ret - rf_ytd)
+        ytd_alpha = ytd_ann_ret - ytd_expected_return
+
+        # Benchmark Historical Sharpe
+        bench_ann_vol = np.std(benchmark_ret) * np.sqrt(ANNUAL_FACTOR)
+        bench_hist_sharpe = (annual_bench_ret - rf_hist) / bench_ann_vol if bench_ann_vol > 0 else 0
+        
+        # YTD Max Drawdown (Portfolio)
+        ytd_cum_max = portfolio_val_series.cummax()
+        ytd_drawdown = (portfolio_val_series - ytd_cum_max) / ytd_cum_max
+        ytd_max_drawdown = ytd_drawdown.min()
+
+        # YTD Max Drawdown (Benchmark)
+        # Note: ytd_benchmark is typically daily returns, construct value index first
+        # We did this earlier for alignment? No, ytd_benchmark is the slice of returns.
+        if not ytd_benchmark.empty:
+            ytd_bench_idx = (1 + ytd_benchmark).cumprod()
+            ytd_bench_cum_max = ytd_bench_idx.cummax()
+            ytd_bench_drawdown = (ytd_bench_idx - ytd_bench_cum_max) / ytd_bench_cum_max
+            ytd_bench_max_drawdown = ytd_bench_drawdown.min()
+        else:
+            ytd_bench_max_drawdown = 0.0
+
+        # PLN Return (Base-Currency Return + FX Change)
+        # Uses the already-fetched FX panel instead of a separate USDPLN download.
+        try:
+            pln_hist = None
+            if fx_df is not None:
+                pln_hist = get_fx_rate(fx_df, base_currency, 'PLN')
+
+            if base_currency == 'PLN':
+                ytd_return_pln = ytd_return
+            elif pln_hist is not None and not pln_hist.dropna().empty:
+                pln_hist = pln_hist.dropna()
+                # Normalize timezone to match price_df
+                if hasattr(pln_hist.index, 'tz') and pln_hist.index.tz is not None:
+                    pln_hist.index = pln_hist.index.tz_localize(None)
+
+                # Grab the FX rate at the START of our ytd_prices period (Dec 31 or closest previous)
+                target_start_date = ytd_prices.index[0] # Should be Dec 31 or Jan 2
+                idx_loc = pln_hist.index.searchsorted(target_start_date)
+                if idx_loc < len(pln_hist) and pln_hist.index[idx_loc] == target_start_date:
+                    pln_start_val = pln_hist.iloc[idx_loc]
+                elif idx_loc > 0:
+                    pln_start_val = pln_hist.iloc[idx_loc-1]
+                else:
+                    pln_start_val = pln_hist.iloc[0]
+                
+                pln_end_val = pln_hist.iloc[-1]
+                
+                fx_ytd_change = (pln_end_val - pln_start_val) / pln_start_val
+                ytd_return_pln = (1 + ytd_return) * (1 + fx_ytd_change) - 1
+                
+            else:
+                log.warning("No %s/PLN FX rate; YTD_Return_PLN falls back to the %s return",
+                            base_currency, base_currency, extra={'currency': base_currency})
+                ytd_return_pln = ytd_return
+                
+        except Exception:
+            log.exception("Error calculating PLN YTD return")
+            ytd_return_pln = ytd_return
+        
+        # WIG YTD
+        if BENCHMARK_WIG in returns_df.columns:
+            wig_ret = returns_df[BENCHMARK_WIG]
+            if hasattr(wig_ret.index, 'tz') and wig_ret.index.tz is not None:
+                wig_ret.index = wig_ret.index.tz_localize(None)
+            # Use same logic? Benchmarks are returns streams here, not prices.
+            # So just summing returns from Jan 1 is correct.
+            ytd_wig = wig_ret[wig_ret.index >= ytd_calc_start]
+            wig_ytd = (1 + ytd_wig).prod() - 1 if not ytd_wig.empty else 0
+        else:
+            wig_ytd = 0
+            
+        # MSCI World YTD
+        if BENCHMARK_MSCI in returns_df.columns:
+            msci_ret = returns_df[BENCHMARK_MSCI]
+            if hasattr(msci_ret.index, 'tz') and msci_ret.index.tz is not None:
+                msci_ret.index = msci_ret.index.tz_localize(None)
+            ytd_msci = msci_ret[msci_ret.index >= ytd_calc_start]
+            msci_ytd = (1 + ytd_msci).prod() - 1 if not ytd_msci.empty else 0
+        else:
+            msci_ytd = 0
+            
+        # Longs/Shorts Contribution 
+        # Needs to align with the new base logic? 
+        # Since we use ytd_rel_prices logic above for total portfolio, this loop for granular contribution
+        # should ideally match.
+        # Note: Above we calculate "ytd_longs_contrib" and "ytd_shorts_contrib" in the main loop.
+        # The loop below was recalculating it differently. Let's just use the ones from the main loop!
+        # But wait, the main loop calculates portfolio *weighted* contribution.
+        # The variables `ytd_longs_contrib` were already accumulated there.
+        # So we can remove the redundant loop below or update it?
+        # The redundant loop calculates it slightly differently using product of returns.
+        # Let's stick effectively to the main loop's result as it matches the "YTD Return" number exactly by definition.
+        
+        # DO NOTHING here, we already calculated ytd_longs_contrib in the loop above.
+        
+    else:
+        ytd_return = 0.0
+        benchmark_ytd = 0.0
+        ytd_beta = 0.0
+        ytd_sharpe = 0.0
+        bench_ytd_sharpe = 0.0
+        bench_hist_sharpe = 0.0
+        ytd_return_pln = 0.0
+        wig_ytd = 0.0
+        msci_ytd = 0.0
+        ytd_longs_contrib = 0.0
+        ytd_shorts_contrib = 0.0
+        ytd_max_drawdown = 0.0
+        ytd_bench_max_drawdown = 0.0
+
+    # --- 6. VOLUME WEIGHTED CORRELATION (Past 1 Year) ---
+    vol_weighted_corr = pd.DataFrame()
+    if volume_df is not None and not volume_df.empty:
+        vol_weighted_corr = calculate_volume_weighted_correlation(price_df, volume_df, active_tickers, returns_df)
+    correlation_matrix = returns_df.corr()
+
+    log.debug("YTD return (cumulative) %.4f%%", ytd_return * 100,
+              extra={'ytd_return': ytd_return, 'ytd_return_pln': ytd_return_pln, 'base_currency': base_currency})
+
+    # --- 9. FX WATCHLIST METRICS ---
+    fx_watchlist_metrics = calculate_fx_watchlist(fx_df)
+
+    return {
+        'Base_Currency': base_currency,
+        'Beta': portfolio_beta,
+        'Annual_Return': annual_ret,
+        'Annual_Vol': annual_vol,
+        'Sharpe': sharpe_ratio,
+        'Sortino': sortino_ratio,
+        'Rolling_1M_Vol': rolling_1m_vol,
+        'Benchmark_Rolling_1M_Vol': bench_rolling_1m_vol,
+        'CVaR_95': cvar_95,
+        'VaR_95': var_95,
+        'Max_Drawdown': max_drawdown,
+        'Jensens_Alpha': jensens_alpha,
+        'Risk_Free_Rate': rf_rate,
+        'Period_Info': {
+            'Start_Date': calc_start_date,
+            'End_Date': calc_end_date,
+            'Years': round(period_years, 1)
+        },
+        'YTD_Return': ytd_return,
+        'Benchmark_YTD': benchmark_ytd,
+        'YTD_Beta': ytd_beta,
+        'YTD_Sharpe': ytd_sharpe,
+        'Benchmark_YTD_Sharpe': bench_ytd_sharpe,
+        'Benchmark_Hist_Sharpe': bench_hist_sharpe,
+        'YTD_Return_PLN': ytd_return_pln,
+        'WIG_YTD': wig_ytd,
+        'MSCI_YTD': msci_ytd,
+        'YTD_Longs_Contrib': ytd_longs_contrib,
+        'YTD_Shorts_Contrib': ytd_shorts_contrib,
+        'YTD_Alpha': ytd_alpha,
+        'YTD_Max_Drawdown': ytd_max_drawdown,
+        'Benchmark_YTD_Max_Drawdown': ytd_bench_max_drawdown,
+        'Returns_Stream': portfolio_daily_ret,
+        'Net_Stream': portfolio_net_ret, 
+        'Benchmark_Stream': benchmark_ret, 
+        'Drawdown_Stream': drawdown,
+        'Risk_Attribution': risk_contribution,
+        'Correlation_Matrix': correlation_matrix,
+        'Volume_Weighted_Correlation': vol_weighted_corr,
+        'Leverage_Stats': {
+            'Long_Exp': total_long_weight,
+            'Short_Exp': total_short_weight,
+            'Gross_Exp': total_long_weight + total_short_weight,
+            'Net_Exp': total_long_weight - total_short_weight,
+            'Daily_Drag': float(total_daily_drag.iloc[-1]) # Current carry at today's rates
+        },
+        'Fx_Watchlist': fx_watchlist_metrics,
+        'YTD_Stream': portfolio_val_series if 'portfolio_val_series' in locals() else None,
+        'YTD_Benchmark_Stream': ytd_benchmark if 'ytd_benchmark' in locals() else None
+    }
+
+def calculate_volume_weighted_correlation(price_df, volume_df, tickers=None, returns_df=None):
+    """
+    Pairwise correlation of the last year of daily returns, each day weighted by the
+    geometric mean of the two names' dollar volumes. Can be run on its own (without
+    the rest of calculate_risk_metrics) for the correlation widget.
+    """
+    if volume_df is None or volume_df.empty:
+        return pd.DataFrame()
+    if returns_df is None:
+        returns_df = price_df.pct_change().dropna(how='all')
+    if tickers is None:
+        tickers = [t for t in PORTFOLIO_CONFIG if t in returns_df.columns]
+
+    try:
+        log.debug("Calculating volume weighted correlation matrix")
+        # Filter for last 1 year (252 trading days)
+        one_year_ago = price_df.index[-1] - pd.Timedelta(days=365)
+        
+        # Align slices
+        sub_rets = returns_df[returns_df.index >= one_year_ago]
+        # Reindex aligned volume and prices
+        sub_vol = volume_df.reindex(sub_rets.index).fillna(0)
+        sub_prices = price_df.reindex(sub_rets.index).ffill()
+        
+        # Use active tickers only involved in portfolio
+        calc_tickers = [t for t in tickers if t in sub_rets.columns and t in sub_vol.columns]
+        
+        # Calculate Dollar Volume = Price * Volume
+        dv_df = sub_prices[calc_tickers] * sub_vol[calc_tickers]
+        
+        # Initialize Matrix
+        n = len(calc_tickers)
+        vw_corr_mat = np.eye(n)
+        
+        # Pairwise Calculation
+        for i in range(n):
+            for j in range(i + 1, n):
+                t1, t2 = calc_tickers[i], calc_tickers[j]
+                
+                r1 = sub_rets[t1].values
+                r2 = sub_rets[t2].values
+                dv1 = dv_df[t1].values
+                dv2 = dv_df[t2].values
+                
+                # Weights: Geometric mean of Dollar Volumes
+                w = np.sqrt(dv1 * dv2)
+                w_sum = np.sum(w)
+                
+                if w_sum != 0:
+                    w_norm = w / w_sum
+                    mu1 = np.sum(r1 * w_norm)
+                    mu2 = np.sum(r2 * w_norm)
+                    cov = np.sum(w_norm * (r1 - mu1) * (r2 - mu2))
+                    var1 = np.sum(w_norm * (r1 - mu1)**2)
+                    var2 = np.sum(w_norm * (r2 - mu2)**2)
+                    
+                    if var1 > 0 and var2 > 0:
+                        corr_val = cov / np.sqrt(var1 * var2)
+                    else:
+                        corr_val = 0
+                    
+                    vw_corr_mat[i, j] = corr_val
+                    vw_corr_mat[j, i] = corr_val
+
+        vol_weighted_corr = pd.DataFrame(vw_corr_mat, index=calc_tickers, columns=calc_tickers)
+        
+    except Exception:
+        log.exception("Error calculating volume weighted correlation")
+        vol_weighted_corr = pd.DataFrame()
+
+    return vol_weighted_corr
+
+def calculate_fx_watchlist(fx_df):
+    """YTD move of each WATCHLIST_FX pair, keyed by display name (e.g. 'USD/PLN')."""
+    fx_watchlist_metrics = {}
+    if fx_df is not None and not fx_df.empty:
+        try:
+            curr_year_start = pd.Timestamp(f"{providers.now().year}-01-01")
+            for fx_ticker in WATCHLIST_FX:
+                if fx_ticker in fx_df.columns:
+                    series = fx_df[fx_ticker].dropna()
+                    if series.empty: continue
+                    if hasattr(series.index, 'tz') and series.index.tz is not None:
+                        series.index = series.index.tz_localize(None)
+                    
+                    current_val = series.iloc[-1]
+                    idx_start = series.index.searchsorted(curr_year_start)
+                    
+                    if idx_start > 0:
+                        start_val = series.iloc[idx_start - 1]
+                        ytd_perf = (current_val - start_val) / start_val
+                    elif idx_start == 0:
+                        start_val = series.iloc[0]
+                        ytd_perf = (current_val - start_val) / start_val
+                    else:
+                        ytd_perf = 0.0
+                    
+                    # Clean Name
+                    clean_name = fx_ticker.replace("=X", "").replace("-", "/")
+                    if len(clean_name) == 6 and "/" not in clean_name:
+                         clean_name = f"{clean_name[:3]}/{clean_name[3:]}"
+                    
+                    fx_watchlist_metrics[clean_name] = ytd_perf
+        except Exception:
+            log.exception("Error calculating FX watchlist metrics")
+
+    return fx_watchlist_metrics
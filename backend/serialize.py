@@ -0,0 +1,312 @@
+"""
+Vectorized JSON serialization for API payloads.
+
+Payloads are assembled with pandas/NumPy objects: tabular sections are
+DataFrames, matrices are 2-D arrays, scalars may be NumPy floats. `render`
+cleans everything in whole-array operations (NaN/Inf -> null) and lays the
+tables out either as a list of row objects (the historical format) or
+columnar (one array per field), then encodes with orjson when installed.
+
+Clients that ask for it (Accept header or `format=`) get a binary columnar
+encoding instead: MessagePack or an Arrow IPC stream, with float columns typed
+as float32 or float64 and NaN kept as NaN. Bodies can be gzip/brotli
+compressed according to Accept-Encoding.
+"""
+import gzip
+import io
+import json
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+LAYOUTS = ('rows', 'columnar')
+
+MEDIA_TYPES = {
+    'json': 'application/json',
+    'msgpack': 'application/msgpack',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+# Other media types clients use for the same formats
+MEDIA_TYPE_ALIASES = {
+    'application/x-msgpack': 'msgpack',
+    'application/vnd.msgpack': 'msgpack',
+    'application/vnd.apache.arrow.file': 'arrow',
+}
+PRECISIONS = (32, 64)
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def to_float(val):
+    """Scalar to float, None for missing / NaN / Inf / non-numeric values."""
+    if val is None:
+        return None
+    try:
+        f = float(val)
+    except (TypeError, ValueError):
+        return None
+    return f if np.isfinite(f) else None
+
+
+def clean_array(values):
+    """Numeric array (any shape) to nested lists with NaN/Inf mapped to None."""
+    arr = np.asarray(values, dtype=float)
+    mask = ~np.isfinite(arr)
+    if not mask.any():
+        return arr.tolist()
+    out = arr.astype(object)
+    out[mask] = None
+    return out.tolist()
+
+
+def clean_column(series):
+    """One DataFrame column as a JSON-safe list."""
+    values = series.to_numpy()
+    if values.dtype.kind in 'iub':
+        return values.tolist()
+    if values.dtype.kind == 'f':
+        return clean_array(values)
+    if values.dtype.kind == 'M':
+        return pd.DatetimeIndex(values).strftime('%Y-%m-%d').tolist()
+    # Object / string columns may still hold float NaNs
+    return [None if isinstance(v, float) and not np.isfinite(v) else v for v in values.tolist()]
+
+
+def table_columns(df):
+    return {col: clean_column(df[col]) for col in df.columns}
+
+
+def table_rows(df):
+    columns = table_columns(df)
+    names = list(columns.keys())
+    return [dict(zip(names, row)) for row in zip(*columns.values())]
+
+
+def clean(obj, layout='rows'):
+    """Recursively convert a payload into JSON-safe Python objects."""
+    if isinstance(obj, pd.DataFrame):
+        return table_columns(obj) if layout == 'columnar' else table_rows(obj)
+    if isinstance(obj, pd.Series):
+        return clean_array(obj.to_numpy())
+    if isinstance(obj, np.ndarray):
+        return clean_array(obj)
+    if isinstance(obj, dict):
+        return {k: clean(v, layout) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [clean(v, layout) for v in obj]
+    if isinstance(obj, (bool, np.bool_)):
+        return bool(obj)
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, (float, np.floating)):
+        return to_float(obj)
+    return obj
+
+
+def dumps(obj):
+    """Encode an already-clean payload to compact JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'), allow_nan=False).encode('utf-8')
+
+
+def render(payload, layout='rows'):
+    """Clean + encode a payload in the requested table layout."""
+    return dumps(clean(payload, layout))
+
+
+def available_formats():
+    """Formats that can be produced with the libraries installed."""
+    formats = ['json']
+    if msgpack is not None:
+        formats.append('msgpack')
+    if pa is not None:
+        formats.append('arrow')
+    return formats
+
+
+def parse_quality_list(header):
+    """`a;q=0.5, b` -> [(a, 0.5), (b, 1.0)] sorted by descending q, ties in header order."""
+    entries = []
+    for part in (header or '').split(','):
+        fields = [f.strip() for f in part.split(';')]
+        if not fields[0]:
+            continue
+        q = 1.0
+        for param in fields[1:]:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        entries.append((fields[0].lower(), q))
+    return sorted(entries, key=lambda e: -e[1])
+
+
+def negotiate_format(accept=None, requested=None):
+    """
+    Response format from an explicit `format=` value or the Accept header.
+    Unsupported Accept entries fall back to JSON; an explicit format that is
+    unknown or not installed raises ValueError.
+    """
+    formats = available_formats()
+    if requested is not None:
+        if requested not in MEDIA_TYPES:
+            raise ValueError(f"Unsupported format '{requested}'. Use one of: {', '.join(MEDIA_TYPES)}")
+        if requested not in formats:
+            raise ValueError(f"Format '{requested}' is not available on this server (missing dependency)")
+        return requested
+
+    by_media_type = {media_type: name for name, media_type in MEDIA_TYPES.items()}
+    by_media_type.update(MEDIA_TYPE_ALIASES)
+    for media_type, q in parse_quality_list(accept):
+        name = by_media_type.get(media_type)
+        if q > 0 and name in formats:
+            return name
+    return 'json'
+
+
+def negotiate_encoding(accept_encoding=None):
+    """Best supported Content-Encoding for the Accept-Encoding header (brotli over gzip), or None."""
+    accepted = {coding: q for coding, q in parse_quality_list(accept_encoding) if q > 0}
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress(body, encoding):
+    """Compress `body` with `encoding`. Returns (body, encoding actually applied)."""
+    if encoding is None or len(body) < MIN_COMPRESS_BYTES:
+        return body, None
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY), 'br'
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), 'gzip'
+    return body, None
+
+
+def float_dtype(precision):
+    return np.float32 if precision == 32 else np.float64
+
+
+def binary_column(series):
+    """One DataFrame column for the binary encoders: float columns stay NumPy, NaN included."""
+    values = series.to_numpy()
+    if values.dtype.kind == 'M':
+        return pd.DatetimeIndex(values).strftime('%Y-%m-%d').tolist()
+    return values
+
+
+def clean_binary(obj, precision=64):
+    """Payload to MessagePack-ready Python objects. Tables are always columnar."""
+    if isinstance(obj, pd.DataFrame):
+        return {col: clean_binary(binary_column(obj[col]), precision) for col in obj.columns}
+    if isinstance(obj, pd.Series):
+        return clean_binary(obj.to_numpy(), precision)
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.kind == 'f':
+            return obj.astype(float_dtype(precision), copy=False).tolist()
+        return obj.tolist()
+    if isinstance(obj, dict):
+        return {k: clean_binary(v, precision) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [clean_binary(v, precision) for v in obj]
+    if isinstance(obj, (bool, np.bool_)):
+        return bool(obj)
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    return obj
+
+
+def arrow_list(values, n):
+    """Wrap `values` (length n) as a single list<...> cell."""
+    return pa.ListArray.from_arrays(pa.array([0, n], type=pa.int32()), values)
+
+
+def arrow_values(values, precision):
+    """Flat NumPy / list values as an Arrow array with typed floats."""
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'iubf':
+        if values.dtype.kind == 'f':
+            values = values.astype(float_dtype(precision), copy=False)
+        return pa.array(values)
+    # Object columns: missing values (None / NaN) become nulls
+    return pa.array(values if isinstance(values, np.ndarray) else list(values), from_pandas=True)
+
+
+def arrow_cell(obj, precision=64):
+    """
+    Payload value as a length-1 Arrow array: tables become struct<column: list>,
+    matrices nested lists, dicts structs and scalars plain values.
+    """
+    if isinstance(obj, pd.DataFrame):
+        if len(obj.columns) == 0:
+            return pa.array([{}], type=pa.struct([]))
+        columns = [arrow_list(arrow_values(binary_column(obj[col]), precision), len(obj)) for col in obj.columns]
+        return pa.StructArray.from_arrays(columns, names=[str(c) for c in obj.columns])
+    if isinstance(obj, pd.Series):
+        obj = obj.to_numpy()
+    if isinstance(obj, np.ndarray) and obj.dtype.kind in 'iubf':
+        cell = arrow_values(obj.ravel(), precision)
+        # Build nested lists from the innermost dimension outwards
+        for size in reversed(obj.shape[1:]):
+            offsets = pa.array(np.arange(0, len(cell) + 1, size, dtype=np.int32))
+            cell = pa.ListArray.from_arrays(offsets, cell)
+        return arrow_list(cell, obj.shape[0] if obj.ndim else 1)
+    if isinstance(obj, dict):
+        if not obj:
+            return pa.array([{}], type=pa.struct([]))
+        return pa.StructArray.from_arrays(
+            [arrow_cell(v, precision) for v in obj.values()], names=[str(k) for k in obj]
+        )
+    if isinstance(obj, (float, np.floating)):
+        return pa.array([float(obj)], type=pa.float32() if precision == 32 else pa.float64())
+    return pa.array([clean_binary(obj, precision)])
+
+
+def encode_arrow(payload, precision=64):
+    """Payload dict as an Arrow IPC stream holding one row, one column per top-level key."""
+    if not isinstance(payload, dict):
+        payload = {'value': payload}
+    columns = [arrow_cell(v, precision) for v in payload.values()]
+    table = pa.Table.from_arrays(columns, names=[str(k) for k in payload])
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def encode(payload, fmt='json', layout='rows', precision=64):
+    """Encode a payload in a negotiated format. Binary formats are always columnar."""
+    if fmt == 'msgpack':
+        return msgpack.packb(clean_binary(payload, precision), use_single_float=precision == 32)
+    if fmt == 'arrow':
+        return encode_arrow(payload, precision)
+    return render(payload, layout)
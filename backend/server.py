@@ -1,18 +1,33 @@
-import sys
 import os
+import time
 
-# Force unbuffered output
-sys.stdout.reconfigure(line_buffering=True)
-from fastapi import FastAPI
+from fastapi import Body, FastAPI, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import pandas as pd
 import numpy as np
 
+import diagnostics
+import telemetry
+
+# Logs go through a queue to stdout and the /api/diagnostics ring buffer
+diagnostics.setup_logging()
+log = diagnostics.get_logger('server')
+
 # Import risk.py (Now local)
 try:
     import risk
+    import data_store
+    import rates
+    import serialize
+    import downsample
+    import jobs
+    import profiling
+    import report_renderer
+    import intraday
+    import snapshots
 except ImportError as e:
-    print(f"Error importing risk.py: {e}")
+    log.error("Error importing risk.py: %s", e)
     risk = None
 
 app = FastAPI()
@@ -25,6 +40,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template (/api/jobs/{job_id}) so ids don't explode the series count
+    route = request.scope.get("route")
+    telemetry.observe(
+        'alpha_http_request_seconds', time.perf_counter() - start,
+        route=getattr(route, "path", "unmatched"), method=request.method, status=response.status_code
+    )
+    return response
+
+@app.on_event("startup")
+def start_background_services():
+    if risk:
+        # Keep the risk-free curve warm so metric requests never hit the network for it
+        rates.start_scheduler()
+        # Refresh market data in the background; streaming clients are pushed each new version
+        data_store.start_refresher()
+
+@app.get("/metrics")
+def get_prometheus_metrics():
+    """Stage latency histograms and counters in the Prometheus text format."""
+    return Response(content=telemetry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/diagnostics")
+def get_diagnostics(level: str | None = None, logger: str | None = None, limit: int = 200):
+    """
+    Recent log records from the in-memory ring buffer (missing tickers, FX gaps,
+    YTD values, errors), newest last. Filter by minimum `level` and `logger`
+    (risk, data_store, rates, jobs, server).
+    """
+    try:
+        records = diagnostics.recent(level, logger, max(limit, 0))
+    except ValueError as e:
+        return {"error": str(e)}
+    return {**diagnostics.summary(), "records": records}
+
 @app.get("/api/status")
 async def get_status():
     if risk:
@@ -32,294 +85,787 @@ async def get_status():
     else:
         return {"state": "error", "message": "Risk module failed to load"}
 
-@app.get("/api/metrics")
-async def get_metrics():
-    if not risk:
-        return {"error": "risk.py not found or failed to import"}
+INSUFFICIENT_DATA_ERROR = "Insufficient data to calculate metrics. (Likely Yahoo Finance rate limit or connection issue)."
 
-    try:
-        # 1. Fetch and Calculate Base Metrics
-        raw_prices, fx_rates, volume_data = risk.fetch_data()
-        usd_prices = risk.normalize_to_base_currency(raw_prices, fx_rates)
-        metrics = risk.calculate_risk_metrics(usd_prices, volume_data, fx_rates)
-        
-        if metrics is None:
-             print("Error: Metrics calculation returned None (insufficient data).")
-             # Return a valid structure with nulls/zeros to allow frontend to render empty state
-             # rather than crashing with 500
-             return {
-                "error": "Insufficient data to calculate metrics. (Likely Yahoo Finance rate limit or connection issue).",
-                "vitals": { k: 0 for k in ["beta", "annualReturn", "annualVol", "sharpe", "sortino", "maxDrawdown", "cvar95", "rolling1mVol"] }, # Partial fallback
-                "riskAttribution": [],
-                "stressTests": [],
-                "periodicReturns": [],
-                "monteCarlo": [],
-                "history": [],
-                "leverage": {}
-             }
-
-        # 2. Run Advanced Models
-        stress_results = risk.stress_test_portfolio(metrics)
-        mc_paths = risk.run_monte_carlo(metrics, num_sims=500, days=60) # Reduced sims for speed
-        periodic_rets = risk.calculate_periodic_returns(usd_prices)
-
-        # 3. Format Response
-        import math
-        def to_float(val):
-            if val is None: return None
-            try:
-                f = float(val)
-                # Return None for NaN/Inf to avoid JSON serialization errors
-                if math.isnan(f) or math.isinf(f):
-                    return None
-                return f
-            except:
-                return None
-
-        # 3. Format Response
-        response = {
-            "vitals": {
-                "beta": to_float(metrics['Beta']),
-                "annualReturn": to_float(metrics['Annual_Return']),
-                "annualVol": to_float(metrics['Annual_Vol']),
-                "sharpe": to_float(metrics['Sharpe']),
-                "sortino": to_float(metrics['Sortino']),
-                "maxDrawdown": to_float(metrics['Max_Drawdown']),
-                "rolling1mVol": to_float(metrics.get('Rolling_1M_Vol')),
-                "rolling1mVolBenchmark": to_float(metrics.get('Benchmark_Rolling_1M_Vol')),
-                "cvar95": to_float(metrics['CVaR_95']),
-                "jensensAlpha": to_float(metrics.get('Jensens_Alpha')),
-                "periodInfo": metrics.get('Period_Info'),
-                
-                # New YTD Fields
-                "ytdReturn": to_float(metrics.get('YTD_Return')),
-                "ytdAlpha": to_float(metrics.get('YTD_Alpha')),
-                "benchmarkYtd": to_float(metrics.get('Benchmark_YTD')),
-                "ytdBeta": to_float(metrics.get('YTD_Beta')),
-                "ytdMaxDrawdown": to_float(metrics.get('YTD_Max_Drawdown')),
-                "benchmarkYtdMaxDrawdown": to_float(metrics.get('Benchmark_YTD_Max_Drawdown')),
-                
-                # Standardized Sharpe Metrics
-                "ytdSharpe": to_float(metrics.get('YTD_Sharpe')),           # Previously riskEfficiencyVol
-                "benchmarkYtdSharpe": to_float(metrics.get('Benchmark_YTD_Sharpe')), 
-                "benchmarkHistSharpe": to_float(metrics.get('Benchmark_Hist_Sharpe')), # For Hist Avg comparison
-                "ytdReturnPln": to_float(metrics.get('YTD_Return_PLN')),
-                "wigYtd": to_float(metrics.get('WIG_YTD')),
-                "msciYtd": to_float(metrics.get('MSCI_YTD')),
-                "ytdLongsContrib": to_float(metrics.get('YTD_Longs_Contrib')),
-                "ytdShortsContrib": to_float(metrics.get('YTD_Shorts_Contrib')),
-                "fxWatchlist": metrics.get('Fx_Watchlist', {}),
-                "currencyExposure": {}, # Will be populated below
-            },
-            "leverage": metrics['Leverage_Stats'],
+def get_core_metrics(panel, base):
+    return data_store.get_risk_metrics(base, panel)
+
+def build_vitals_section(panel, base):
+    metrics = get_core_metrics(panel, base)
+    fx = get_section(panel, 'fx', base)
+    return {
+        "vitals": {
+            "baseCurrency": base,
+            "beta": metrics['Beta'],
+            "annualReturn": metrics['Annual_Return'],
+            "annualVol": metrics['Annual_Vol'],
+            "sharpe": metrics['Sharpe'],
+            "sortino": metrics['Sortino'],
+            "maxDrawdown": metrics['Max_Drawdown'],
+            "rolling1mVol": metrics.get('Rolling_1M_Vol'),
+            "rolling1mVolBenchmark": metrics.get('Benchmark_Rolling_1M_Vol'),
+            "cvar95": metrics['CVaR_95'],
+            "jensensAlpha": metrics.get('Jensens_Alpha'),
+            "periodInfo": metrics.get('Period_Info'),
+            
+            # New YTD Fields
+            "ytdReturn": metrics.get('YTD_Return'),
+            "ytdAlpha": metrics.get('YTD_Alpha'),
+            "benchmarkYtd": metrics.get('Benchmark_YTD'),
+            "ytdBeta": metrics.get('YTD_Beta'),
+            "ytdMaxDrawdown": metrics.get('YTD_Max_Drawdown'),
+            "benchmarkYtdMaxDrawdown": metrics.get('Benchmark_YTD_Max_Drawdown'),
+            
+            # Standardized Sharpe Metrics
+            "ytdSharpe": metrics.get('YTD_Sharpe'),           # Previously riskEfficiencyVol
+            "benchmarkYtdSharpe": metrics.get('Benchmark_YTD_Sharpe'), 
+            "benchmarkHistSharpe": metrics.get('Benchmark_Hist_Sharpe'), # For Hist Avg comparison
+            "ytdReturnPln": metrics.get('YTD_Return_PLN'),
+            "wigYtd": metrics.get('WIG_YTD'),
+            "msciYtd": metrics.get('MSCI_YTD'),
+            "ytdLongsContrib": metrics.get('YTD_Longs_Contrib'),
+            "ytdShortsContrib": metrics.get('YTD_Shorts_Contrib'),
+            "fxWatchlist": fx["fxWatchlist"],
+            "currencyExposure": fx["currencyExposure"],
+        },
+        "leverage": metrics['Leverage_Stats'],
+        # Symbols that could not be refreshed: served from their last good download / missing
+        "dataQuality": {
+            "staleSymbols": panel['data_quality']['stale'],
+            "failedSymbols": panel['data_quality']['failed'],
+        },
+    }
+
+def build_attribution_section(panel, base):
+    return {"riskAttribution": format_risk_attribution(get_core_metrics(panel, base))}
+
+def build_stress_section(panel, base):
+    stress_results = risk.stress_test_portfolio(get_core_metrics(panel, base))
+    return {
+        "stressTests": pd.DataFrame({
+            "scenario": list(stress_results.keys()),
+            "impact": np.asarray(list(stress_results.values()), dtype=float),
+        })
+    }
+
+def build_correlation_section(panel, base):
+    prices = data_store.get_prices(base, panel)
+    vw_corr = risk.calculate_volume_weighted_correlation(prices, panel['volume'])
+    return {"volumeWeightedCorrelation": format_correlation(vw_corr)}
+
+def build_periodic_section(panel, base):
+    prices = data_store.get_prices(base, panel)
+    periodic_rets = risk.calculate_periodic_returns(prices)
+    portfolio_config = getattr(risk, 'PORTFOLIO_CONFIG', {})
+    return {"periodicReturns": format_periodic_returns(periodic_rets, prices, portfolio_config)}
+
+def build_montecarlo_section(panel, base):
+    mc_paths = risk.run_monte_carlo(get_core_metrics(panel, base), num_sims=500, days=60) # Reduced sims for speed
+    return {"monteCarlo": format_monte_carlo(mc_paths)}
+
+def build_history_section(panel, base):
+    metrics = get_core_metrics(panel, base)
+    section = {"history": format_history(metrics), "ytdHistory": format_ytd_history(metrics)}
+    # Keep recent versions so /api/history/delta can send only new or revised points
+    data_store.archive(('history', base), panel['version_tag'], section)
+    return section
+
+def build_fx_section(panel, base):
+    return {
+        "fxWatchlist": risk.calculate_fx_watchlist(panel['fx_rates']),
+        "currencyExposure": format_currency_exposure(getattr(risk, 'PORTFOLIO_CONFIG', {})),
+    }
+
+# name -> (builder, needs calculate_risk_metrics). Order is the /api/metrics layout.
+SECTIONS = {
+    'vitals':      (build_vitals_section, True),
+    'attribution': (build_attribution_section, True),
+    'stress':      (build_stress_section, True),
+    'correlation': (build_correlation_section, False),
+    'periodic':    (build_periodic_section, False),
+    'montecarlo':  (build_montecarlo_section, True),
+    'history':     (build_history_section, True),
+    'fx':          (build_fx_section, False),
+}
+METRICS_SECTIONS = ['vitals', 'attribution', 'stress', 'correlation', 'periodic', 'montecarlo', 'history']
+
+# Section -> {table: value columns whose extremes LTTB must keep}
+DOWNSAMPLED_TABLES = {
+    'history': {
+        'history': ['portfolio', 'benchmark', 'drawdown'],
+        'ytdHistory': ['portfolio', 'benchmark'],
+    },
+}
+
+def get_section(panel, name, base, points=None):
+    if points is not None and name in DOWNSAMPLED_TABLES:
+        # Downsampled variants are cached per resolution on top of the full section
+        return data_store.get_cached(
+            ('section', name, base, points),
+            lambda p: downsample_section(get_section(p, name, base), DOWNSAMPLED_TABLES[name], points),
+            panel
+        )
+    return data_store.get_cached(('section', name, base), lambda p: build_section(p, name, base), panel)
+
+def build_section(panel, name, base):
+    builder, _ = SECTIONS[name]
+    with telemetry.stage(f"section_{name}"):
+        return builder(panel, base)
+
+def downsample_section(section, tables, points):
+    with telemetry.stage("downsample"):
+        return {
+            key: downsample.downsample_frame(value, points, tables[key]) if key in tables else value
+            for key, value in section.items()
+        }
+
+def build_payload(panel, names, base, points=None):
+    """Merge the requested sections. Only the sections asked for are computed."""
+    if any(SECTIONS[name][1] for name in names) and get_core_metrics(panel, base) is None:
+        log.warning("Metrics calculation returned None (insufficient data)")
+        # Return a valid structure with nulls/zeros to allow frontend to render empty state
+        # rather than crashing with 500
+        return {
+            "error": INSUFFICIENT_DATA_ERROR,
+            "vitals": { k: 0 for k in ["beta", "annualReturn", "annualVol", "sharpe", "sortino", "maxDrawdown", "cvar95", "rolling1mVol"] }, # Partial fallback
             "riskAttribution": [],
             "stressTests": [],
             "periodicReturns": [],
             "monteCarlo": [],
-            "history": []
+            "history": [],
+            "leverage": {}
         }
 
-        # Format Risk Attribution
-        for ticker, stats in metrics['Risk_Attribution'].items():
-            response["riskAttribution"].append({
-                "ticker": ticker,
-                "weight": stats['Weight'],
-                "pctRisk": stats['Pct_Risk'],
-                "mctr": stats['MCTR']
-            })
-        response["riskAttribution"].sort(key=lambda x: x["pctRisk"], reverse=True)
-
-        # Format Stress Tests
-        for scenario, impact in stress_results.items():
-            response["stressTests"].append({
-                "scenario": scenario,
-                "impact": impact
-            })
-        
-        # Format Volume Weighted Correlation Matrix
-        vw_corr = metrics.get('Volume_Weighted_Correlation')
-        vw_corr_data = { "tickers": [], "matrix": [] }
-        if vw_corr is not None and not vw_corr.empty:
-            try:
-                vw_corr_data["tickers"] = vw_corr.columns.tolist()
-                # Handle NaN/Inf in matrix: replace with None
-                mat = vw_corr.values
-                # We need to iterate or use a masked replacement because simple tolist() keeps NaNs which are invalid JSON
-                clean_mat = []
-                for row in mat:
-                    clean_row = [to_float(x) for x in row]
-                    clean_mat.append(clean_row)
-                vw_corr_data["matrix"] = clean_mat
-            except Exception as e:
-                print(f"Error formatting correlation matrix: {e}")
-                
-        response["volumeWeightedCorrelation"] = vw_corr_data
-
-        # Get portfolio config for weights and direction (Used for Currency & Periodic Returns)
-        portfolio_config = getattr(risk, 'PORTFOLIO_CONFIG', {})
-
-        # Calculate Currency Exposure using portfolio_config
-        # Share of Gross Exposure
-        curr_exposure = {}
-        total_gross = 0
-        if portfolio_config:
-            for ticker, info in portfolio_config.items():
-                curr = info.get('currency', 'USD')
-                weight = info.get('weight', 0)
-                curr_exposure[curr] = curr_exposure.get(curr, 0) + weight
-                total_gross += weight
-        
-        # Normalize to percentages of entire portfolio gross exposure
-        if total_gross > 0:
-            for curr in curr_exposure:
-                curr_exposure[curr] = curr_exposure[curr] / total_gross
-        
-        response["vitals"]["currencyExposure"] = curr_exposure
-
-        # Format Periodic Returns
-        # Periodic returns is a DataFrame: index=ticker, columns=['YTD', '1Y', '3Y', '5Y']
-        # We need to add 1M returns and YTD contribution
-        
-
-        
-        for ticker, row in periodic_rets.iterrows():
-            # Get portfolio info for this ticker
-            ticker_config = portfolio_config.get(ticker, {})
-            weight = ticker_config.get('weight', 0) if ticker_config else 0
-            direction = ticker_config.get('type', None)  # 'Long' or 'Short'
-            
-            # Calculate YTD contribution: weight * ytd_return * direction
-            ytd_ret = row['YTD'] if 'YTD' in row and not pd.isna(row['YTD']) else 0
-            dir_multiplier = 1 if direction == 'Long' else (-1 if direction == 'Short' else 0)
-            ytd_contribution = weight * ytd_ret * dir_multiplier if weight and ytd_ret else None
-            
-            # Calculate 1M return from the returns data
-            r1m = None
-            if ticker in usd_prices.columns:
-                series = usd_prices[ticker].dropna()
-                if len(series) > 21:  # ~1 month of trading days
-                    current = series.iloc[-1]
-                    past = series.iloc[-22]
-                    r1m = (current - past) / past if past != 0 else None
-            
-            response["periodicReturns"].append({
-                "ticker": ticker,
-                "ytd": row['YTD'] if 'YTD' in row and not pd.isna(row['YTD']) else None,
-                "r1m": to_float(r1m),
-                "r1y": row['1Y'] if not pd.isna(row['1Y']) else None,
-                "r5y": row['5Y'] if not pd.isna(row['5Y']) else None,
-                "ytdContribution": to_float(ytd_contribution),
-                "weight": to_float(weight) if weight else None,
-                "direction": direction
-            })
-        
-        # Format Monte Carlo (Percentiles for Cone Chart)
-        if mc_paths is not None:
-            # mc_paths shape: (sims, days+1)
-            days = mc_paths.shape[1]
-            p05 = np.percentile(mc_paths, 5, axis=0)
-            p50 = np.percentile(mc_paths, 50, axis=0)
-            p95 = np.percentile(mc_paths, 95, axis=0)
-            
-            for t in range(days):
-                response["monteCarlo"].append({
-                    "day": t,
-                    "p05": p05[t],
-                    "p50": p50[t],
-                    "p95": p95[t]
-                })
-
-        # Format History (Cumulative 1000 base)
-        portfolio_cum = (1 + metrics['Returns_Stream']).cumprod() * 1000
-        benchmark_cum = (1 + metrics['Benchmark_Stream']).cumprod() * 1000
-        drawdown_stream = metrics['Drawdown_Stream']
-        
-        # Align indexes
-        common_idx = portfolio_cum.index
-        
-        # We'll limit history to optimize payload if needed, but for now send full
-        for date in common_idx:
-            date_str = date.strftime('%Y-%m-%d')
-            response["history"].append({
-                "date": date_str,
-                "portfolio": to_float(portfolio_cum.loc[date]),
-                "benchmark": to_float(benchmark_cum.loc[date]),
-                "drawdown": to_float(drawdown_stream.loc[date])
-            })
-
-        # Format YTD History (Base 100k)
-        response["ytdHistory"] = []
-        if metrics.get('YTD_Stream') is not None:
-            ytd_port = metrics['YTD_Stream']
-            # Reconstruct YTD Benchmark Value Series (Start=1.0)
-            ytd_bench_ret = metrics.get('YTD_Benchmark_Stream')
-            
-            if ytd_port is not None and not ytd_port.empty:
-                 # Benchmark might be returns series, need convert to price index starting 1.0
-                if ytd_bench_ret is not None and not ytd_bench_ret.empty:
-                    ytd_bench_idx = (1 + ytd_bench_ret).cumprod()
-                    # Align start to 1.0 (it starts at 1+r, so we need to prepend 1.0 or just rebase)
-                    # Easier: ytd_bench_idx / ytd_bench_idx.iloc[0] * (1 + first_ret)? 
-                    # Actually standard way: Price_t = Price_{t-1} * (1+r_t). Start at 100k.
-                    # ytd_bench_ret is daily returns.
-                    ytd_bench_vals = (1 + ytd_bench_ret).cumprod()
-                    # Prepend starting value 1.0 if possible, or just normalize
-                    # Simplest: assume first return is from Day 1. Day 0 is 100k.
-                    # We will just plot the available series scaled to 100k.
-                    pass
-                
-                # Align dates
-                for date in ytd_port.index:
-                    date_str = date.strftime('%Y-%m-%d')
-                    
-                    port_val = ytd_port.loc[date] * 100000
-                    
-                    bench_val = None
-                    if ytd_bench_ret is not None and date in ytd_bench_ret.index:
-                         # This is approximate as we need full series for accurate index
-                         # Let's do it properly outside loop
-                         pass
-                    
-                    response["ytdHistory"].append({
-                        "date": date_str,
-                        "portfolio": to_float(port_val),
-                        "benchmark": None # calculated below
-                    })
-
-                # Proper Benchmark Index Calculation
-                if ytd_bench_ret is not None and not ytd_bench_ret.empty:
-                    # Align to portfolio dates
-                    aligned_bench = ytd_bench_ret.reindex(ytd_port.index).fillna(0)
-                    bench_curve = (1 + aligned_bench).cumprod() * 100000
-                    
-                    for i, item in enumerate(response["ytdHistory"]):
-                        date = item["date"]
-                        # Map back
-                        if i < len(bench_curve):
-                             item["benchmark"] = to_float(bench_curve.iloc[i])
-
-        # Sanitize Monte Carlo values too
-        for mc_point in response["monteCarlo"]:
-            for key in ["p05", "p50", "p95"]:
-                mc_point[key] = to_float(mc_point[key])
-        
-        # Sanitize stress tests
-        for st in response["stressTests"]:
-            st["impact"] = to_float(st["impact"])
-        
-        # Sanitize risk attribution
-        for ra in response["riskAttribution"]:
-            ra["weight"] = to_float(ra["weight"])
-            ra["pctRisk"] = to_float(ra["pctRisk"])
-            ra["mctr"] = to_float(ra["mctr"])
-
-        return response
+    payload = {}
+    for name in names:
+        payload.update(get_section(panel, name, base, points))
+    if 'vitals' in names and panel.get('memo') is None and panel.get('fetched_at') is not None:
+        # Every data version the dashboard showed is kept for as_of= queries and vitals trends
+        data_store.get_cached(('snapshot', base), lambda p: record_snapshot(p, base), panel)
+    return payload
+
+def record_snapshot(panel, base):
+    """Append this data version's snapshot sections to the as-of store. A failure only loses the snapshot."""
+    try:
+        return snapshots.record(panel, base, {name: get_section(panel, name, base) for name in snapshots.SNAPSHOT_SECTIONS})
+    except Exception:
+        log.exception("Could not record the %s snapshot", base)
+        return False
+
+def snapshot_response(request, names, base, layout, as_of):
+    """The stored sections `names` (those a snapshot holds) as they were at `as_of`, plus the snapshot's identity."""
+    base, error = check_params(base, layout)
+    if error:
+        return error
+    try:
+        fmt, precision, encoding = negotiate(request)
+        snapshot = snapshots.load(as_of, base)
+    except ValueError as e:
+        return {"error": str(e)}
+    if snapshot is None:
+        return {"error": f"No {base} snapshot recorded at or before {as_of}"}
+
+    payload = {"snapshot": snapshot["meta"]}
+    for name in names:
+        payload.update(snapshot["sections"].get(name, {}))
+    key = ["snapshot", base, snapshot["meta"]["dataVersion"]] + list(names) + [layout, fmt, precision, encoding or "identity"]
+    etag = '"' + "-".join(str(part) for part in key) + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={**headers, "Vary": "Accept, Accept-Encoding"})
+    body, applied = encode_body(payload, fmt, layout, precision, encoding)
+    return encoded_response("snapshot", body, fmt, applied, headers)
+
+def etag_matches(request, etag):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return etag in candidates or "*" in candidates
+
+def check_params(base, layout):
+    """Normalized base currency and an error payload (or None) for the common query parameters."""
+    if not risk:
+        return base, {"error": "risk.py not found or failed to import"}
+
+    base = base.upper()
+    if base not in risk.REPORTING_CURRENCIES:
+        return base, {"error": f"Unsupported base currency '{base}'. Use one of: {', '.join(risk.REPORTING_CURRENCIES)}"}
+    if layout not in serialize.LAYOUTS:
+        return base, {"error": f"Unsupported layout '{layout}'. Use one of: {', '.join(serialize.LAYOUTS)}"}
+    return base, None
+
+def negotiate(request):
+    """
+    (format, precision, content encoding) for a request: `format=` or the Accept
+    header picks json / msgpack / arrow, `precision=32|64` types the float
+    columns of the binary formats. Raises ValueError for bad parameters.
+    """
+    fmt = serialize.negotiate_format(request.headers.get("accept"), request.query_params.get("format"))
+    precision = request.query_params.get("precision", "64")
+    if not precision.isdigit() or int(precision) not in serialize.PRECISIONS:
+        raise ValueError(f"Unsupported precision '{precision}'. Use one of: {', '.join(map(str, serialize.PRECISIONS))}")
+    precision = int(precision) if fmt != "json" else 64
+    return fmt, precision, serialize.negotiate_encoding(request.headers.get("accept-encoding"))
+
+def encode_body(payload, fmt, layout, precision, encoding):
+    """Encode + compress a payload, timing both stages. Returns (body, encoding applied)."""
+    with telemetry.stage("encode"):
+        body = serialize.encode(payload, fmt, layout, precision)
+    if encoding is None:
+        return body, None
+    with telemetry.stage("compress"):
+        return serialize.compress(body, encoding)
+
+def encoded_response(endpoint, body, fmt, encoding, headers=None):
+    telemetry.observe('alpha_payload_bytes', len(body), endpoint=endpoint, format=fmt, encoding=encoding or "identity")
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept, Accept-Encoding"
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=serialize.MEDIA_TYPES[fmt], headers=headers)
+
+def cached_response(request, key, layout, build):
+    """
+    Serve `build(panel)` with an ETag derived from the data version and `key`.
+    A client presenting the current ETag gets a 304 without anything being
+    computed; otherwise the encoded (and compressed) body is cached per data
+    version and representation.
+    """
+    try:
+        fmt, precision, encoding = negotiate(request)
+    except ValueError as e:
+        return {"error": str(e)}
+
+    try:
+        panel = data_store.get_panel()
+        representation = (fmt, precision, encoding or "identity")
+        etag = '"' + "-".join([panel["version_tag"]] + [str(part) for part in key + representation]) + '"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers={**headers, "Vary": "Accept, Accept-Encoding"})
+
+        body, applied = data_store.get_shared(
+            ('body',) + key + representation,
+            lambda p: encode_body(build(p), fmt, layout, precision, encoding),
+            panel
+        )
+        return encoded_response(key[0], body, fmt, applied, headers)
 
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        log.exception("Error serving %s", "/".join(str(part) for part in key))
+        return {"error": str(e)}
+
+def panel_rows():
+    """Rows of the current panel, the most any downsampled table can have."""
+    return data_store.get_panel()['usd_prices'].shape[0]
+
+def section_response(request, name, sections, base, layout, points=None, resolution=None):
+    base, error = check_params(base, layout)
+    if error:
+        return error
+    try:
+        points = downsample.resolve_points(points, resolution, panel_rows() if points else None)
+    except ValueError as e:
+        return {"error": str(e)}
+
+    return cached_response(
+        request, (name, base, layout, points or "full"), layout,
+        lambda panel: build_payload(panel, sections, base, points)
+    )
+
+def diff_history_table(current, previous=None, since=None):
+    """
+    Rows of `current` the client does not have yet: rows that are new or whose
+    values changed since the `previous` version, or else every row dated on/after
+    `since` (the client's last bar is resent in case it was revised).
+    """
+    if previous is not None:
+        value_cols = [c for c in current.columns if c != "date"]
+        prev = previous.set_index("date").reindex(current["date"])
+        cur_vals = current[value_cols].to_numpy(dtype=float)
+        prev_vals = prev[value_cols].to_numpy(dtype=float)
+        same = (cur_vals == prev_vals) | (np.isnan(cur_vals) & np.isnan(prev_vals))
+        return current[~same.all(axis=1)].reset_index(drop=True)
+    return current[current["date"] >= since].reset_index(drop=True)
+
+def build_history_delta(panel, base, since_version=None, since=None):
+    """History/YTD points newer than what the client holds, plus current vitals."""
+    if get_core_metrics(panel, base) is None:
+        return {"error": INSUFFICIENT_DATA_ERROR}
+
+    current = get_section(panel, 'history', base)
+    previous = data_store.get_archived(('history', base), since_version) if since_version else None
+    full = previous is None and since is None
+
+    delta = {
+        "version": panel["version_tag"],
+        "baseVersion": since_version if previous is not None else None,
+        "full": full,
+    }
+    for table in ("history", "ytdHistory"):
+        frame = current[table]
+        delta[table] = frame if full else diff_history_table(
+            frame, previous[table] if previous is not None else None, since
+        )
+        # Clients drop anything older than the start (lookback roll / new year)
+        delta[table + "Start"] = frame["date"].iloc[0] if not frame.empty else None
+    delta.update(get_section(panel, 'vitals', base))
+    return delta
+
+# Push order for /api/stream: cheapest / most glanced-at first, Monte Carlo last
+STREAM_SECTIONS = ['vitals', 'history', 'attribution', 'stress', 'periodic', 'fx', 'correlation', 'montecarlo']
+STREAM_KEEPALIVE_SECONDS = 15
+
+def sse_event(event, event_id, data):
+    return b"event: " + event.encode() + b"\nid: " + event_id.encode() + b"\ndata: " + data + b"\n\n"
+
+def stream_sections(base, layout, points, last_event_id=None, once=False):
+    """
+    Server-Sent Events generator: one event per section as soon as it is ready,
+    then a `done` event, then the same again for every new data version.
+    """
+    panel = data_store.get_panel()
+    # A reconnecting client that already has this version just waits for the next one
+    skip_current = last_event_id == panel["version_tag"]
+
+    while True:
+        if not skip_current:
+            for name in STREAM_SECTIONS:
+                body = data_store.get_cached(
+                    ('json', 'section', name, base, layout, points or "full"),
+                    lambda p, name=name: serialize.render(build_payload(p, [name], base, points), layout),
+                    panel
+                )
+                # Insufficient data is reported once instead of per section
+                if body.startswith(b'{"error"'):
+                    yield sse_event("error", panel["version_tag"], body)
+                    break
+                yield sse_event(name, panel["version_tag"], body)
+            yield sse_event("done", panel["version_tag"], serialize.dumps({"version": panel["version_tag"]}))
+        if once:
+            return
+        skip_current = False
+
+        new_panel = None
+        while new_panel is None:
+            new_panel = data_store.wait_for_update(panel["version"], timeout=STREAM_KEEPALIVE_SECONDS)
+            if new_panel is None:
+                yield b": keepalive\n\n"
+        panel = new_panel
+
+@app.get("/api/stream")
+def stream_metrics(request: Request, base: str = "USD", layout: str = "rows",
+                   points: int | None = None, resolution: str | None = None, once: bool = False):
+    """Progressive dashboard over SSE; `once=1` closes after the first full push."""
+    base, error = check_params(base, layout)
+    if error:
+        return error
+    try:
+        points = downsample.resolve_points(points, resolution, panel_rows() if points else None)
+    except ValueError as e:
+        return {"error": str(e)}
+
+    return StreamingResponse(
+        stream_sections(base, layout, points, request.headers.get("last-event-id"), once),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def start_intraday(base, layout):
+    """Normalized base and an error payload (or None); starts the intraday feed on first use."""
+    base, error = check_params(base, layout)
+    if error:
+        return base, error
+    try:
+        intraday.start()
+    except ValueError as e:
+        return base, {"error": str(e)}
+    return base, None
+
+@app.get("/api/intraday")
+def get_intraday(base: str = "USD", layout: str = "rows"):
+    """Latest intraday snapshot (value, drawdowns, realized vol, exposure) and the session's bars so far."""
+    base, error = start_intraday(base, layout)
+    if error:
+        return error
+    _, payload = intraday.current(base)
+    return Response(content=serialize.render(payload, layout), media_type="application/json",
+                    headers={"Cache-Control": "no-cache"})
+
+def stream_intraday_bars(base, layout):
+    """
+    Server-Sent Events generator: a `session` event with the session so far,
+    then a `bar` event per bar carrying the snapshot and only the new bars, and
+    `end` when the feed finishes or fails. A new session date is sent whole again.
+    """
+    seq, payload = intraday.current(base)
+    session_date, sent = None, 0
+    while True:
+        snapshot = payload["intraday"]
+        if snapshot is not None:
+            event = "bar" if snapshot["sessionDate"] == session_date else "session"
+            session_date, sent = snapshot["sessionDate"], snapshot["bars"]
+            yield sse_event(event, str(seq), serialize.render(payload, layout))
+        if payload["status"] != "running":
+            yield sse_event("end", str(seq), serialize.dumps({"status": payload["status"], "error": payload["error"]}))
+            return
+
+        new_seq = None
+        while new_seq is None:
+            new_seq = intraday.wait_for_bar(seq, timeout=STREAM_KEEPALIVE_SECONDS)
+            if new_seq is None:
+                yield b": keepalive\n\n"
+        seq, payload = intraday.current(base, sent, session_date)
+
+@app.get("/api/intraday/stream")
+def stream_intraday(base: str = "USD", layout: str = "rows"):
+    """Intraday bars over SSE, pushed as the feed delivers them; the daily sections are not recomputed."""
+    base, error = start_intraday(base, layout)
+    if error:
+        return error
+    return StreamingResponse(
+        stream_intraday_bars(base, layout),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+PROFILE_OUTPUTS = {'1': 'json', 'json': 'json', 'pstats': 'pstats'}
+
+def profile_response(request, base, layout, points, resolution, output, sort_by):
+    """
+    Recompute the /api/metrics payload (bypassing every cache, from the current
+    panel) under the profiler and return the profile instead of the payload.
+    """
+    base, error = check_params(base, layout)
+    if error:
+        return error
+    if output not in PROFILE_OUTPUTS:
+        return {"error": f"Unsupported profile '{output}'. Use one of: {', '.join(PROFILE_OUTPUTS)}"}
+    try:
+        points = downsample.resolve_points(points, resolution, panel_rows() if points else None)
+        fmt, precision, encoding = negotiate(request)
+        panel = data_store.get_panel()
+        uncached = data_store.detached(panel)
+        (body, _), report, stats = profiling.profile_run(
+            lambda: encode_body(build_payload(uncached, METRICS_SECTIONS, base, points), fmt, layout, precision, encoding),
+            sort_by
+        )
+    except ValueError as e:
+        return {"error": str(e)}
+
+    if PROFILE_OUTPUTS[output] == 'pstats':
+        filename = f"metrics-{base}-{panel['version_tag']}.pstats"
+        return Response(
+            content=profiling.stats_bytes(stats), media_type="application/octet-stream",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+    return {"version": panel["version_tag"], "base": base, "payloadBytes": len(body), "profile": report}
+
+@app.get("/api/metrics")
+def get_metrics(request: Request, base: str = "USD", layout: str = "rows",
+                points: int | None = None, resolution: str | None = None,
+                profile: str | None = None, profile_sort: str = "cumulative", as_of: str | None = None):
+    """
+    Full dashboard payload. `profile=1` (or `pstats`) returns a profile of a
+    fresh, uncached computation instead; `as_of=` the stored vitals and
+    attribution of the snapshot current at that date / timestamp.
+    """
+    if as_of:
+        return snapshot_response(request, METRICS_SECTIONS, base, layout, as_of)
+    if profile:
+        return profile_response(request, base, layout, points, resolution, profile, profile_sort)
+    return section_response(request, 'metrics', METRICS_SECTIONS, base, layout, points, resolution)
+
+@app.get("/api/vitals")
+def get_vitals(request: Request, base: str = "USD", layout: str = "rows", as_of: str | None = None):
+    if as_of:
+        return snapshot_response(request, ['vitals'], base, layout, as_of)
+    return section_response(request, 'vitals', ['vitals'], base, layout)
+
+@app.get("/api/history")
+def get_history(request: Request, base: str = "USD", layout: str = "rows",
+                points: int | None = None, resolution: str | None = None):
+    return section_response(request, 'history', ['history'], base, layout, points, resolution)
+
+@app.get("/api/history/delta")
+def get_history_delta(request: Request, base: str = "USD", layout: str = "rows",
+                      since_version: str | None = None, since: str | None = None):
+    """
+    Incremental sync: pass the `version` from the last response (since_version=)
+    or the last date held (since=YYYY-MM-DD). Falls back to `since`, then to a
+    full payload, if that version is no longer archived.
+    """
+    base, error = check_params(base, layout)
+    if error:
+        return error
+    if since is not None:
+        try:
+            since = pd.Timestamp(since).strftime('%Y-%m-%d')
+        except (ValueError, TypeError, OverflowError):
+            return {"error": f"Invalid since date '{since}'. Use YYYY-MM-DD."}
+        # Dates outside the panel select the same rows as its first date / the day after its last,
+        # so clamp them before they become part of the cache key
+        dates = data_store.get_panel()['usd_prices'].index
+        if not dates.empty:
+            after_last = (dates[-1] + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+            since = min(max(since, dates[0].strftime('%Y-%m-%d')), after_last)
+    if since_version and data_store.get_archived(('history', base), since_version) is None:
+        # Unknown or evicted version: served like a request without it (and cached as one)
+        since_version = None
+
+    return cached_response(
+        request, ("delta", base, layout, since_version or "", since or ""), layout,
+        lambda panel: build_history_delta(panel, base, since_version, since)
+    )
+
+@app.get("/api/attribution")
+def get_attribution(request: Request, base: str = "USD", layout: str = "rows", as_of: str | None = None):
+    if as_of:
+        return snapshot_response(request, ['attribution'], base, layout, as_of)
+    return section_response(request, 'attribution', ['attribution'], base, layout)
+
+@app.get("/api/snapshots")
+def get_snapshots(base: str = "USD", layout: str = "rows", fields: str | None = None,
+                  start: str | None = None, end: str | None = None, every: str = "day"):
+    """
+    Stored vitals over time (`every=day`: the last snapshot of each day, or
+    `snapshot`), read from the snapshot store without recomputation. `fields`
+    is a comma-separated subset such as sharpe,annualVol,grossExp.
+    """
+    base, error = check_params(base, layout)
+    if error:
+        return error
+    try:
+        frame = snapshots.trend(base, fields.split(",") if fields else None, start, end, every)
+    except ValueError as e:
+        return {"error": str(e)}
+    return Response(content=serialize.render({"baseCurrency": base, "snapshots": frame}, layout),
+                    media_type="application/json", headers={"Cache-Control": "no-cache"})
+
+@app.get("/api/correlation")
+def get_correlation(request: Request, base: str = "USD", layout: str = "rows"):
+    return section_response(request, 'correlation', ['correlation'], base, layout)
+
+@app.get("/api/montecarlo")
+def get_montecarlo(request: Request, base: str = "USD", layout: str = "rows"):
+    return section_response(request, 'montecarlo', ['montecarlo'], base, layout)
+
+@app.get("/api/periodic")
+def get_periodic(request: Request, base: str = "USD", layout: str = "rows"):
+    return section_response(request, 'periodic', ['periodic'], base, layout)
+
+@app.get("/api/stress")
+def get_stress(request: Request, base: str = "USD", layout: str = "rows"):
+    return section_response(request, 'stress', ['stress'], base, layout)
+
+@app.get("/api/fx")
+def get_fx(request: Request, base: str = "USD", layout: str = "rows"):
+    return section_response(request, 'fx', ['fx'], base, layout)
+
+def format_currency_exposure(portfolio_config):
+    # Share of Gross Exposure per currency
+    curr_exposure = {}
+    total_gross = 0
+    for ticker, info in portfolio_config.items():
+        curr = info.get('currency', 'USD')
+        weight = info.get('weight', 0)
+        curr_exposure[curr] = curr_exposure.get(curr, 0) + weight
+        total_gross += weight
+    
+    # Normalize to percentages of entire portfolio gross exposure
+    if total_gross > 0:
+        for curr in curr_exposure:
+            curr_exposure[curr] = curr_exposure[curr] / total_gross
+    return curr_exposure
+
+def format_risk_attribution(metrics):
+    attribution = pd.DataFrame.from_dict(
+        metrics['Risk_Attribution'], orient='index', columns=['Weight', 'Pct_Risk', 'MCTR']
+    )
+    frame = pd.DataFrame({
+        "ticker": attribution.index.tolist(),
+        "weight": attribution['Weight'].to_numpy(dtype=float),
+        "pctRisk": attribution['Pct_Risk'].to_numpy(dtype=float),
+        "mctr": attribution['MCTR'].to_numpy(dtype=float),
+    })
+    return frame.sort_values("pctRisk", ascending=False, kind="stable").reset_index(drop=True)
+
+def format_correlation(vw_corr):
+    # Volume Weighted Correlation Matrix (NaN cells become null on render)
+    if vw_corr is None or vw_corr.empty:
+        return {"tickers": [], "matrix": []}
+    return {"tickers": vw_corr.columns.tolist(), "matrix": vw_corr.to_numpy(dtype=float)}
+
+def format_periodic_returns(periodic_rets, prices, portfolio_config):
+    # Periodic returns is a DataFrame: index=ticker, columns=['YTD', '1Y', '3Y', '5Y']
+    # We add 1M returns and YTD contribution (weight * ytd_return * direction)
+    columns = ["ticker", "ytd", "r1m", "r1y", "r5y", "ytdContribution", "weight", "direction"]
+    if periodic_rets.empty:
+        return pd.DataFrame(columns=columns)
+
+    tickers = periodic_rets.index
+    config = pd.DataFrame.from_dict(portfolio_config, orient='index').reindex(tickers)
+    weight = config['weight'].fillna(0).astype(float)
+    direction = config['type'].astype(object).where(config['type'].notna(), None)
+    dir_multiplier = config['type'].map({'Long': 1, 'Short': -1}).fillna(0).astype(float)
+
+    ytd = periodic_rets['YTD'].astype(float) if 'YTD' in periodic_rets.columns else pd.Series(np.nan, index=tickers)
+    ytd_filled = ytd.fillna(0)
+    ytd_contribution = (weight * ytd_filled * dir_multiplier).where((weight != 0) & (ytd_filled != 0))
+
+    # 1M return: last valid price vs the 22nd valid observation from the end (~1 month of trading days)
+    valid = prices.notna()
+    obs_from_end = valid.iloc[::-1].cumsum().iloc[::-1]
+    current = prices.ffill().iloc[-1]
+    past = prices.where(valid & (obs_from_end == 22)).max()
+    r1m = ((current - past) / past.where(past != 0)).reindex(tickers)
+
+    return pd.DataFrame({
+        "ticker": tickers.tolist(),
+        "ytd": ytd.to_numpy(),
+        "r1m": r1m.to_numpy(dtype=float),
+        "r1y": periodic_rets['1Y'].to_numpy(dtype=float),
+        "r5y": periodic_rets['5Y'].to_numpy(dtype=float),
+        "ytdContribution": ytd_contribution.to_numpy(),
+        "weight": weight.where(weight != 0).to_numpy(),
+        "direction": direction.tolist(),
+    }, columns=columns)
+
+def format_monte_carlo(mc_paths):
+    # Percentiles for Cone Chart. mc_paths shape: (sims, days+1)
+    if mc_paths is None:
+        return pd.DataFrame(columns=["day", "p05", "p50", "p95"])
+    p05, p50, p95 = np.percentile(mc_paths, [5, 50, 95], axis=0)
+    return pd.DataFrame({"day": np.arange(mc_paths.shape[1]), "p05": p05, "p50": p50, "p95": p95})
+
+def format_history(metrics):
+    # Cumulative 1000 base, aligned to the portfolio return index
+    portfolio_cum = (1 + metrics['Returns_Stream']).cumprod() * 1000
+    benchmark_cum = (1 + metrics['Benchmark_Stream']).cumprod() * 1000
+    drawdown_stream = metrics['Drawdown_Stream']
+    
+    common_idx = portfolio_cum.index
+    return pd.DataFrame({
+        "date": common_idx.strftime('%Y-%m-%d'),
+        "portfolio": portfolio_cum.to_numpy(dtype=float),
+        "benchmark": benchmark_cum.reindex(common_idx).to_numpy(dtype=float),
+        "drawdown": drawdown_stream.reindex(common_idx).to_numpy(dtype=float),
+    })
+
+def format_ytd_history(metrics):
+    # YTD History (Base 100k). Benchmark returns are aligned to portfolio dates and compounded.
+    ytd_port = metrics.get('YTD_Stream')
+    ytd_bench_ret = metrics.get('YTD_Benchmark_Stream')
+    if ytd_port is None or ytd_port.empty:
+        return pd.DataFrame(columns=["date", "portfolio", "benchmark"])
+
+    if ytd_bench_ret is not None and not ytd_bench_ret.empty:
+        aligned_bench = ytd_bench_ret.reindex(ytd_port.index).fillna(0)
+        bench_curve = ((1 + aligned_bench).cumprod() * 100000).to_numpy(dtype=float)
+    else:
+        bench_curve = np.full(len(ytd_port), np.nan)
+
+    return pd.DataFrame({
+        "date": ytd_port.index.strftime('%Y-%m-%d'),
+        "portfolio": (ytd_port * 100000).to_numpy(dtype=float),
+        "benchmark": bench_curve,
+    })
+
+REPORT_MEDIA_TYPES = {'.png': 'image/png', '.pdf': 'application/pdf'}
+MAX_REPORT_WAIT_SECONDS = 60
+
+@app.get("/api/report")
+def get_report(base: str = "USD", wait: float = 0):
+    """
+    Status of the PNG/PDF report for the current data (ready / rendering / failed,
+    with its file names). A render starts in a background process when the
+    metrics changed; `wait=` seconds blocks until it finishes.
+    """
+    base, error = check_params(base, "rows")
+    if error:
+        return error
+    try:
+        return report_renderer.get_report(base, wait=min(max(wait, 0), MAX_REPORT_WAIT_SECONDS))
+    except ValueError as e:
         return {"error": str(e)}
 
+@app.get("/api/report/{filename}")
+def get_report_file(request: Request, filename: str, base: str = "USD", wait: float = 0):
+    """One rendered report file (report.pdf, dashboard.png, ...); the status payload while it is not ready."""
+    status = get_report(base, wait)
+    if status.get("status") != "ready":
+        return status
+    if filename not in status["files"]:
+        return {"error": f"Unknown report file '{filename}'. Use one of: {', '.join(status['files'])}"}
+
+    etag = f'"report-{status["fingerprint"]}-{filename}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    path = report_renderer.report_path(status["fingerprint"], filename)
+    return FileResponse(path, media_type=REPORT_MEDIA_TYPES[os.path.splitext(filename)[1]], headers=headers)
+
+@app.post("/api/jobs")
+def create_job(spec: dict = Body(...)):
+    """Submit a heavy analytics job (see jobs.py for the spec format)."""
+    if not risk:
+        return {"error": "risk.py not found or failed to import"}
+    try:
+        job, deduplicated = jobs.submit(spec)
+    except ValueError as e:
+        return {"error": str(e)}
+    return {**jobs.describe(job), "deduplicated": deduplicated}
+
+@app.get("/api/jobs")
+def list_jobs():
+    return {"jobs": jobs.list_jobs()} if risk else {"error": "risk.py not found or failed to import"}
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    job = jobs.get(job_id) if risk else None
+    if job is None:
+        return {"error": f"Unknown job '{job_id}'"}
+    return jobs.describe(job)
+
+@app.get("/api/jobs/{job_id}/result")
+def get_job_result(request: Request, job_id: str, layout: str = "rows"):
+    job = jobs.get(job_id) if risk else None
+    if job is None:
+        return {"error": f"Unknown job '{job_id}'"}
+    if layout not in serialize.LAYOUTS:
+        return {"error": f"Unsupported layout '{layout}'. Use one of: {', '.join(serialize.LAYOUTS)}"}
+    try:
+        fmt, precision, encoding = negotiate(request)
+    except ValueError as e:
+        return {"error": str(e)}
+    if job['status'] != 'done':
+        return {**jobs.describe(job), "error": f"Job is {job['status']}, no result available"}
+    body, applied = encode_body(job['result'], fmt, layout, precision, encoding)
+    return encoded_response("job_result", body, fmt, applied)
+
+@app.delete("/api/jobs/{job_id}")
+def cancel_job(job_id: str):
+    job = jobs.cancel(job_id) if risk else None
+    if job is None:
+        return {"error": f"Unknown job '{job_id}'"}
+    return jobs.describe(job)
+
 if __name__ == "__main__":
+    import argparse
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+
+    parser = argparse.ArgumentParser(description="Portfolio dashboard API server.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes; more than one shares data and payloads through backend/cache/shared")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        # Inherited by the worker processes: one fetch and one computation per data version for all of them
+        os.environ["ALPHA_SHARED_CACHE"] = "1"
+        uvicorn.run("server:app", host=args.host, port=args.port, workers=args.workers,
+                    app_dir=os.path.dirname(os.path.abspath(__file__)))
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
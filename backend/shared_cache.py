@@ -0,0 +1,208 @@
+"""
+Cross-process cache shared by all uvicorn workers on one machine.
+
+Enabled with ALPHA_SHARED_CACHE=1 (server.py sets it when started with
+--workers > 1). Three pieces live under backend/cache/shared/:
+
+  shared.sqlite     published panel versions, encoded payload blobs and leases
+  panel-<tag>/      the price / FX / volume panels of one data version as .npy
+                    files, opened memory-mapped by every worker, so the panel
+                    is held once in the OS page cache instead of once per worker
+  leases            rows in SQLite acting as a cross-process lock with expiry,
+                    so only one worker fetches from Yahoo or computes a payload
+                    while the others wait and then read the result
+
+SQLite runs in WAL mode so readers never block the writer.
+"""
+import json
+import os
+import pickle
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+SHARED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'shared')
+DB_PATH = os.path.join(SHARED_DIR, 'shared.sqlite')
+PANEL_FRAMES = ('raw_prices', 'fx_rates', 'volume', 'usd_prices')
+KEEP_VERSIONS = 3          # Published panels (and their payloads) kept on disk
+LEASE_POLL_SECONDS = 0.1
+
+_init_lock = threading.Lock()
+_initialized = False
+
+
+def enabled():
+    return os.environ.get('ALPHA_SHARED_CACHE', '').lower() in ('1', 'true', 'yes')
+
+
+def _connect():
+    global _initialized
+    if not _initialized:
+        os.makedirs(SHARED_DIR, exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS panels (
+                        version_tag TEXT PRIMARY KEY, fetched_at REAL, published_at REAL
+                    );
+                    CREATE TABLE IF NOT EXISTS entries (
+                        version_tag TEXT, key TEXT, value BLOB, PRIMARY KEY (version_tag, key)
+                    );
+                    CREATE TABLE IF NOT EXISTS leases (
+                        name TEXT PRIMARY KEY, owner TEXT, expires REAL
+                    );
+                """)
+                _initialized = True
+    return conn
+
+
+# ==========================================
+# Leases (cross-process lock)
+# ==========================================
+@contextmanager
+def lease(name, ttl):
+    """
+    Hold the named lease for the enclosed block, waiting while another process
+    (or thread) holds it. A holder that dies is taken over after `ttl` seconds.
+    """
+    owner = f"{os.getpid()}:{threading.get_ident()}"
+    conn = _connect()
+    try:
+        while True:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT expires FROM leases WHERE name = ?", (name,)).fetchone()
+            if row is None or row[0] < now:
+                conn.execute("INSERT OR REPLACE INTO leases VALUES (?, ?, ?)", (name, owner, now + ttl))
+                conn.execute("COMMIT")
+                break
+            conn.execute("COMMIT")
+            time.sleep(LEASE_POLL_SECONDS)
+        try:
+            yield
+        finally:
+            conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+    finally:
+        conn.close()
+
+
+# ==========================================
+# Panels
+# ==========================================
+def _panel_dir(version_tag):
+    return os.path.join(SHARED_DIR, f"panel-{version_tag}")
+
+
+def _save_frame(directory, name, df):
+    np.save(os.path.join(directory, f"{name}.npy"), df.to_numpy(dtype=np.float64))
+    np.save(os.path.join(directory, f"{name}.index.npy"), df.index.to_numpy())
+    return [str(c) for c in df.columns]
+
+
+def _load_frame(directory, name, columns):
+    values = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+    index = pd.DatetimeIndex(np.load(os.path.join(directory, f"{name}.index.npy")))
+    # copy=False keeps the read-only memory map as the frame's storage
+    return pd.DataFrame(values, index=index, columns=columns, copy=False)
+
+
+def publish_panel(version_tag, fetched_at, frames):
+    """Write a fetched panel for all workers and make it the current version."""
+    final = _panel_dir(version_tag)
+    staging = final + f".tmp{os.getpid()}"
+    os.makedirs(staging, exist_ok=True)
+    columns = {name: _save_frame(staging, name, frames[name]) for name in PANEL_FRAMES}
+    with open(os.path.join(staging, 'columns.json'), 'w') as f:
+        json.dump(columns, f)
+    with open(os.path.join(staging, 'data_quality.json'), 'w') as f:
+        json.dump(frames.get('data_quality') or {'stale': {}, 'failed': []}, f)
+    os.replace(staging, final)
+
+    conn = _connect()
+    try:
+        conn.execute("INSERT OR REPLACE INTO panels VALUES (?, ?, ?)", (version_tag, fetched_at, time.time()))
+    finally:
+        conn.close()
+    _prune()
+
+
+def current_panel():
+    """Metadata {'version_tag', 'fetched_at'} of the newest published panel, or None."""
+    if not os.path.exists(DB_PATH):
+        return None
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT version_tag, fetched_at FROM panels ORDER BY published_at DESC LIMIT 1"
+        ).fetchone()
+    finally:
+        conn.close()
+    return {'version_tag': row[0], 'fetched_at': row[1]} if row else None
+
+
+def load_panel(version_tag):
+    """The frames of a published panel, memory-mapped. None if it was pruned meanwhile."""
+    directory = _panel_dir(version_tag)
+    try:
+        with open(os.path.join(directory, 'columns.json')) as f:
+            columns = json.load(f)
+        frames = {name: _load_frame(directory, name, columns[name]) for name in PANEL_FRAMES}
+        with open(os.path.join(directory, 'data_quality.json')) as f:
+            frames['data_quality'] = json.load(f)
+        return frames
+    except FileNotFoundError:
+        return None
+
+
+def _prune():
+    """Drop panels and payloads older than the newest KEEP_VERSIONS versions."""
+    conn = _connect()
+    try:
+        keep = {row[0] for row in conn.execute(
+            "SELECT version_tag FROM panels ORDER BY published_at DESC LIMIT ?", (KEEP_VERSIONS,)
+        )}
+        marks = ",".join("?" * len(keep))
+        conn.execute(f"DELETE FROM panels WHERE version_tag NOT IN ({marks})", tuple(keep))
+        conn.execute(f"DELETE FROM entries WHERE version_tag NOT IN ({marks})", tuple(keep))
+    finally:
+        conn.close()
+
+    # Removing a directory fails on Windows while a worker still maps its files;
+    # it is swept again on the next publish
+    for name in os.listdir(SHARED_DIR):
+        if name.startswith('panel-') and '.tmp' not in name and name[len('panel-'):] not in keep:
+            shutil.rmtree(os.path.join(SHARED_DIR, name), ignore_errors=True)
+
+
+# ==========================================
+# Payload entries
+# ==========================================
+def get(version_tag, key):
+    """Shared value stored under (version_tag, key), or None."""
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT value FROM entries WHERE version_tag = ? AND key = ?", (version_tag, key)
+        ).fetchone()
+    finally:
+        conn.close()
+    return pickle.loads(row[0]) if row else None
+
+
+def put(version_tag, key, value):
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+            (version_tag, key, sqlite3.Binary(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)))
+        )
+    finally:
+        conn.close()
@@ -0,0 +1,277 @@
+"""
+Point-in-time snapshot store.
+
+Whenever the server computes the dashboard for a new data version, the
+sections it served (vitals with leverage and currency exposure, risk
+attribution) are appended to backend/cache/snapshots.sqlite. Each row also
+holds the data version, a hash of the portfolio configuration, and its
+recording time on the provider's clock. Rows are never updated or deleted.
+
+`load(as_of)` returns the snapshot that was current at a date or timestamp, so
+"what did the dashboard say on March 3rd" is a lookup instead of a rerun with
+patched dates. `trend()` reads the headline vitals across snapshots from
+their own column, without decoding or recomputing anything.
+
+Snapshots from offline providers (synthetic, files, replays) go to their own
+file and never mix with the live history.
+
+Usage:
+    python backend/snapshots.py show 2026-03-03 --base PLN
+    python backend/snapshots.py trend --fields sharpe,annualVol --start 2026-01-01
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import zlib
+
+import pandas as pd
+
+import diagnostics
+import providers
+import risk
+import serialize
+import telemetry
+
+log = diagnostics.get_logger('snapshots')
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+# Sections stored per snapshot (server.SECTIONS names)
+SNAPSHOT_SECTIONS = ('vitals', 'attribution')
+# Leverage stats kept as trend fields, under camelCase names like the vitals
+LEVERAGE_FIELDS = {'Long_Exp': 'longExp', 'Short_Exp': 'shortExp', 'Gross_Exp': 'grossExp',
+                   'Net_Exp': 'netExp', 'Daily_Drag': 'dailyDrag'}
+TREND_EVERY = ('day', 'snapshot')
+
+_lock = threading.Lock()
+_initialized = set()
+
+
+def _db_path():
+    # Like the rate curves: offline providers never write into the live history
+    provider = providers.get_provider().name
+    suffix = '' if provider == 'yfinance' else f".{provider}"
+    return os.path.join(CACHE_DIR, f"snapshots{suffix}.sqlite")
+
+
+def _connect():
+    path = _db_path()
+    if path not in _initialized:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    if path not in _initialized:
+        with _lock:
+            if path not in _initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS snapshots (
+                        id INTEGER PRIMARY KEY,
+                        recorded_at TEXT NOT NULL,
+                        as_of TEXT NOT NULL,
+                        data_end TEXT,
+                        base TEXT NOT NULL,
+                        data_version TEXT NOT NULL,
+                        config_hash TEXT NOT NULL,
+                        vitals TEXT NOT NULL,
+                        payload BLOB NOT NULL,
+                        UNIQUE (data_version, base)
+                    );
+                    CREATE INDEX IF NOT EXISTS snapshots_as_of ON snapshots (base, as_of, recorded_at);
+                    CREATE TRIGGER IF NOT EXISTS snapshots_no_update BEFORE UPDATE ON snapshots
+                        BEGIN SELECT RAISE(ABORT, 'snapshots are append-only'); END;
+                    CREATE TRIGGER IF NOT EXISTS snapshots_no_delete BEFORE DELETE ON snapshots
+                        BEGIN SELECT RAISE(ABORT, 'snapshots are append-only'); END;
+                """)
+                _initialized.add(path)
+    return conn
+
+
+def config_hash(portfolio=None):
+    """Short hash of everything besides market data that the stored numbers depend on."""
+    config = {
+        'portfolio': portfolio or risk.PORTFOLIO_CONFIG,
+        'benchmarks': [risk.BENCHMARK, risk.BENCHMARK_WIG, risk.BENCHMARK_MSCI],
+        'lookback_years': risk.LOOKBACK_YEARS,
+        'margin_rate': risk.MARGIN_RATE,
+        'borrow_fee': risk.BORROW_FEE,
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def trend_values(sections):
+    """The scalar vitals and leverage figures of a snapshot, by trend field name."""
+    vitals = sections.get('vitals', {})
+    values = {
+        key: value for key, value in vitals.get('vitals', {}).items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    }
+    for key, name in LEVERAGE_FIELDS.items():
+        if key in vitals.get('leverage', {}):
+            values[name] = vitals['leverage'][key]
+    return serialize.clean(values)
+
+
+def record(panel, base, sections, recorded_at=None):
+    """
+    Append `sections` ({name: section payload}) computed from `panel` as the
+    `base` snapshot of its data version. A version already stored (by another
+    worker) is left as it is. Returns True if a row was added.
+    """
+    recorded_at = _local_naive(pd.Timestamp(recorded_at if recorded_at is not None else providers.now()))
+    tables = {name: [key for key, value in section.items() if isinstance(value, pd.DataFrame)]
+              for name, section in sections.items()}
+    blob = zlib.compress(serialize.dumps({'tables': tables, 'sections': serialize.clean(sections, 'columnar')}))
+    data_end = panel['usd_prices'].index[-1].strftime('%Y-%m-%d') if not panel['usd_prices'].empty else None
+
+    with telemetry.stage('snapshot_record'):
+        conn = _connect()
+        try:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO snapshots (recorded_at, as_of, data_end, base, data_version, config_hash, "
+                "vitals, payload) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (recorded_at.isoformat(), recorded_at.strftime('%Y-%m-%d'), data_end, base, panel['version_tag'],
+                 config_hash(), serialize.dumps(trend_values(sections)).decode('utf-8'), blob)
+            )
+        finally:
+            conn.close()
+    if cursor.rowcount:
+        log.info("Recorded %s snapshot of %s (%d bytes)", base, panel['version_tag'], len(blob))
+    return bool(cursor.rowcount)
+
+
+def _local_naive(stamp):
+    """`stamp` as naive local time, the clock providers.now() reports; naive input is kept as it is."""
+    if stamp.tz is None:
+        return stamp
+    return pd.Timestamp(stamp.to_pydatetime().astimezone().replace(tzinfo=None))
+
+
+def parse_as_of(value):
+    """
+    ('day', 'YYYY-MM-DD') for a date or ('time', ISO timestamp) for a timestamp,
+    in the server's local time like recorded_at (timestamps with an offset are
+    converted). Raises ValueError for anything else.
+    """
+    try:
+        stamp = pd.Timestamp(value)
+    except (ValueError, TypeError):
+        stamp = None
+    if stamp is None or pd.isna(stamp):
+        raise ValueError(f"Invalid as_of '{value}'. Use a date (YYYY-MM-DD) or an ISO timestamp.")
+    # Compared against recorded_at, which is naive local time; the day is taken after converting
+    stamp = _local_naive(stamp)
+    if len(str(value)) <= 10:
+        return 'day', stamp.strftime('%Y-%m-%d')
+    return 'time', stamp.isoformat()
+
+
+def _meta(row):
+    recorded_at, as_of, data_end, base, data_version, digest = row
+    return {"recordedAt": recorded_at, "asOf": as_of, "dataEnd": data_end, "baseCurrency": base,
+            "dataVersion": data_version, "configHash": digest}
+
+
+def load(as_of, base=risk.BASE_CURRENCY):
+    """
+    The last `base` snapshot recorded on or before `as_of` (a date covers the
+    whole day): {"meta": {...}, "sections": {name: section}}, or None.
+    """
+    kind, bound = parse_as_of(as_of)
+    column = 'as_of' if kind == 'day' else 'recorded_at'
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT recorded_at, as_of, data_end, base, data_version, config_hash, payload FROM snapshots "
+            f"WHERE base = ? AND {column} <= ? ORDER BY recorded_at DESC, id DESC LIMIT 1",
+            (base, bound)
+        ).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+
+    stored = json.loads(zlib.decompress(row[-1]))
+    sections = stored['sections']
+    for name, keys in stored['tables'].items():
+        for key in keys:
+            sections[name][key] = pd.DataFrame(sections[name][key])
+    return {"meta": _meta(row[:-1]), "sections": sections}
+
+
+def trend(base=risk.BASE_CURRENCY, fields=None, start=None, end=None, every='day'):
+    """
+    Stored vitals over time, one row per snapshot or per day (its last
+    snapshot), with the snapshot's dates, data version and config hash.
+    `fields` defaults to every stored field.
+    """
+    if every not in TREND_EVERY:
+        raise ValueError(f"Unsupported every '{every}'. Use one of: {', '.join(TREND_EVERY)}")
+    clauses, params = ["base = ?"], [base]
+    if start is not None:
+        clauses.append("as_of >= ?")
+        params.append(parse_as_of(start)[1][:10])
+    if end is not None:
+        clauses.append("as_of <= ?")
+        params.append(parse_as_of(end)[1][:10])
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT recorded_at, as_of, data_end, base, data_version, config_hash, vitals FROM snapshots "
+            f"WHERE {' AND '.join(clauses)} ORDER BY recorded_at, id",
+            params
+        ).fetchall()
+    finally:
+        conn.close()
+
+    records = [{**_meta(row[:-1]), **json.loads(row[-1])} for row in rows]
+    frame = pd.DataFrame(records, columns=None if records else ["recordedAt", "asOf"])
+    if every == 'day' and not frame.empty:
+        frame = frame.groupby("asOf", sort=False).tail(1)
+    if fields:
+        unknown = [field for field in fields if field not in frame.columns]
+        if records and unknown:
+            raise ValueError(f"Unknown trend field(s): {', '.join(unknown)}")
+        frame = frame.reindex(columns=["asOf", "recordedAt", "dataVersion", "configHash"] + list(fields))
+    else:
+        frame = frame.drop(columns=["baseCurrency"], errors="ignore")
+    return frame.reset_index(drop=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    show = commands.add_parser("show", help="print the snapshot in effect at a date / timestamp")
+    show.add_argument("as_of")
+    show.add_argument("--base", default=risk.BASE_CURRENCY)
+    history = commands.add_parser("trend", help="print stored vitals over time")
+    history.add_argument("--base", default=risk.BASE_CURRENCY)
+    history.add_argument("--fields", help="comma-separated vitals, e.g. sharpe,annualVol,grossExp")
+    history.add_argument("--start")
+    history.add_argument("--end")
+    history.add_argument("--every", choices=TREND_EVERY, default="day")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "show":
+            snapshot = load(args.as_of, args.base.upper())
+            if snapshot is None:
+                print(f"No {args.base.upper()} snapshot recorded at or before {args.as_of}")
+                return 1
+            print(json.dumps(snapshot["meta"], indent=1))
+            print(json.dumps(serialize.clean(snapshot["sections"]["vitals"]), indent=1))
+            for name, section in snapshot["sections"].items():
+                for key, value in section.items():
+                    if isinstance(value, pd.DataFrame):
+                        print(f"\n{key}:\n{value.to_string(index=False)}")
+        else:
+            fields = args.fields.split(",") if args.fields else None
+            print(trend(args.base.upper(), fields, args.start, args.end, args.every).to_string(index=False))
+    except ValueError as e:
+        parser.error(str(e))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,172 @@
+"""
+Process-wide stage timers and counters.
+
+`stage()` / `timed()` record the wall time of pipeline stages (Yahoo downloads,
+currency normalization, correlation, Monte Carlo, response encoding, ...) into
+latency histograms; `inc()` / `observe()` / `set_gauge()` record everything
+else. `render()` exposes it all in the Prometheus text format for /metrics, so
+p50/p99 per stage can be tracked with histogram_quantile().
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Seconds: from a cached lookup up to a slow Yahoo download
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Bytes: from a small section up to a full-resolution 1000-ticker payload
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'alpha_stage_seconds': ('histogram', 'Wall time of a pipeline stage', LATENCY_BUCKETS),
+    'alpha_http_request_seconds': ('histogram', 'API request latency by route', LATENCY_BUCKETS),
+    'alpha_payload_bytes': ('histogram', 'Encoded response body size', SIZE_BUCKETS),
+    'alpha_cache_requests_total': ('counter', 'Derived-result cache lookups by cache and result (hit/miss)', None),
+    'alpha_fetch_failures_total': ('counter', 'Failed or empty market data downloads', None),
+    'alpha_rows_fetched_total': ('counter', 'Rows returned by market data downloads', None),
+    'alpha_stage_errors_total': ('counter', 'Pipeline stages that raised', None),
+    'alpha_intraday_bars_total': ('counter', 'Intraday bars applied to the book, by feed', None),
+    'alpha_data_version': ('gauge', 'Current data store version', None),
+    'alpha_data_refreshed_timestamp_seconds': ('gauge', 'Unix time of the last successful data refresh', None),
+}
+
+_lock = threading.Lock()
+# name -> {sorted label items: value}; histogram values are [bucket counts..., sum, count]
+_series = {name: {} for name in METRICS}
+# Callbacks hook(stage, wall, cpu) of an active profiling session. CPU time is
+# only measured while one is installed.
+_stage_hooks = []
+
+
+def _labels_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Add `value` to a counter."""
+    key = _labels_key(labels)
+    with _lock:
+        series = _series[name]
+        series[key] = series.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _series[name][_labels_key(labels)] = value
+
+
+def observe(name, value, **labels):
+    """Record one observation in a histogram."""
+    buckets = METRICS[name][2]
+    key = _labels_key(labels)
+    with _lock:
+        series = _series[name]
+        entry = series.get(key)
+        if entry is None:
+            entry = series[key] = [0] * (len(buckets) + 3)  # buckets, +Inf, sum, count
+        entry[bisect.bisect_left(buckets, value)] += 1
+        entry[-2] += value
+        entry[-1] += 1
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as pipeline stage `name`."""
+    hooks = list(_stage_hooks) if _stage_hooks else None
+    cpu_start = time.thread_time() if hooks else None
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        inc('alpha_stage_errors_total', stage=name)
+        raise
+    finally:
+        wall = time.perf_counter() - start
+        observe('alpha_stage_seconds', wall, stage=name)
+        if hooks:
+            cpu = time.thread_time() - cpu_start
+            for hook in hooks:
+                hook(name, wall, cpu)
+
+
+def laps(prefix):
+    """
+    Split timer for the sections of one long function: each `lap(name)` records
+    the time since the previous lap (or since `laps()`) as stage '<prefix>.<name>',
+    without wrapping the sections in `with stage(...)` blocks.
+    """
+    hooks = list(_stage_hooks) if _stage_hooks else None
+    last = [time.perf_counter(), time.thread_time() if hooks else None]
+
+    def lap(name):
+        now = time.perf_counter()
+        wall = now - last[0]
+        observe('alpha_stage_seconds', wall, stage=f"{prefix}.{name}")
+        if hooks:
+            cpu_now = time.thread_time()
+            for hook in hooks:
+                hook(f"{prefix}.{name}", wall, cpu_now - last[1])
+            last[1] = cpu_now
+        last[0] = time.perf_counter()
+    return lap
+
+
+def add_stage_hook(hook):
+    with _lock:
+        _stage_hooks.append(hook)
+
+
+def remove_stage_hook(hook):
+    with _lock:
+        if hook in _stage_hooks:
+            _stage_hooks.remove(hook)
+
+
+def timed(name):
+    """Decorator form of `stage`."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ''
+    escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in items)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value) if value == value else 'NaN'
+    return str(value)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        snapshot = {name: {k: (list(v) if isinstance(v, list) else v) for k, v in series.items()}
+                    for name, series in _series.items()}
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for key, value in sorted(snapshot[name].items()):
+            if kind != 'histogram':
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], value[:-2]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', str(bound))])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(key)} {_format_value(float(value[-2]))}")
+            lines.append(f"{name}_count{_format_labels(key)} {value[-1]}")
+    return '\n'.join(lines) + '\n'
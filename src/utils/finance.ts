@@ -103,9 +103,12 @@ export const fetchDashboardData = async (retries = 5, delay = 1000, force = fals
     for (let i = 0; i < retries; i++) {
         try {
             // Use relative path - Vite proxy will handle forwarding to backend
-            const url = force
-                ? `/api/metrics?t=${new Date().getTime()}`
-                : `/api/metrics`;
+            // Phones get an LTTB-downsampled history (peaks/troughs preserved) instead of every bar
+            const params = new URLSearchParams();
+            if (window.innerWidth < 768) params.set('resolution', 'low');
+            if (force) params.set('t', String(new Date().getTime()));
+            const query = params.toString();
+            const url = query ? `/api/metrics?${query}` : `/api/metrics`;
 
             const response = await fetch(url);
             if (!response.ok) {